@@ -0,0 +1,125 @@
+"""
+Bulk receipt import: analyze every row of a CSV or JSONL text export and
+write results to JSONL or Parquet, resuming from a checkpoint.
+
+Usage:
+    python -m app.cli.bulk_import expenses.csv --output results.jsonl
+    python -m app.cli.bulk_import expenses.jsonl --output results.parquet --concurrency 16
+"""
+import argparse
+import asyncio
+import glob
+import logging
+import os
+import shutil
+import sys
+from typing import List, Optional
+
+from app.core.openai_client import close_client
+from app.services.analyzer import AnalyzerService
+from app.services.bulk_import import (
+    OUTPUT_FORMATS,
+    BulkImporter,
+    Checkpoint,
+    Progress,
+    count_rows,
+    create_writer,
+    detect_format,
+    read_rows,
+)
+from app.services.usage_ledger import current_tenant
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="CSV or JSONL file with one receipt text per row")
+    parser.add_argument("--output", required=True, help="JSONL file or Parquet directory for results")
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, help="Output format (default: from --output extension)")
+    parser.add_argument("--text-field", default="text", help="Column/key holding the receipt text")
+    parser.add_argument("--id-field", default="id", help="Column/key copied to results to identify rows")
+    parser.add_argument("--concurrency", type=int, default=8, help="Rows analyzed concurrently")
+    parser.add_argument("--checkpoint", help="Checkpoint file (default: <output>.checkpoint.json)")
+    parser.add_argument("--checkpoint-every", type=int, default=100, help="Rows between checkpoints")
+    parser.add_argument("--restart", action="store_true", help="Discard the checkpoint and existing output")
+    parser.add_argument("--no-count", action="store_true", help="Skip the row count pass (no ETA)")
+    parser.add_argument("--tenant", default="bulk-import", help="Tenant LLM usage is accounted to")
+    return parser.parse_args(argv)
+
+
+def load_checkpoint(args: argparse.Namespace, checkpoint_path: str) -> Checkpoint:
+    """Load the checkpoint of a previous run over the same input, or start fresh"""
+    if args.restart:
+        for path in (checkpoint_path, args.output, *glob.glob(glob.escape(checkpoint_path) + ".degraded-*")):
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            elif os.path.exists(path):
+                os.remove(path)
+
+    fresh = Checkpoint(input=os.path.abspath(args.input), output=os.path.abspath(args.output), text_field=args.text_field)
+    checkpoint = Checkpoint.load(checkpoint_path)
+    if checkpoint is None:
+        if os.path.exists(args.output):
+            raise SystemExit(f"{args.output} exists without a checkpoint; use --restart to overwrite it")
+        return fresh
+    if (checkpoint.input, checkpoint.output, checkpoint.text_field) != (fresh.input, fresh.output, fresh.text_field):
+        raise SystemExit(
+            f"Checkpoint {checkpoint_path} belongs to another import "
+            f"({checkpoint.input} -> {checkpoint.output}); use --restart or another --checkpoint"
+        )
+    if checkpoint.redo_rows:
+        print(f"Analyzing again {checkpoint.redo_rows:,} rows that got heuristic results", file=sys.stderr)
+    else:
+        print(f"Resuming after {checkpoint.watermark + len(checkpoint.done):,} rows", file=sys.stderr)
+    return checkpoint
+
+
+async def run(args: argparse.Namespace) -> Checkpoint:
+    detect_format(args.input, ("csv", "jsonl"))
+    checkpoint_path = args.checkpoint or args.output.rstrip("/") + ".checkpoint.json"
+    checkpoint = load_checkpoint(args, checkpoint_path)
+
+    writer = create_writer(args.output, args.format)
+    total = None if args.no_count else await asyncio.to_thread(count_rows, args.input)
+    current_tenant.set(args.tenant)
+    analyzer = AnalyzerService()
+    # A backfill waits for the LLM instead of taking heuristic results
+    analyzer.shedder = None
+    analyzer.llm.timeout = None
+    importer = BulkImporter(
+        analyzer,
+        writer,
+        checkpoint_path,
+        checkpoint,
+        concurrency=args.concurrency,
+        checkpoint_every=args.checkpoint_every,
+        progress=Progress(total),
+    )
+    try:
+        return await importer.run(read_rows(args.input, args.text_field, args.id_field or None))
+    finally:
+        writer.close()
+        analyzer.close()
+        close_client()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    # Per-row analysis logs would drown the progress line; failures still show
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s %(name)s: %(message)s")
+    try:
+        checkpoint = asyncio.run(run(args))
+    except KeyboardInterrupt:
+        print("Interrupted; rerun the same command to resume", file=sys.stderr)
+        return 130
+    print(f"Done: {checkpoint.processed:,} rows analyzed, {checkpoint.failed:,} failed", file=sys.stderr)
+    if checkpoint.redo_rows:
+        print(
+            f"{checkpoint.redo_rows:,} rows got a heuristic result without the LLM; "
+            "rerun the same command to analyze them again",
+            file=sys.stderr,
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,76 @@
+"""
+LLM usage report: tokens, retries and cost from the usage ledger, grouped by
+tenant, day, model and/or call kind.
+
+Usage:
+    python -m app.cli.usage_report
+    python -m app.cli.usage_report usage.db --group-by tenant --since 2024-03-01
+    python -m app.cli.usage_report usage.jsonl --group-by day,model --json
+"""
+import argparse
+import json
+import sys
+from typing import Any, Dict, List, Optional
+
+from app.core.config import get_settings
+from app.services.usage_ledger import GROUP_COLUMNS, create_usage_store
+
+REPORT_COLUMNS = (
+    "requests", "prompt_tokens", "cached_tokens", "completion_tokens",
+    "retries", "avg_prompt_tokens", "cost_usd",
+)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Report LLM token usage and cost")
+    parser.add_argument("path", nargs="?", help="Ledger file (default: USAGE_LEDGER_PATH)")
+    parser.add_argument(
+        "--group-by", default="tenant,day,model",
+        help=f"Comma-separated columns from: {', '.join(GROUP_COLUMNS)}",
+    )
+    parser.add_argument("--since", help="First day included (YYYY-MM-DD, UTC)")
+    parser.add_argument("--until", help="Last day included (YYYY-MM-DD, UTC)")
+    parser.add_argument("--json", action="store_true", help="Print rows as JSON instead of a table")
+    return parser.parse_args(argv)
+
+
+def format_table(rows: List[Dict[str, Any]], group_by: List[str]) -> str:
+    columns = list(group_by) + list(REPORT_COLUMNS)
+    cells = [[str(row[column]) for column in columns] for row in rows]
+    widths = [max([len(column)] + [len(line[i]) for line in cells]) for i, column in enumerate(columns)]
+    lines = [
+        "  ".join(column.ljust(width) for column, width in zip(columns, widths)),
+        "  ".join("-" * width for width in widths),
+    ]
+    for line in cells:
+        # Group columns read left to right, numbers right-aligned
+        lines.append("  ".join(
+            cell.ljust(width) if i < len(group_by) else cell.rjust(width)
+            for i, (cell, width) in enumerate(zip(line, widths))
+        ))
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    path = args.path or get_settings().usage_ledger_path
+    if not path:
+        print("No ledger path given and USAGE_LEDGER_PATH is not set", file=sys.stderr)
+        return 2
+
+    group_by = [column.strip() for column in args.group_by.split(",") if column.strip()]
+    store = create_usage_store(path)
+    try:
+        rows = store.aggregate(group_by, args.since, args.until)
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        return 2
+    finally:
+        store.close()
+
+    print(json.dumps(rows, indent=2) if args.json else format_table(rows, group_by))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
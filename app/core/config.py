@@ -0,0 +1,139 @@
+import math
+import os
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, Optional
+
+
+def _env_int(name: str, default: Optional[int] = None) -> Optional[int]:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def _env_float(name: str, default: Optional[float] = None) -> Optional[float]:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+def _env_weights(name: str) -> Dict[str, float]:
+    # Format: "tenant-a=3,tenant-b=0.5"
+    value = os.getenv(name, "")
+    weights = {}
+    for pair in filter(None, (p.strip() for p in value.split(","))):
+        tenant, _, weight = pair.partition("=")
+        value = float(weight)
+        if not (value > 0 and math.isfinite(value)):
+            raise ValueError(f"{name}: weight must be a positive number, got {pair}")
+        weights[tenant.strip()] = value
+    return weights
+
+
+@dataclass(frozen=True)
+class Settings:
+    """Runtime settings read from environment variables"""
+
+    # Shared LLM rate limit; disabled when both limits are unset
+    llm_rate_limit_rpm: Optional[int] = None
+    llm_rate_limit_tpm: Optional[int] = None
+    # "memory" (per process), "sqlite" (per host) or "redis" (cluster-wide)
+    llm_rate_limit_backend: str = "memory"
+    # SQLite file path or Redis URL, depending on the backend
+    llm_rate_limit_url: Optional[str] = None
+    # Maximum time a request may queue for rate-limit budget, in seconds
+    llm_rate_limit_max_wait: float = 30.0
+
+    # Threads running blocking LLM provider calls per worker
+    llm_workers: int = 16
+
+    # LLM usage ledger: SQLite file, or JSONL file when the path ends in
+    # .jsonl; disabled when unset
+    usage_ledger_path: Optional[str] = None
+
+    # LLM micro-batching: max receipts per call (below 2 disables) and how
+    # long the first request of a batch waits for others, in milliseconds
+    llm_batch_max_size: int = 0
+    llm_batch_max_wait_ms: float = 20.0
+
+    # Load shedding: analyses skip the LLM and get a heuristic result when
+    # this many LLM calls are pending per worker (0 disables), after this many
+    # consecutive LLM failures for the cooldown in seconds (0 disables), or
+    # while the p95 LLM latency over the window in seconds exceeds the SLO;
+    # LLM calls taking longer than the timeout in seconds get the heuristic
+    # result too, and the provider request is given the same deadline
+    load_shed_max_pending: int = 0
+    load_shed_breaker_failures: int = 0
+    load_shed_breaker_cooldown: float = 30.0
+    load_shed_latency_slo_ms: Optional[float] = None
+    load_shed_latency_window: float = 30.0
+    load_shed_llm_timeout: Optional[float] = None
+    # JSONL file receiving heuristic results' receipts for re-enrichment
+    enrichment_backlog_path: Optional[str] = None
+
+    # /analyze scheduling: total and per-tenant concurrent analyses
+    scheduler_max_concurrency: int = 16
+    scheduler_tenant_concurrency: int = 4
+    # Weighted fair queuing weights per tenant; unlisted tenants get 1
+    scheduler_tenant_weights: Dict[str, float] = field(default_factory=dict)
+    # Per-tenant metrics of idle tenants are dropped after this many seconds
+    # without requests, and beyond this many tracked tenants
+    scheduler_stats_ttl: float = 600.0
+    scheduler_max_tracked_tenants: int = 10_000
+
+    # Near-duplicate result cache: max entries (0 disables) and max SimHash
+    # Hamming distance between texts treated as the same receipt
+    near_duplicate_cache_size: int = 10_000
+    near_duplicate_max_distance: int = 6
+
+    # Perceptual image hash index: max entries (0, the default, disables) and
+    # max dHash Hamming distance (of 256 bits) between photos of the same receipt
+    image_hash_index_size: int = 0
+    image_hash_max_distance: int = 8
+
+    # Pipelined OCR: number of horizontal bands (below 2 disables), the
+    # minimum height/width ratio of images it is used for, and the number of
+    # band OCR threads per worker (defaults to the CPU count)
+    ocr_pipeline_bands: int = 0
+    ocr_pipeline_min_aspect_ratio: float = 2.0
+    ocr_pipeline_workers: Optional[int] = None
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        return cls(
+            llm_rate_limit_rpm=_env_int("LLM_RATE_LIMIT_RPM"),
+            llm_rate_limit_tpm=_env_int("LLM_RATE_LIMIT_TPM"),
+            llm_rate_limit_backend=os.getenv("LLM_RATE_LIMIT_BACKEND", "memory"),
+            llm_rate_limit_url=os.getenv("LLM_RATE_LIMIT_URL"),
+            llm_rate_limit_max_wait=_env_float("LLM_RATE_LIMIT_MAX_WAIT", 30.0),
+            llm_workers=_env_int("LLM_WORKERS", 16),
+            usage_ledger_path=os.getenv("USAGE_LEDGER_PATH"),
+            llm_batch_max_size=_env_int("LLM_BATCH_MAX_SIZE", 0),
+            llm_batch_max_wait_ms=_env_float("LLM_BATCH_MAX_WAIT_MS", 20.0),
+            load_shed_max_pending=_env_int("LOAD_SHED_MAX_PENDING", 0),
+            load_shed_breaker_failures=_env_int("LOAD_SHED_BREAKER_FAILURES", 0),
+            load_shed_breaker_cooldown=_env_float("LOAD_SHED_BREAKER_COOLDOWN", 30.0),
+            load_shed_latency_slo_ms=_env_float("LOAD_SHED_LATENCY_SLO_MS"),
+            load_shed_latency_window=_env_float("LOAD_SHED_LATENCY_WINDOW", 30.0),
+            load_shed_llm_timeout=_env_float("LOAD_SHED_LLM_TIMEOUT"),
+            enrichment_backlog_path=os.getenv("ENRICHMENT_BACKLOG_PATH"),
+            scheduler_max_concurrency=_env_int("SCHEDULER_MAX_CONCURRENCY", 16),
+            scheduler_tenant_concurrency=_env_int("SCHEDULER_TENANT_CONCURRENCY", 4),
+            scheduler_tenant_weights=_env_weights("SCHEDULER_TENANT_WEIGHTS"),
+            scheduler_stats_ttl=_env_float("SCHEDULER_STATS_TTL", 600.0),
+            scheduler_max_tracked_tenants=_env_int("SCHEDULER_MAX_TRACKED_TENANTS", 10_000),
+            near_duplicate_cache_size=_env_int("NEAR_DUPLICATE_CACHE_SIZE", 10_000),
+            near_duplicate_max_distance=_env_int("NEAR_DUPLICATE_MAX_DISTANCE", 6),
+            image_hash_index_size=_env_int("IMAGE_HASH_INDEX_SIZE", 0),
+            image_hash_max_distance=_env_int("IMAGE_HASH_MAX_DISTANCE", 8),
+            ocr_pipeline_bands=_env_int("OCR_PIPELINE_BANDS", 0),
+            ocr_pipeline_min_aspect_ratio=_env_float("OCR_PIPELINE_MIN_ASPECT_RATIO", 2.0),
+            ocr_pipeline_workers=_env_int("OCR_PIPELINE_WORKERS"),
+        )
+
+
+@lru_cache
+def get_settings() -> Settings:
+    """Return settings loaded once from the environment"""
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    return Settings.from_env()
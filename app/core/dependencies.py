@@ -0,0 +1,65 @@
+import hashlib
+from typing import Optional
+
+from fastapi import Depends, Header, Request
+
+from app.core.config import get_settings
+from app.services.analyzer import AnalyzerService
+from app.services.load_shedder import LoadShedder
+from app.services.scheduler import FairScheduler, create_scheduler
+from app.services.usage_ledger import UsageLedger
+
+# Tenant used for requests that carry no identity
+ANONYMOUS_TENANT = "anonymous"
+
+
+def get_analyzer(request: Request) -> AnalyzerService:
+    """
+    Return the AnalyzerService created in the application lifespan.
+    Falls back to creating one on demand when the lifespan did not run
+    (e.g. ASGI transports in tests); construction is cheap since heavy
+    dependencies are loaded lazily.
+    """
+    analyzer = getattr(request.app.state, "analyzer", None)
+    if analyzer is None:
+        analyzer = AnalyzerService()
+        request.app.state.analyzer = analyzer
+    return analyzer
+
+
+def get_scheduler(request: Request) -> FairScheduler:
+    """Return the FairScheduler created in the application lifespan (or on demand)"""
+    scheduler = getattr(request.app.state, "scheduler", None)
+    if scheduler is None:
+        scheduler = create_scheduler(get_settings())
+        request.app.state.scheduler = scheduler
+    return scheduler
+
+
+def get_usage_ledger(analyzer: AnalyzerService = Depends(get_analyzer)) -> Optional[UsageLedger]:
+    """Return the LLM usage ledger, or None when usage is not recorded"""
+    return analyzer.llm.ledger
+
+
+def get_load_shedder(analyzer: AnalyzerService = Depends(get_analyzer)) -> Optional[LoadShedder]:
+    """Return the load shedder, or None when load shedding is disabled"""
+    return analyzer.shedder
+
+
+def get_tenant(
+    x_tenant_id: Optional[str] = Header(None),
+    x_api_key: Optional[str] = Header(None),
+) -> str:
+    """
+    Resolve the tenant a request is accounted to.
+    An API key, when present, decides the tenant: it is identified by a short
+    fingerprint so raw keys never appear in metrics, and a client cannot pick
+    another tenant's share by sending X-Tenant-ID alongside it. X-Tenant-ID is
+    trusted as sent, so it only applies to keyless requests and must be set
+    by a trusted gateway that strips it from client requests.
+    """
+    if x_api_key:
+        return "key-" + hashlib.sha256(x_api_key.encode()).hexdigest()[:12]
+    if x_tenant_id:
+        return x_tenant_id
+    return ANONYMOUS_TENANT
@@ -1,9 +1,42 @@
 import os
-from openai import OpenAI
-from dotenv import load_dotenv
+import threading
+from typing import TYPE_CHECKING, Optional
 
-load_dotenv()
+if TYPE_CHECKING:
+    from openai import OpenAI
 
-client = OpenAI(
-    api_key=os.getenv("OPENAI_API_KEY")
-)
\ No newline at end of file
+_client: Optional["OpenAI"] = None
+_client_lock = threading.Lock()
+
+
+def create_client() -> "OpenAI":
+    """Build a new OpenAI client. The SDK is imported here, not at module load."""
+    from dotenv import load_dotenv
+    from openai import OpenAI
+
+    load_dotenv()
+    return OpenAI(
+        api_key=os.getenv("OPENAI_API_KEY"),
+        # LLMAnalyzer retries itself, taking rate-limit budget for every
+        # attempt; SDK retries would bypass the shared limiter
+        max_retries=0,
+    )
+
+
+def get_client() -> "OpenAI":
+    """Return the process-wide OpenAI client, creating it on first use."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = create_client()
+    return _client
+
+
+def close_client() -> None:
+    """Close the shared client (and its connection pool) if it was created."""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
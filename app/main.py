@@ -1,6 +1,41 @@
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+from app.core.config import get_settings
+from app.core.openai_client import close_client
 from app.routers.analyze import router as analyze_router
+from app.routers.health import router as health_router
+from app.routers.metrics import router as metrics_router
+from app.services.analyzer import AnalyzerService
+from app.services.scheduler import create_scheduler
+
+logger = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Create services once per worker; warm heavy dependencies in the
+    # background so the server starts accepting connections immediately.
+    analyzer = AnalyzerService()
+    app.state.analyzer = analyzer
+    app.state.scheduler = create_scheduler(get_settings())
+    warm_up = asyncio.create_task(asyncio.to_thread(analyzer.warm_up))
+    try:
+        yield
+    finally:
+        # Warm-up runs in a thread and cannot be interrupted; let it finish
+        # so that the client it may have created is closed below.
+        if not warm_up.done():
+            logger.info("Waiting for warm-up to finish before shutdown")
+        await asyncio.gather(warm_up, return_exceptions=True)
+        analyzer.close()
+        close_client()
+
 
-app = FastAPI(title="Wannatrack AI Receipt Analyzer")
+app = FastAPI(title="Wannatrack AI Receipt Analyzer", lifespan=lifespan)
 
-app.include_router(analyze_router)
\ No newline at end of file
+app.include_router(analyze_router)
+app.include_router(health_router)
+app.include_router(metrics_router)
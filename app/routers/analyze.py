@@ -1,17 +1,23 @@
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException
+from fastapi import APIRouter, Depends, UploadFile, File, Form, Header, HTTPException, Response
 from typing import Optional
 
+from app.core.dependencies import get_analyzer, get_scheduler, get_tenant
 from app.services.analyzer import AnalyzerService
+from app.services.scheduler import PRIORITIES, FairScheduler
+from app.services.usage_ledger import current_tenant
 from app.schemas.receipt import ReceiptResult
 
 router = APIRouter()
-analyzer = AnalyzerService()
 
 
 @router.post("/analyze", response_model=ReceiptResult)
 async def analyze(
     file: Optional[UploadFile] = File(None),
     text: Optional[str] = Form(None),
+    x_priority: str = Header("interactive"),
+    tenant: str = Depends(get_tenant),
+    analyzer: AnalyzerService = Depends(get_analyzer),
+    scheduler: FairScheduler = Depends(get_scheduler),
 ):
     # Validate input: exactly one source must be provided
     if not file and not text:
@@ -20,5 +26,23 @@ async def analyze(
     if file and text:
         raise HTTPException(status_code=400, detail="Provide only one input source")
 
-     # Delegate processing to the service
-    return await analyzer.analyze(file=file, text=text)
\ No newline at end of file
+    if x_priority not in PRIORITIES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"X-Priority must be one of: {', '.join(PRIORITIES)}",
+        )
+
+    # LLM usage of this request is accounted to the tenant
+    current_tenant.set(tenant)
+
+     # Delegate processing to the service once the scheduler admits the request
+    result = await scheduler.run(
+        tenant,
+        x_priority,
+        lambda: analyzer.analyze(file=file, text=text),
+    )
+
+    # The service returns a validated ReceiptResult: serialize it with
+    # pydantic-core directly instead of letting FastAPI validate and encode
+    # it again (response_model still documents the schema)
+    return Response(content=result.model_dump_json(), media_type="application/json")
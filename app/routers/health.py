@@ -0,0 +1,26 @@
+from fastapi import APIRouter, Depends
+from fastapi.responses import JSONResponse
+
+from app.core.dependencies import get_analyzer
+from app.services.analyzer import AnalyzerService
+
+router = APIRouter()
+
+
+@router.get("/health")
+async def health():
+    # Liveness: the process is up and serving requests
+    return {"status": "ok"}
+
+
+@router.get("/ready")
+async def ready(analyzer: AnalyzerService = Depends(get_analyzer)):
+    # Readiness: clients and pools have been warmed up by the lifespan
+    status_code = 200 if analyzer.ready else 503
+    return JSONResponse(
+        status_code=status_code,
+        content={
+            "status": "ready" if analyzer.ready else "warming",
+            "components": analyzer.components,
+        },
+    )
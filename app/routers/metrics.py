@@ -0,0 +1,43 @@
+import asyncio
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+
+from app.core.dependencies import get_load_shedder, get_scheduler, get_usage_ledger
+from app.services.load_shedder import LoadShedder
+from app.services.scheduler import FairScheduler
+from app.services.usage_ledger import UsageLedger
+
+router = APIRouter(prefix="/metrics")
+
+
+@router.get("/scheduler")
+async def scheduler_metrics(scheduler: FairScheduler = Depends(get_scheduler)):
+    # Per-tenant queue depth, concurrency and wait times for tuning weights
+    return scheduler.snapshot()
+
+
+@router.get("/load-shedding")
+async def load_shedding_metrics(shedder: Optional[LoadShedder] = Depends(get_load_shedder)):
+    # Breaker state, pending LLM calls, recent latency and shed counts per reason
+    if shedder is None:
+        raise HTTPException(status_code=404, detail="Load shedding is disabled")
+    return shedder.snapshot()
+
+
+@router.get("/usage")
+async def usage_metrics(
+    group_by: str = "tenant,day,model",
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    ledger: Optional[UsageLedger] = Depends(get_usage_ledger),
+):
+    # LLM tokens and cost per group, for billing and spotting bloated prompts
+    if ledger is None:
+        raise HTTPException(status_code=404, detail="Usage ledger is disabled (set USAGE_LEDGER_PATH)")
+    columns = [column.strip() for column in group_by.split(",") if column.strip()]
+    try:
+        # The ledger's store is on disk: aggregate off the event loop
+        return await asyncio.to_thread(ledger.aggregate, columns, since, until)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
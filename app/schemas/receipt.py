@@ -1,8 +1,11 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 from typing import List, Optional
 
 
 class ReceiptItem(BaseModel):
+    # Immutable so results can share items instead of copying them
+    model_config = ConfigDict(frozen=True)
+
     name: str
     price: float
 
@@ -15,4 +18,8 @@ class ReceiptResult(BaseModel):
     date: Optional[str]
     items: List[ReceiptItem]
     confidence: float
-    language: str
\ No newline at end of file
+    language: str
+    # Set on best-effort results extracted without the LLM (overload or LLM
+    # failure); enrichment_id identifies the receipt in the enrichment backlog
+    needs_enrichment: bool = False
+    enrichment_id: Optional[str] = None
@@ -2,16 +2,21 @@ from pydantic import BaseModel, field_validator
 from typing import List, Optional, Literal
 import re
 
-class ReceiptItemLLM(BaseModel):
-    name: str
-    price: float
+from app.schemas.receipt import ReceiptItem
+
+_CURRENCY_RE = re.compile(r'^[A-Z]{3}$')
+_LANGUAGE_RE = re.compile(r'^[a-z]{2}$')
+
+# Items are validated straight into the response item type, so results
+# reuse them without per-item copies
+ReceiptItemLLM = ReceiptItem
 
 class ReceiptLLMResult(BaseModel):
     merchant: Optional[str]
     total: float
     currency: str  # ISO 4217 currency code (3 uppercase letters) or "UNKNOWN"
     date: Optional[str]
-    items: List[ReceiptItemLLM]
+    items: List[ReceiptItem]
     language: str  # ISO 639-1 language code (2 lowercase letters) or "auto"
     confidence: float
     
@@ -21,7 +26,7 @@ class ReceiptLLMResult(BaseModel):
         """Validate currency is ISO 4217 format (3 uppercase letters) or UNKNOWN"""
         if v == "UNKNOWN":
             return v
-        if not re.match(r'^[A-Z]{3}$', v):
+        if not _CURRENCY_RE.match(v):
             raise ValueError(f"Currency must be ISO 4217 format (3 uppercase letters) or 'UNKNOWN', got: {v}")
         return v
     
@@ -32,6 +37,6 @@ class ReceiptLLMResult(BaseModel):
         v_lower = v.lower()
         if v_lower == "auto":
             return "auto"
-        if not re.match(r'^[a-z]{2}$', v_lower):
+        if not _LANGUAGE_RE.match(v_lower):
             raise ValueError(f"Language must be ISO 639-1 format (2 lowercase letters) or 'auto', got: {v}")
         return v_lower
\ No newline at end of file
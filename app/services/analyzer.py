@@ -1,17 +1,61 @@
+import asyncio
+import hashlib
+import io
 import logging
-from typing import Literal, Optional
+from dataclasses import dataclass
+from typing import Any, Dict, Literal, Optional, Tuple, Union
 from fastapi import UploadFile
 
+from app.core.config import get_settings
+from app.services.image_hash_index import (
+    ImageHashIndex,
+    IndexedImage,
+    create_image_hash_index,
+    dhash,
+    total_band,
+)
 from app.services.llm_analyzer import LLMAnalyzer
+from app.services.llm_batcher import LLMBatcher, create_llm_batcher
+from app.services.load_shedder import (
+    EnrichmentBacklog,
+    LoadShedder,
+    create_enrichment_backlog,
+    create_load_shedder,
+)
+from app.services.near_duplicate_cache import NearDuplicateCache, create_near_duplicate_cache
+from app.services.ocr_pipeline import OCRPipeline, create_ocr_pipeline
 from app.schemas.receipt_llm import ReceiptLLMResult
-from app.schemas.receipt import ReceiptResult, ReceiptItem
+from app.schemas.receipt import ReceiptResult
 from app.services.ocr_service import OCRService
+from app.services.receipt_text import extract_currency, extract_date, extract_total
+from app.services.usage_ledger import current_tenant
 
 logger = logging.getLogger(__name__)
 
 # Minimum text length for analysis
 MIN_TEXT_LENGTH = 5
 
+# Results below this confidence are not reused for near-duplicate receipts
+MIN_CACHE_CONFIDENCE = 0.5
+
+# Confidence of results extracted without the LLM, with and without a total
+HEURISTIC_CONFIDENCE = 0.3
+FALLBACK_CONFIDENCE = 0.1
+
+# Shed reason recorded for results of failed LLM calls
+LLM_ERROR = "llm_error"
+
+
+@dataclass(frozen=True)
+class _Draft:
+    """
+    Outcome of an analysis before it is accepted: a result (fresh from the
+    LLM, or served from the cache) or the reason to fall back to heuristics.
+    """
+    result: Optional[ReceiptResult] = None
+    cached: bool = False
+    fallback: Optional[str] = None
+
 
 class AnalyzerService:
     """
@@ -19,9 +63,55 @@ class AnalyzerService:
     Orchestrates validation, LLM calls, and result normalization.
     """
     
-    def __init__(self):
-        self.llm = LLMAnalyzer()
-        self.ocr = OCRService()
+    def __init__(
+        self,
+        llm: Optional[LLMAnalyzer] = None,
+        ocr: Optional[OCRService] = None,
+        cache: Optional[NearDuplicateCache] = None,
+        image_index: Optional[ImageHashIndex] = None,
+        pipeline: Optional[OCRPipeline] = None,
+        batcher: Optional[LLMBatcher] = None,
+        shedder: Optional[LoadShedder] = None,
+        backlog: Optional[EnrichmentBacklog] = None,
+    ):
+        settings = get_settings()
+        self.llm = llm or LLMAnalyzer()
+        self.ocr = ocr or OCRService()
+        self.cache = cache if cache is not None else create_near_duplicate_cache(settings)
+        self.image_index = image_index if image_index is not None else create_image_hash_index(settings)
+        self.pipeline = pipeline if pipeline is not None else create_ocr_pipeline(settings, self.ocr)
+        self.batcher = batcher if batcher is not None else create_llm_batcher(settings, self.llm)
+        self.shedder = shedder if shedder is not None else create_load_shedder(settings)
+        self.backlog = backlog if backlog is not None else create_enrichment_backlog(settings)
+        # Warm-up state per component: "cold" | "ready" | "error"
+        self.components: Dict[str, str] = {"llm": "cold", "ocr": "cold"}
+    
+    def warm_up(self) -> None:
+        """
+        Eagerly load heavy dependencies and create client pools.
+        Blocking; intended to run in a worker thread during application startup.
+        Failures are recorded per component instead of being raised.
+        """
+        for name, component in (("llm", self.llm), ("ocr", self.ocr)):
+            try:
+                component.warm_up()
+                self.components[name] = "ready"
+            except Exception as e:
+                logger.warning(f"Warm-up failed: component={name}, error={str(e)}")
+                self.components[name] = "error"
+    
+    def close(self) -> None:
+        """Flush usage records and the enrichment backlog, and stop worker threads"""
+        self.llm.close()
+        if self.backlog is not None:
+            self.backlog.close()
+        if self.pipeline is not None:
+            self.pipeline.executor.shutdown(wait=False, cancel_futures=True)
+    
+    @property
+    def ready(self) -> bool:
+        """True once every component has been warmed up successfully"""
+        return all(state == "ready" for state in self.components.values())
     
     async def analyze(self, text: Optional[str] = None, file: Optional[UploadFile] = None) -> ReceiptResult:
         """
@@ -42,12 +132,27 @@ class AnalyzerService:
         processed_text: str
         
         if file:
-            # Process file via OCR
-            file_path = f"/tmp/{file.filename}"
-            with open(file_path, "wb") as f:
-                f.write(await file.read())
+            content = await file.read()
+            image_hash, processed_text = None, None
+            if self.image_index is not None:
+                # Hashing and confirmation OCR are CPU-bound: keep them off the event loop
+                image_hash, processed_text = await asyncio.to_thread(self._lookup_image, file.filename, content)
             
-            processed_text = self.ocr.extract_text(file_path)
+            if processed_text is None and self.pipeline is not None:
+                # Tall receipts: OCR bands in parallel and start the LLM early.
+                # A speculative draft may be discarded, so only the accepted one
+                # is cached or added to the enrichment backlog.
+                outcome = await self.pipeline.run(
+                    content, lambda partial_text: self._draft_analysis(partial_text, "ocr")
+                )
+                if outcome is not None:
+                    analyzed_text, draft = outcome
+                    self._remember_image(image_hash, content, analyzed_text)
+                    return self._accept_draft(analyzed_text, "ocr", draft)
+            
+            if processed_text is None:
+                processed_text = self._ocr_file(file.filename, content)
+                self._remember_image(image_hash, content, processed_text)
             source = "ocr"
         elif text:
             processed_text = text
@@ -58,6 +163,82 @@ class AnalyzerService:
         # Analyze with validated input
         return await self._analyze_receipt(processed_text, source)
     
+    def _lookup_image(self, filename: str, content: bytes) -> Tuple[Optional[int], Optional[str]]:
+        """
+        Look up an uploaded image in the perceptual hash index.
+        A confirmed match returns the OCR text of a previously processed copy
+        of the photo, which then hits the near-duplicate cache for the result.
+        Blocking; called in a worker thread.
+        
+        Args:
+            filename: Original upload filename
+            content: Uploaded file bytes
+            
+        Returns:
+            (image hash or None if not hashable, stored OCR text or None)
+        """
+        try:
+            image_hash = dhash(content)
+        except Exception as e:
+            logger.warning(f"Image hash failed, skipping index: file={filename}, error={str(e)}")
+            return None, None
+        
+        candidate = self.image_index.lookup(image_hash)
+        if candidate is None or not self._confirm_image(filename, content, candidate):
+            return image_hash, None
+        logger.info(f"OCR skipped, image matched index: file={filename}")
+        return image_hash, candidate.text
+    
+    def _confirm_image(self, filename: str, content: bytes, candidate: IndexedImage) -> bool:
+        """
+        Check that an index candidate is a copy of the stored image.
+        Receipts printed from one template hash a few bits apart whatever
+        their amounts, so unless the bytes are identical, the band of the
+        upload where the stored text has its total is OCR'd and must read the
+        same total.
+        """
+        if hashlib.sha256(content).digest() == candidate.digest:
+            return True
+        
+        from PIL import Image
+        
+        try:
+            image = Image.open(io.BytesIO(content))
+            band = total_band(candidate.text, image.height)
+            if band is None:
+                return False
+            band_text = self.ocr.extract_image_text(image.crop((0, band[0], image.width, band[1])))
+        except Exception as e:
+            logger.warning(f"Image match not confirmed, OCR of total band failed: file={filename}, error={str(e)}")
+            return False
+        
+        if extract_total(band_text) != extract_total(candidate.text):
+            logger.info(f"Image matched index with a different total, running OCR: file={filename}")
+            return False
+        return True
+    
+    def _remember_image(self, image_hash: Optional[int], content: bytes, text: str) -> None:
+        """Store OCR text for an image hash so repeat uploads skip OCR"""
+        if image_hash is not None and len(text.strip()) >= MIN_TEXT_LENGTH:
+            self.image_index.add(image_hash, IndexedImage(text, hashlib.sha256(content).digest()))
+    
+    def _ocr_file(self, filename: str, content: bytes) -> str:
+        """
+        Run OCR over an uploaded file.
+        
+        Args:
+            filename: Original upload filename
+            content: Uploaded file bytes
+            
+        Returns:
+            Extracted receipt text
+        """
+        file_path = f"/tmp/{filename}"
+        with open(file_path, "wb") as f:
+            f.write(content)
+        
+        return self.ocr.extract_text(file_path)
+    
     async def _analyze_receipt(self, text: str, source: Literal["text", "ocr"]) -> ReceiptResult:
         """
         Internal method to analyze receipt text with source tracking.
@@ -69,6 +250,23 @@ class AnalyzerService:
         Returns:
             ReceiptResult with analyzed data
         """
+        return self._accept_draft(text, source, await self._draft_analysis(text, source))
+    
+    async def _draft_analysis(self, text: str, source: Literal["text", "ocr"]) -> _Draft:
+        """
+        Analyze receipt text without caching the result or adding to the
+        enrichment backlog, so the outcome can still be discarded.
+        
+        Args:
+            text: Receipt text to analyze
+            source: Source of the text ("text" or "ocr")
+            
+        Returns:
+            _Draft to pass to _accept_draft
+            
+        Raises:
+            ValueError: If the input or the LLM response structure is invalid
+        """
         # Validate input
         self._validate_input(text)
         
@@ -77,6 +275,19 @@ class AnalyzerService:
             f"Starting receipt analysis: source={source}, text_length={len(text)}"
         )
         
+        # Reuse the result of a previously analyzed near-duplicate receipt
+        if self.cache is not None:
+            cached = self.cache.lookup(text)
+            if cached is not None:
+                logger.info(f"Receipt analysis served from cache: source={source}")
+                return _Draft(result=cached, cached=True)
+        
+        # Under overload, answer from the text alone instead of waiting for the LLM
+        reason = self.shedder.check() if self.shedder is not None else None
+        if reason is not None:
+            logger.warning(f"LLM skipped, shedding load: source={source}, reason={reason}")
+            return _Draft(fallback=reason)
+        
         try:
             # Call LLM for analysis
             raw_result = await self._call_llm(text)
@@ -89,7 +300,7 @@ class AnalyzerService:
                 f"confidence={result.confidence}, total={result.total}"
             )
             
-            return result
+            return _Draft(result=result)
             
         except ValueError as e:
             # Re-raise validation errors (critical issues like invalid types)
@@ -102,8 +313,19 @@ class AnalyzerService:
             logger.error(
                 f"Receipt analysis failed: source={source}, error={str(e)}"
             )
-            # Return low-confidence result for non-critical errors
-            return self._create_fallback_result(source)
+            # Fall back to a low-confidence result for non-critical errors
+            return _Draft(fallback=LLM_ERROR)
+    
+    def _accept_draft(self, text: str, source: Literal["text", "ocr"], draft: _Draft) -> ReceiptResult:
+        """
+        Turn the accepted draft for a text into the result: cache a fresh LLM
+        result, or build the heuristic fallback (queued for enrichment).
+        """
+        if draft.fallback is not None:
+            return self._create_fallback_result(text, source, draft.fallback)
+        if not draft.cached and self.cache is not None and draft.result.confidence >= MIN_CACHE_CONFIDENCE:
+            self.cache.add(text, draft.result)
+        return draft.result
     
     def _validate_input(self, text: str) -> None:
         """
@@ -126,28 +348,43 @@ class AnalyzerService:
                 f"Got {len(stripped)} characters."
             )
     
-    async def _call_llm(self, text: str) -> dict:
+    async def _call_llm(self, text: str) -> Union[ReceiptLLMResult, Dict[str, Any]]:
         """
         Call LLM analyzer and return raw result.
+        With micro-batching enabled, the call may be shared with concurrent
+        requests; batched results come back already validated.
         
         Args:
             text: Text to analyze
             
         Returns:
-            Dict with raw LLM response
+            Dict with raw LLM response, or a validated ReceiptLLMResult
             
         Raises:
             Exception: If LLM call fails after retries
         """
+        if self.shedder is None:
+            return await self._send_to_llm(text)
+        with self.shedder.track():
+            return await asyncio.wait_for(self._send_to_llm(text), self.shedder.llm_timeout)
+    
+    async def _send_to_llm(self, text: str) -> Union[ReceiptLLMResult, Dict[str, Any]]:
+        """Send text to the LLM, through the micro-batcher when enabled"""
+        if self.batcher is not None:
+            return await self.batcher.analyze(text)
         return await self.llm.analyze_text(text)
     
-    def _validate_result(self, raw_result: dict, source: Literal["text", "ocr"]) -> ReceiptResult:
+    def _validate_result(
+        self,
+        raw_result: Union[ReceiptLLMResult, Dict[str, Any]],
+        source: Literal["text", "ocr"],
+    ) -> ReceiptResult:
         """
         Validate LLM result and convert to ReceiptResult.
         Applies business rules and normalizes output.
         
         Args:
-            raw_result: Raw dict from LLM
+            raw_result: Raw dict from LLM (or a result validated by the batcher)
             source: Source of the text
             
         Returns:
@@ -159,7 +396,10 @@ class AnalyzerService:
         # Parse through Pydantic schema for type validation
         # Critical validation errors (invalid types) should raise exception
         try:
-            llm_result = ReceiptLLMResult(**raw_result)
+            if isinstance(raw_result, ReceiptLLMResult):
+                llm_result = raw_result
+            else:
+                llm_result = ReceiptLLMResult.model_validate(raw_result)
         except Exception as e:
             logger.error(f"LLM result validation failed (critical error): {str(e)}")
             # Re-raise for critical validation errors (invalid types)
@@ -194,6 +434,9 @@ class AnalyzerService:
     ) -> ReceiptResult:
         """
         Convert LLM result to final ReceiptResult schema.
+        Every field was validated when parsing the LLM result, so the
+        result is constructed without validating again, reusing the
+        (immutable) items.
         
         Args:
             llm_result: Validated LLM result
@@ -203,43 +446,49 @@ class AnalyzerService:
         Returns:
             ReceiptResult ready for API response
         """
-        return ReceiptResult(
+        return ReceiptResult.model_construct(
             type="text",
             merchant=llm_result.merchant,
             total=llm_result.total,
             currency=llm_result.currency,
             date=llm_result.date,
-            items=[
-                ReceiptItem(
-                    name=item.name,
-                    price=item.price,
-                )
-                for item in llm_result.items
-            ],
+            items=llm_result.items,
             confidence=confidence,
             language=llm_result.language,
         )
     
-    def _create_fallback_result(self, source: Literal["text", "ocr"]) -> ReceiptResult:
+    def _create_fallback_result(
+        self, text: str, source: Literal["text", "ocr"], reason: str
+    ) -> ReceiptResult:
         """
-        Create fallback result when analysis fails.
-        Returns low-confidence result instead of raising exception.
+        Create a best-effort result without the LLM, when load is shed or
+        the LLM call failed. Total, currency and date are extracted from the
+        text locally; the result is flagged for re-enrichment and its text
+        added to the enrichment backlog when one is configured.
         
         Args:
+            text: Receipt text
             source: Source of the text
+            reason: Why the LLM was not used (shed reason or "llm_error")
             
         Returns:
-            ReceiptResult with minimal data and low confidence
+            ReceiptResult with heuristic data and low confidence
         """
+        total = extract_total(text)
+        enrichment_id = None
+        if self.backlog is not None:
+            enrichment_id = self.backlog.add(text, source, reason, current_tenant.get())
         return ReceiptResult(
             type="text",
             merchant=None,
-            total=0.0,
-            currency="UNKNOWN",
-            date=None,
+            total=total / 100 if total is not None else 0.0,
+            currency=extract_currency(text) or "UNKNOWN",
+            date=extract_date(text),
             items=[],
-            confidence=0.1,
+            confidence=HEURISTIC_CONFIDENCE if total is not None else FALLBACK_CONFIDENCE,
             language="auto",
+            needs_enrichment=True,
+            enrichment_id=enrichment_id,
         )
     
     async def analyze_text(self, text: str) -> ReceiptResult:
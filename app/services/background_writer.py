@@ -0,0 +1,94 @@
+import logging
+import queue
+import threading
+import time
+from typing import Any, List
+
+logger = logging.getLogger(__name__)
+
+# Queue markers for the writer thread
+_STOP = object()
+
+
+class BackgroundWriter:
+    """
+    Appends records to a store (any object with `append(records)` and
+    `close()`) from a background thread.
+
+    `record` only enqueues, so the request path never waits for disk. A
+    writer thread appends records in batches of up to `batch_size`, at most
+    `flush_interval` seconds after the first record of a batch arrived. When
+    more than `max_pending` records are waiting (the store is stuck), new
+    records are dropped and counted rather than blocking requests.
+    """
+
+    def __init__(
+        self, store, name: str, batch_size: int = 200, flush_interval: float = 1.0, max_pending: int = 10_000
+    ):
+        self.store = store
+        self.name = name
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_pending)
+        self.dropped = 0
+        self.written = 0
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def record(self, records: List[Any]) -> None:
+        """Queue records for writing; never blocks"""
+        for record in records:
+            try:
+                self._queue.put_nowait(record)
+            except queue.Full:
+                self.dropped += 1
+                if self.dropped == 1 or self.dropped % 1000 == 0:
+                    logger.warning(f"Writer queue full, dropping records: writer={self.name}, dropped={self.dropped}")
+
+    def flush(self, timeout: float = 5.0) -> None:
+        """Wait until everything recorded so far is written"""
+        done = threading.Event()
+        self._queue.put(done, timeout=timeout)
+        done.wait(timeout)
+
+    def close(self) -> None:
+        """Write pending records and stop the writer thread"""
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+        self.store.close()
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            batch: List[Any] = []
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                if item is _STOP:
+                    self._write(batch)
+                    return
+                if isinstance(item, threading.Event):
+                    self._write(batch)
+                    batch = []
+                    item.set()
+                else:
+                    batch.append(item)
+                if len(batch) >= self.batch_size:
+                    break
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+            self._write(batch)
+
+    def _write(self, batch: List[Any]) -> None:
+        if not batch:
+            return
+        try:
+            self.store.append(batch)
+            self.written += len(batch)
+        except Exception as e:
+            logger.error(f"Writer append failed, records lost: writer={self.name}, count={len(batch)}, error={str(e)}")
@@ -0,0 +1,469 @@
+import asyncio
+import csv
+import json
+import logging
+import os
+import sys
+import time
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from typing import Any, Deque, Dict, Iterator, List, Optional, Set, TextIO, Tuple
+
+from app.services.analyzer import AnalyzerService
+
+logger = logging.getLogger(__name__)
+
+# (row number, row id, receipt text or None, read error or None)
+Row = Tuple[int, Optional[str], Optional[str], Optional[str]]
+
+# Input formats recognised from the file extension
+INPUT_FORMATS = ("csv", "jsonl")
+OUTPUT_FORMATS = ("jsonl", "parquet")
+
+
+def detect_format(path: str, formats: Tuple[str, ...]) -> str:
+    """Infer a file format from its extension"""
+    extension = os.path.splitext(path)[1].lstrip(".").lower()
+    if extension == "ndjson":
+        extension = "jsonl"
+    if extension not in formats:
+        raise ValueError(f"Cannot infer format of {path}, expected one of: {', '.join(formats)}")
+    return extension
+
+
+def read_rows(path: str, text_field: str = "text", id_field: Optional[str] = "id") -> Iterator[Row]:
+    """
+    Lazily read receipt rows from a CSV or JSONL file.
+    Rows are numbered from 0 in file order; blank JSONL lines are skipped.
+    Unreadable rows are yielded with an error instead of stopping the import.
+    """
+    input_format = detect_format(path, INPUT_FORMATS)
+    with open(path, newline="", encoding="utf-8") as f:
+        if input_format == "csv":
+            for number, record in enumerate(csv.DictReader(f)):
+                yield _row(number, record, text_field, id_field)
+            return
+
+        number = 0
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield number, None, None, f"Invalid JSON: {str(e)}"
+            else:
+                if isinstance(record, dict):
+                    yield _row(number, record, text_field, id_field)
+                else:
+                    yield number, None, None, "Row is not a JSON object"
+            number += 1
+
+
+def _row(number: int, record: Dict[str, Any], text_field: str, id_field: Optional[str]) -> Row:
+    row_id = record.get(id_field) if id_field else None
+    row_id = None if row_id is None else str(row_id)
+    text = record.get(text_field)
+    if text is None:
+        return number, row_id, None, f"Missing field: {text_field}"
+    return number, row_id, str(text), None
+
+
+def count_rows(path: str) -> int:
+    """
+    Estimate the number of rows by counting newlines in binary chunks.
+    Approximate for CSV fields spanning several lines; only used for ETA.
+    """
+    count = 0
+    last = b"\n"
+    with open(path, "rb") as f:
+        while chunk := f.read(1 << 20):
+            count += chunk.count(b"\n")
+            last = chunk[-1:]
+    if last != b"\n":
+        count += 1
+    if detect_format(path, INPUT_FORMATS) == "csv":
+        count -= 1
+    return max(0, count)
+
+
+class JSONLResultWriter:
+    """
+    Appends result records to a JSONL file.
+    `commit` makes everything written so far durable and returns the file
+    size; `restore` truncates records written after the last commit.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8")
+
+    def write(self, record: Dict[str, Any]) -> None:
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def commit(self) -> Dict[str, Any]:
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        return {"offset": self._file.tell()}
+
+    def restore(self, state: Dict[str, Any]) -> None:
+        self._file.flush()
+        self._file.truncate(state.get("offset", 0))
+        self._file.seek(0, os.SEEK_END)
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class ParquetResultWriter:
+    """
+    Writes result records as a directory of Parquet part files.
+    Records are buffered until `commit`, which writes them as one new part,
+    so memory is bounded by the checkpoint interval. Requires `pyarrow`.
+    """
+
+    def __init__(self, path: str):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise RuntimeError("Parquet output requires pyarrow: pip install pyarrow") from e
+
+        self._pa, self._pq = pa, pq
+        self.schema = pa.schema([
+            ("row", pa.int64()),
+            ("id", pa.string()),
+            ("status", pa.string()),
+            ("error", pa.string()),
+            ("merchant", pa.string()),
+            ("total", pa.float64()),
+            ("currency", pa.string()),
+            ("date", pa.string()),
+            ("items", pa.list_(pa.struct([("name", pa.string()), ("price", pa.float64())]))),
+            ("confidence", pa.float64()),
+            ("language", pa.string()),
+            ("needs_enrichment", pa.bool_()),
+            ("enrichment_id", pa.string()),
+        ])
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._parts = len(self._part_files())
+        self._buffer: List[Dict[str, Any]] = []
+
+    def _part_files(self) -> List[str]:
+        return sorted(name for name in os.listdir(self.path) if name.startswith("part-"))
+
+    def write(self, record: Dict[str, Any]) -> None:
+        flat = {key: record[key] for key in ("row", "id", "status", "error")}
+        flat.update(record["result"] or {})
+        self._buffer.append(flat)
+
+    def commit(self) -> Dict[str, Any]:
+        if self._buffer:
+            table = self._pa.Table.from_pylist(self._buffer, schema=self.schema)
+            final_path = os.path.join(self.path, f"part-{self._parts:06d}.parquet")
+            self._pq.write_table(table, final_path + ".tmp")
+            os.replace(final_path + ".tmp", final_path)
+            self._parts += 1
+            self._buffer.clear()
+        return {"parts": self._parts}
+
+    def restore(self, state: Dict[str, Any]) -> None:
+        self._buffer.clear()
+        self._parts = state.get("parts", 0)
+        for name in os.listdir(self.path):
+            if name.endswith(".tmp") or (name.startswith("part-") and int(name[5:11]) >= self._parts):
+                os.remove(os.path.join(self.path, name))
+
+    def close(self) -> None:
+        self._buffer.clear()
+
+
+def create_writer(path: str, output_format: Optional[str] = None):
+    """Open a result writer for the output format (inferred from the path by default)"""
+    output_format = output_format or detect_format(path, OUTPUT_FORMATS)
+    if output_format == "jsonl":
+        return JSONLResultWriter(path)
+    if output_format == "parquet":
+        return ParquetResultWriter(path)
+    raise ValueError(f"Unknown output format: {output_format}")
+
+
+@dataclass
+class Checkpoint:
+    """
+    Resumable import progress. Every row below `watermark` is done, plus the
+    rows listed in `done`; rows finish out of order, so `done` holds at most
+    the number of rows in flight.
+
+    Rows that got a heuristic result without the LLM are listed in `degraded`
+    until the watermark passes them, then appended in row order to the
+    degraded file of the pass (`degraded_file` holds its writer state). Once
+    a pass over the input ends with degraded rows, the next pass
+    (`pass_number`) analyzes again only the `redo_rows` rows in that file.
+    """
+
+    input: str
+    output: str
+    text_field: str
+    watermark: int = 0
+    done: List[int] = field(default_factory=list)
+    writer: Dict[str, Any] = field(default_factory=dict)
+    processed: int = 0
+    failed: int = 0
+    degraded: List[int] = field(default_factory=list)
+    degraded_rows: int = 0
+    degraded_file: Dict[str, Any] = field(default_factory=dict)
+    pass_number: int = 0
+    redo_rows: int = 0
+
+    @classmethod
+    def load(cls, path: str) -> Optional["Checkpoint"]:
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding="utf-8") as f:
+            return cls(**json.load(f))
+
+    def save(self, path: str) -> None:
+        # Write to a temporary file and rename, so a crash never leaves a torn checkpoint
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(asdict(self), f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+
+class Progress:
+    """Live throughput and ETA line on a terminal stream"""
+
+    def __init__(self, total: Optional[int], stream: TextIO = sys.stderr, interval: float = 1.0, window: float = 30.0):
+        self.total = total
+        self.stream = stream
+        self.interval = interval
+        self.window = window
+        self._samples: Deque[Tuple[float, int]] = deque()
+        self._last_report = 0.0
+
+    def update(self, done: int, processed: int, failed: int, force: bool = False) -> None:
+        """
+        Args:
+            done: Rows finished overall, including earlier runs
+            processed: Rows analyzed in this run (drives the throughput)
+            failed: Rows that could not be analyzed
+            force: Report even if the interval has not elapsed
+        """
+        now = time.monotonic()
+        if not force and now - self._last_report < self.interval:
+            return
+        self._last_report = now
+
+        # Throughput over a sliding window so the ETA follows the current rate
+        self._samples.append((now, processed))
+        while len(self._samples) > 2 and now - self._samples[0][0] > self.window:
+            self._samples.popleft()
+        start_time, start_count = self._samples[0]
+        rate = (processed - start_count) / (now - start_time) if now > start_time else 0.0
+
+        line = f"{done:,}"
+        if self.total:
+            line += f"/~{self.total:,} rows ({min(100.0, done * 100 / self.total):.1f}%)"
+        else:
+            line += " rows"
+        line += f" | {rate:.1f} rows/s | failed {failed:,}"
+        if self.total and rate > 0:
+            line += f" | ETA {_format_duration(max(0, self.total - done) / rate)}"
+        self.stream.write("\r" + line.ljust(79))
+        self.stream.flush()
+
+    def finish(self) -> None:
+        self.stream.write("\n")
+        self.stream.flush()
+
+
+def _format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}h {minutes:02d}m"
+    return f"{minutes}m {seconds:02d}s"
+
+
+class BulkImporter:
+    """
+    Streams receipt rows through `AnalyzerService._analyze_receipt`.
+
+    A reader feeds a bounded queue consumed by `concurrency` workers, so
+    memory stays constant whatever the input size. Results are written as
+    they complete; every `checkpoint_every` rows the writer is committed and
+    a checkpoint saved, and a rerun skips the rows it lists. Records written
+    after the last checkpoint are discarded on resume and redone.
+
+    Rows answered with a heuristic result (LLM failed) are written with status
+    "degraded" and listed, in row order, in a degraded file next to the
+    checkpoint. A rerun after a complete pass reads that file alongside the
+    input and analyzes only those rows again, appending a new record for
+    each; the last record of a row is the current one.
+    """
+
+    def __init__(
+        self,
+        analyzer: AnalyzerService,
+        writer,
+        checkpoint_path: str,
+        checkpoint: Checkpoint,
+        concurrency: int = 8,
+        checkpoint_every: int = 100,
+        progress: Optional[Progress] = None,
+    ):
+        self.analyzer = analyzer
+        self.writer = writer
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint = checkpoint
+        self.concurrency = concurrency
+        self.checkpoint_every = checkpoint_every
+        self.progress = progress
+
+        self._done: Set[int] = set(checkpoint.done)
+        self._degraded: Set[int] = set(checkpoint.degraded)
+        self._degraded_writer: Optional[JSONLResultWriter] = None
+        self._since_checkpoint = 0
+        # Rows analyzed in this run; totals across runs are kept in the checkpoint
+        self.processed = 0
+
+    def is_done(self, row: int) -> bool:
+        return row < self.checkpoint.watermark or row in self._done
+
+    def degraded_path(self, pass_number: int) -> str:
+        """File listing the rows left degraded by a pass"""
+        return f"{self.checkpoint_path}.degraded-{pass_number}.jsonl"
+
+    async def run(self, rows: Iterator[Row]) -> Checkpoint:
+        """Process every row not yet done; returns the final checkpoint"""
+        self.writer.restore(self.checkpoint.writer)
+        self._degraded_writer = JSONLResultWriter(self.degraded_path(self.checkpoint.pass_number))
+        self._degraded_writer.restore(self.checkpoint.degraded_file)
+        queue: "asyncio.Queue[Optional[Row]]" = asyncio.Queue(maxsize=self.concurrency * 2)
+        tasks = [asyncio.create_task(self._worker(queue)) for _ in range(self.concurrency)]
+        tasks.append(asyncio.create_task(self._read(rows, queue)))
+
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            # On failure, stop the reader too: it may be blocked on a full queue
+            for task in tasks:
+                task.cancel()
+            self._save_checkpoint()
+            self._degraded_writer.close()
+            if self.progress is not None:
+                self._report(force=True)
+                self.progress.finish()
+        self._end_pass()
+        return self.checkpoint
+
+    def _end_pass(self) -> None:
+        """After a complete pass, set up a pass over its degraded rows and drop finished files"""
+        checkpoint = self.checkpoint
+        stale = [self.degraded_path(checkpoint.pass_number - 1)]
+        if checkpoint.degraded_rows:
+            checkpoint.pass_number += 1
+            checkpoint.redo_rows = checkpoint.degraded_rows
+            checkpoint.watermark = 0
+            checkpoint.degraded_rows = 0
+            checkpoint.degraded_file = {}
+        else:
+            checkpoint.redo_rows = 0
+            stale.append(self.degraded_path(checkpoint.pass_number))
+        checkpoint.save(self.checkpoint_path)
+        for path in stale:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _redo_rows(self) -> Iterator[int]:
+        """Rows left degraded by the previous pass, in row order"""
+        with open(self.degraded_path(self.checkpoint.pass_number - 1), encoding="utf-8") as f:
+            for line in f:
+                yield json.loads(line)["row"]
+
+    async def _read(self, rows: Iterator[Row], queue: "asyncio.Queue[Optional[Row]]") -> None:
+        # A redo pass walks the sorted degraded file in step with the input
+        redo = self._redo_rows() if self.checkpoint.redo_rows else None
+        next_redo = next(redo, None) if redo is not None else None
+        for row in rows:
+            if redo is not None:
+                while next_redo is not None and next_redo < row[0]:
+                    next_redo = next(redo, None)
+                if next_redo != row[0]:
+                    self._mark_done(row[0])
+                    continue
+            if self.is_done(row[0]):
+                self._mark_done(row[0])
+                continue
+            await queue.put(row)
+        for _ in range(self.concurrency):
+            await queue.put(None)
+
+    async def _worker(self, queue: "asyncio.Queue[Optional[Row]]") -> None:
+        while (row := await queue.get()) is not None:
+            number, row_id, text, error = row
+            result = None
+            if error is None:
+                try:
+                    result = (await self.analyzer._analyze_receipt(text, "text")).model_dump()
+                except Exception as e:
+                    error = str(e)
+
+            if error is not None:
+                logger.warning(f"Bulk import row failed: row={number}, id={row_id}, error={error}")
+                self.checkpoint.failed += 1
+                status = "error"
+            elif result["needs_enrichment"]:
+                # Heuristic result of a failed LLM call: kept, and redone by the next pass
+                self._degraded.add(number)
+                status = "degraded"
+            else:
+                status = "ok"
+            self.writer.write({
+                "row": number,
+                "id": row_id,
+                "status": status,
+                "result": result,
+                "error": error,
+            })
+            self.processed += 1
+            self.checkpoint.processed += 1
+            self._mark_done(number)
+            self._since_checkpoint += 1
+            if self._since_checkpoint >= self.checkpoint_every:
+                self._save_checkpoint()
+            self._report()
+
+    def _mark_done(self, row: int) -> None:
+        if row < self.checkpoint.watermark:
+            return
+        self._done.add(row)
+        watermark = self.checkpoint.watermark
+        while watermark in self._done:
+            self._done.remove(watermark)
+            if watermark in self._degraded:
+                # Rows pass the watermark in order, so the degraded file stays sorted
+                self._degraded.remove(watermark)
+                self._degraded_writer.write({"row": watermark})
+                self.checkpoint.degraded_rows += 1
+            watermark += 1
+        self.checkpoint.watermark = watermark
+
+    def _save_checkpoint(self) -> None:
+        # Commit results before recording them as done, so a crash between the
+        # two redoes rows instead of losing them
+        self.checkpoint.writer = self.writer.commit()
+        self.checkpoint.degraded_file = self._degraded_writer.commit()
+        self.checkpoint.done = sorted(self._done)
+        self.checkpoint.degraded = sorted(self._degraded)
+        self.checkpoint.save(self.checkpoint_path)
+        self._since_checkpoint = 0
+
+    def _report(self, force: bool = False) -> None:
+        if self.progress is not None:
+            done = self.checkpoint.watermark + len(self._done)
+            self.progress.update(done, self.processed, self.checkpoint.failed, force)
@@ -0,0 +1,185 @@
+import io
+import logging
+import threading
+from array import array
+from dataclasses import dataclass
+from typing import Any, List, Optional, Tuple
+
+from app.core.config import Settings
+from app.services.receipt_text import total_line_index
+
+logger = logging.getLogger(__name__)
+
+# dHash grid size: HASH_SIZE x HASH_SIZE gradient bits (256 bits). Receipts
+# look alike at coarse resolution (white paper, dark text), so a finer grid
+# than the usual 8x8 is needed to tell different receipts apart.
+HASH_SIZE = 16
+HASH_BITS = HASH_SIZE * HASH_SIZE
+HASH_BYTES = HASH_BITS // 8
+
+# Half-height of the band OCR'd to confirm a match: a share of the image
+# height, and at least this many text lines on short receipts
+TOTAL_BAND_MARGIN = 0.08
+TOTAL_BAND_LINES = 2
+
+
+def dhash(data: bytes, size: int = HASH_SIZE) -> int:
+    """
+    Difference hash of an image: each bit tells whether a pixel is darker than
+    its right neighbour on a (size + 1) x size grayscale thumbnail.
+    JPEGs are decoded at reduced scale, so this takes a few milliseconds even
+    for full-resolution photos.
+
+    Raises:
+        PIL.UnidentifiedImageError: If the data is not a readable image
+    """
+    from PIL import Image
+
+    with Image.open(io.BytesIO(data)) as image:
+        image.draft("L", ((size + 1) * 8, size * 8))
+        pixels = image.convert("L").resize((size + 1, size), Image.Resampling.BILINEAR).tobytes()
+
+    bits = 0
+    for row in range(size):
+        offset = row * (size + 1)
+        for col in range(offset, offset + size):
+            bits = (bits << 1) | (pixels[col] < pixels[col + 1])
+    return bits
+
+
+@dataclass(frozen=True)
+class IndexedImage:
+    """OCR text of an indexed upload and the SHA-256 digest of its bytes"""
+    text: str
+    digest: bytes
+
+
+def total_band(text: str, height: int) -> Optional[Tuple[int, int]]:
+    """
+    Pixel rows (top, bottom) of an image expected to hold the total line of
+    its OCR text, assuming text lines are spread evenly down the image.
+    Returns None when the text has no amount to confirm.
+    """
+    index = total_line_index(text)
+    if index is None:
+        return None
+    count = len(text.splitlines())
+    center = (index + 0.5) / count
+    margin = max(TOTAL_BAND_MARGIN, TOTAL_BAND_LINES / count)
+    top = max(0, int((center - margin) * height))
+    bottom = min(height, int((center + margin) * height) + 1)
+    return top, bottom
+
+
+class ImageHashIndex:
+    """
+    Fixed-capacity index of image hashes to stored values (IndexedImage).
+
+    A match is a candidate only: receipts printed from one template hash a
+    few bits apart whatever their amounts, so callers confirm it (see
+    AnalyzerService) before reusing the stored value.
+
+    Hashes are kept in one preallocated bytearray used as a ring buffer, so the
+    oldest entry is overwritten once the index is full. Lookup uses
+    multi-index hashing: the hash is split into `max_distance + 1` bands, and
+    any hash within `max_distance` bits of the query matches it exactly in at
+    least one band. Each band is a chained hash table held in two int arrays
+    (bucket heads and per-slot next pointers), so the whole index costs about
+    `32 + 8 * bands` bytes per entry plus the stored values.
+    """
+
+    def __init__(self, max_entries: int = 100_000, max_distance: int = 8, bits: int = HASH_BITS):
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.bits = bits
+        self.hash_bytes = bits // 8
+        self.band_count = max_distance + 1
+        self.band_width = bits // self.band_count
+        self._band_mask = (1 << self.band_width) - 1
+        self._bucket_mask = (1 << max(0, max_entries - 1).bit_length()) - 1
+
+        self._hashes = bytearray(max_entries * self.hash_bytes)
+        self._values: List[Optional[Any]] = [None] * max_entries
+        self._heads = [array("i", [-1]) * (self._bucket_mask + 1) for _ in range(self.band_count)]
+        self._nexts = [array("i", [-1]) * max_entries for _ in range(self.band_count)]
+        self._next = 0
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _buckets(self, image_hash: int) -> List[int]:
+        return [
+            (image_hash >> (band * self.band_width)) & self._band_mask & self._bucket_mask
+            for band in range(self.band_count)
+        ]
+
+    def _hash_at(self, slot: int) -> int:
+        start = slot * self.hash_bytes
+        return int.from_bytes(self._hashes[start:start + self.hash_bytes], "big")
+
+    def lookup(self, image_hash: int) -> Optional[Any]:
+        """Return the value stored for the closest hash within `max_distance`, if any"""
+        with self._lock:
+            best_slot, best_distance = None, self.max_distance + 1
+            for band, bucket in enumerate(self._buckets(image_hash)):
+                nexts = self._nexts[band]
+                slot = self._heads[band][bucket]
+                while slot >= 0:
+                    distance = bin(self._hash_at(slot) ^ image_hash).count("1")
+                    if distance < best_distance:
+                        best_slot, best_distance = slot, distance
+                    slot = nexts[slot]
+
+            if best_slot is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            logger.info(f"Image hash index candidate: distance={best_distance}")
+            return self._values[best_slot]
+
+    def add(self, image_hash: int, value: Any) -> None:
+        """Store a value for an image hash, overwriting the oldest entry when full"""
+        if self.max_entries <= 0:
+            return
+
+        with self._lock:
+            slot = self._next
+            self._next = (slot + 1) % self.max_entries
+            if self._values[slot] is not None:
+                self._unlink(slot)
+            else:
+                self._size += 1
+
+            start = slot * self.hash_bytes
+            self._hashes[start:start + self.hash_bytes] = image_hash.to_bytes(self.hash_bytes, "big")
+            self._values[slot] = value
+            for band, bucket in enumerate(self._buckets(image_hash)):
+                heads = self._heads[band]
+                self._nexts[band][slot] = heads[bucket]
+                heads[bucket] = slot
+
+    def _unlink(self, slot: int) -> None:
+        for band, bucket in enumerate(self._buckets(self._hash_at(slot))):
+            heads, nexts = self._heads[band], self._nexts[band]
+            if heads[bucket] == slot:
+                heads[bucket] = nexts[slot]
+                continue
+            previous = heads[bucket]
+            while nexts[previous] != slot:
+                previous = nexts[previous]
+            nexts[previous] = nexts[slot]
+
+
+def create_image_hash_index(settings: Settings) -> Optional[ImageHashIndex]:
+    """Build the image hash index configured in settings, or None when disabled"""
+    if settings.image_hash_index_size <= 0:
+        return None
+    return ImageHashIndex(
+        max_entries=settings.image_hash_index_size,
+        max_distance=settings.image_hash_max_distance,
+    )
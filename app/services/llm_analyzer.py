@@ -1,53 +1,280 @@
+import asyncio
+import functools
 import json
 import logging
-from typing import Dict, Any
-from app.core.openai_client import client
-from app.services.prompts import RECEIPT_ANALYSIS_PROMPT
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from pydantic_core import from_json
+
+from app.core.config import get_settings
+from app.core.openai_client import get_client
+from app.services.prompts import BATCH_RECEIPT_ANALYSIS_PROMPT, RECEIPT_ANALYSIS_PROMPT
+from app.services.rate_limiter import TokenBucketRateLimiter, create_rate_limiter, estimate_tokens
+from app.services.usage_ledger import UsageLedger, create_usage_ledger, current_tenant, split_usage
 
 logger = logging.getLogger(__name__)
 
 
+def _token_count(value: Any) -> int:
+    return value if isinstance(value, int) else 0
+
+
+class _CallUsage:
+    """
+    Attempts and tokens of one LLM call, updated by the worker threads
+    making its provider requests.
+
+    A provider request keeps running (and is billed) when the awaiting task
+    is cancelled, so usage is reported once the call is closed and no request
+    is still running. Requests finishing after that are reported on their own.
+    """
+
+    def __init__(self, report: Optional[Callable[[int, int, int, int], None]]):
+        self._report = report
+        self._lock = threading.Lock()
+        self._running = 0
+        self._closed = False
+        self._reported = False
+        self.attempts = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.completion_tokens = 0
+
+    def started(self) -> None:
+        """Count a provider request about to be sent"""
+        with self._lock:
+            self.attempts += 1
+            self._running += 1
+
+    def finished(self, response: Any) -> None:
+        """Add the tokens of a finished request (None when it failed)"""
+        with self._lock:
+            self._running -= 1
+            if response is not None:
+                usage = getattr(response, "usage", None)
+                details = getattr(usage, "prompt_tokens_details", None)
+                self.prompt_tokens += _token_count(getattr(usage, "prompt_tokens", 0))
+                self.cached_tokens += _token_count(getattr(details, "cached_tokens", 0))
+                self.completion_tokens += _token_count(getattr(usage, "completion_tokens", 0))
+            snapshot = self._take() if self._closed else None
+        self._send(snapshot)
+
+    def close(self) -> None:
+        """Mark the call as over on the caller's side"""
+        with self._lock:
+            self._closed = True
+            snapshot = self._take()
+        self._send(snapshot)
+
+    def _take(self) -> Optional[Tuple[int, int, int, int]]:
+        # Caller holds the lock
+        if self._running or not self.attempts:
+            return None
+        # The first report counts the initial request; later ones are all retries
+        snapshot = (
+            self.attempts - (0 if self._reported else 1),
+            self.prompt_tokens, self.cached_tokens, self.completion_tokens,
+        )
+        self._reported = True
+        self.attempts = self.prompt_tokens = self.cached_tokens = self.completion_tokens = 0
+        return snapshot
+
+    def _send(self, snapshot: Optional[Tuple[int, int, int, int]]) -> None:
+        if snapshot is not None and self._report is not None:
+            self._report(*snapshot)
+
+
 class LLMAnalyzer:
     """Service for analyzing receipt text using OpenAI LLM with retry logic"""
     
     MAX_RETRIES = 2
+    MODEL = "gpt-4o-mini"
+    # Completion budget assumed when estimating tokens for rate limiting
+    COMPLETION_TOKENS_ESTIMATE = 500
+    
+    def __init__(
+        self,
+        client: Optional[Any] = None,
+        rate_limiter: Optional[TokenBucketRateLimiter] = None,
+        ledger: Optional[UsageLedger] = None,
+        timeout: Optional[float] = None,
+        workers: Optional[int] = None,
+    ):
+        settings = get_settings()
+        # The shared client is resolved on first use so that importing
+        # or constructing the analyzer does not load the OpenAI SDK.
+        self._client = client
+        self.rate_limiter = rate_limiter or create_rate_limiter(settings)
+        self.ledger = ledger or create_usage_ledger(settings)
+        # Deadline in seconds for one analysis over all attempts (None: no
+        # deadline). It is given to the provider request itself, as a thread
+        # stuck in the synchronous client cannot be cancelled.
+        self.timeout = timeout if timeout is not None else settings.load_shed_llm_timeout
+        # Provider calls block a thread for their whole duration; a pool of
+        # their own keeps slow calls from starving the default executor
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers or settings.llm_workers, thread_name_prefix="llm-call"
+        )
+    
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = get_client()
+        return self._client
     
-    async def analyze_text(self, text: str) -> Dict[str, Any]:
+    def warm_up(self) -> None:
+        """Create the OpenAI client (and its HTTP connection pool) ahead of the first request"""
+        self.client
+    
+    def close(self) -> None:
+        """Write pending usage records and stop the provider call threads"""
+        if self.ledger is not None:
+            self.ledger.close()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+    
+    async def analyze_text(self, text: str, tenant: Optional[str] = None) -> Dict[str, Any]:
         """
         Analyze receipt text using OpenAI LLM with retry logic.
         
         Args:
             text: Receipt text to analyze
+            tenant: Tenant the usage is accounted to (default: the current request's)
             
         Returns:
             Dict with parsed JSON response from LLM
             
         Raises:
             ValueError: If LLM returns invalid JSON after all retries
+            RateLimitExceeded: If rate-limit budget is not available in time
+            Exception: If OpenAI API call fails after all retries
+        """
+        return await self._complete(
+            RECEIPT_ANALYSIS_PROMPT, text, [text], [tenant],
+            completion_tokens=self.COMPLETION_TOKENS_ESTIMATE,
+        )
+    
+    async def analyze_batch(
+        self, texts: List[str], tenants: Optional[Sequence[Optional[str]]] = None
+    ) -> List[Any]:
+        """
+        Analyze several receipts in one LLM call.
+        
+        Args:
+            texts: Receipt texts to analyze
+            tenants: Tenant of each receipt for usage accounting (default: the current request's)
+            
+        Returns:
+            One raw result per receipt, in input order. An entry is None when
+            the response has no result for that receipt.
+            
+        Raises:
+            ValueError: If the response is not a list of receipts after all retries
+            RateLimitExceeded: If rate-limit budget is not available in time
             Exception: If OpenAI API call fails after all retries
         """
+        # A JSON array keeps every receipt's text inside its own string value,
+        # so receipt text cannot fake the boundary or index of another receipt
+        content = json.dumps(
+            [{"index": i, "text": text} for i, text in enumerate(texts)], ensure_ascii=False
+        )
+        parsed = await self._complete(
+            BATCH_RECEIPT_ANALYSIS_PROMPT,
+            content,
+            texts,
+            tenants or [None] * len(texts),
+            completion_tokens=self.COMPLETION_TOKENS_ESTIMATE * len(texts),
+        )
+        
+        receipts = parsed.get("receipts") if isinstance(parsed, dict) else None
+        if not isinstance(receipts, list):
+            raise ValueError("LLM batch response has no receipts list")
+        
+        # Match results by their index when the model returned one, else by position
+        results: List[Any] = [None] * len(texts)
+        for position, receipt in enumerate(receipts):
+            index = receipt.pop("index", position) if isinstance(receipt, dict) else position
+            if isinstance(index, int) and 0 <= index < len(texts) and results[index] is None:
+                results[index] = receipt
+        return results
+    
+    async def _complete(
+        self,
+        system_prompt: str,
+        user_content: str,
+        texts: Sequence[str],
+        tenants: Sequence[Optional[str]],
+        completion_tokens: int,
+    ) -> Any:
+        """
+        Call the LLM, retrying failed calls and invalid JSON, and return the
+        parsed JSON. Every attempt that reached the provider, and the tokens
+        reported for it, is recorded in the usage ledger for the receipts in
+        `texts`, even when every attempt failed.
+        """
+        default_tenant = current_tenant.get()
+        
+        def report(retries: int, prompt_tokens: int, cached_tokens: int, completion_tokens: int) -> None:
+            # May run in a worker thread: the ledger only queues records
+            self.ledger.record(split_usage(
+                [tenant or default_tenant for tenant in tenants],
+                texts,
+                model=self.MODEL,
+                kind="batch" if len(texts) > 1 else "single",
+                prompt_tokens=prompt_tokens,
+                cached_tokens=cached_tokens,
+                completion_tokens=completion_tokens,
+                retries=retries,
+            ))
+        
+        usage = _CallUsage(report if self.ledger is not None else None)
+        deadline = time.monotonic() + self.timeout if self.timeout else None
+        try:
+            return await self._attempt(system_prompt, user_content, completion_tokens, usage, deadline)
+        finally:
+            usage.close()
+    
+    async def _attempt(
+        self,
+        system_prompt: str,
+        user_content: str,
+        completion_tokens: int,
+        usage: _CallUsage,
+        deadline: Optional[float],
+    ) -> Any:
         last_error = None
+        estimated_tokens = estimate_tokens(
+            system_prompt, user_content, completion_tokens=completion_tokens
+        )
         
         for attempt in range(self.MAX_RETRIES + 1):
+            # Every attempt, including retries, counts against the shared budget
+            if self.rate_limiter:
+                await self.rate_limiter.acquire(tokens=estimated_tokens)
+            
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError(f"LLM deadline of {self.timeout}s passed after {attempt} attempts")
+            
             try:
-                response = client.chat.completions.create(
-                    model="gpt-4o-mini",
-                    messages=[
-                        {"role": "system", "content": RECEIPT_ANALYSIS_PROMPT},
-                        {"role": "user", "content": text},
-                    ],
-                    temperature=0.2,
+                # The client is synchronous: run it in a worker thread so the
+                # event loop keeps serving other requests. Cancelling the
+                # awaiting task does not stop the thread; the deadline does.
+                response = await asyncio.get_running_loop().run_in_executor(
+                    self.executor,
+                    functools.partial(self._create, system_prompt, user_content, deadline, usage),
                 )
 
                 content = response.choices[0].message.content
                 
-                # Try to parse JSON response
+                # Try to parse JSON response with pydantic-core's parser, faster than json.loads
                 try:
-                    parsed = json.loads(content)
+                    parsed = from_json(content)
                     if attempt > 0:
                         logger.info(f"LLM call succeeded on attempt {attempt + 1}")
                     return parsed
-                except json.JSONDecodeError as e:
+                except ValueError as e:
                     last_error = ValueError(
                         f"LLM returned invalid JSON on attempt {attempt + 1}: {str(e)}. "
                         f"Response content: {content[:200]}..."
@@ -71,4 +298,33 @@ class LLMAnalyzer:
         # Should not reach here, but just in case
         if last_error:
             raise last_error
-        raise ValueError("LLM analysis failed for unknown reason")
\ No newline at end of file
+        raise ValueError("LLM analysis failed for unknown reason")
+    
+    def _create(
+        self, system_prompt: str, user_content: str, deadline: Optional[float], usage: _CallUsage
+    ) -> Any:
+        """
+        Blocking provider call, run in the LLM worker threads. Usage is
+        counted here, so a request whose caller stopped waiting is still
+        recorded when it finishes; failed requests (429, 5xx) count as attempts.
+        """
+        client = self.client
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"LLM deadline of {self.timeout}s passed while queued for a worker thread")
+            client = client.with_options(timeout=remaining, max_retries=0)
+        usage.started()
+        response = None
+        try:
+            response = client.chat.completions.create(
+                model=self.MODEL,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_content},
+                ],
+                temperature=0.2,
+            )
+            return response
+        finally:
+            usage.finished(response)
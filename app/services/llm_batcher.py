@@ -0,0 +1,144 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Set, Union
+
+from pydantic import ValidationError
+
+from app.core.config import Settings
+from app.schemas.receipt_llm import ReceiptLLMResult
+from app.services.llm_analyzer import LLMAnalyzer
+from app.services.usage_ledger import current_tenant
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Request:
+    text: str
+    future: asyncio.Future
+    tenant: Optional[str]  # for usage accounting, as the batch runs outside the caller's context
+
+
+class LLMBatcher:
+    """
+    Micro-batcher for LLM analysis calls.
+
+    Requests of one tenant arriving within `max_wait_ms` of its first queued
+    one are sent together as one multi-receipt LLM call, as soon as
+    `max_size` requests are queued or the window closes. Receipts of
+    different tenants never share a call, so one tenant's receipt text cannot
+    steer the results of another's. Each caller gets its own receipt back.
+    A receipt missing from the batch response or failing validation is
+    retried with a solo call, so batching never loses a request. Errors of
+    the batch call itself (provider failures, rate-limit timeouts) are
+    raised to every caller in the batch.
+    """
+
+    def __init__(self, llm: LLMAnalyzer, max_size: int = 8, max_wait_ms: float = 20.0):
+        self.llm = llm
+        self.max_size = max_size
+        self.max_wait_ms = max_wait_ms
+
+        # Queued requests and window timers per tenant
+        self._pending: Dict[Optional[str], List[_Request]] = {}
+        self._timers: Dict[Optional[str], asyncio.TimerHandle] = {}
+        self._batches: Set[asyncio.Task] = set()
+        self.batches_sent = 0
+        self.batched_requests = 0
+        self.solo_fallbacks = 0
+
+    async def analyze(self, text: str) -> Union[ReceiptLLMResult, Dict[str, Any]]:
+        """
+        Analyze receipt text as part of the next batch.
+
+        Returns:
+            ReceiptLLMResult validated from the batch response, or the raw
+            result of a solo call when the batch result was unusable
+
+        Raises:
+            Exception: If the LLM call fails after retries
+        """
+        loop = asyncio.get_running_loop()
+        tenant = current_tenant.get()
+        request = _Request(text, loop.create_future(), tenant)
+        pending = self._pending.setdefault(tenant, [])
+        pending.append(request)
+
+        if len(pending) >= self.max_size:
+            self._flush(tenant)
+        elif tenant not in self._timers:
+            self._timers[tenant] = loop.call_later(self.max_wait_ms / 1000, self._flush, tenant)
+
+        return await request.future
+
+    def _flush(self, tenant: Optional[str]) -> None:
+        timer = self._timers.pop(tenant, None)
+        if timer is not None:
+            timer.cancel()
+        # Requests cancelled while queued (e.g. client disconnects) are dropped
+        batch = [request for request in self._pending.pop(tenant, []) if not request.future.done()]
+        if not batch:
+            return
+
+        # Keep a reference so the task is not garbage collected mid-flight
+        task = asyncio.ensure_future(self._send(batch))
+        self._batches.add(task)
+        task.add_done_callback(self._batches.discard)
+
+    async def _send(self, batch: List[_Request]) -> None:
+        if len(batch) == 1:
+            await self._solo(batch[0])
+            return
+
+        self.batches_sent += 1
+        self.batched_requests += len(batch)
+        try:
+            results = await self.llm.analyze_batch(
+                [request.text for request in batch], tenants=[request.tenant for request in batch]
+            )
+        except ValueError as e:
+            # The response as a whole was unusable: analyze every receipt alone
+            logger.warning(f"LLM batch response invalid, falling back to solo calls: size={len(batch)}, error={str(e)}")
+            results = [None] * len(batch)
+        except Exception as e:
+            for request in batch:
+                if not request.future.done():
+                    request.future.set_exception(e)
+            return
+
+        retries = []
+        for request, raw in zip(batch, results):
+            if request.future.done():
+                continue
+            try:
+                if raw is None:
+                    raise ValueError("No result for receipt in batch response")
+                request.future.set_result(ReceiptLLMResult.model_validate(raw))
+            except (ValidationError, ValueError) as e:
+                logger.info(f"Batched receipt result rejected, retrying solo: error={str(e)}")
+                retries.append(self._solo(request))
+        if retries:
+            self.solo_fallbacks += len(retries)
+            await asyncio.gather(*retries)
+
+    async def _solo(self, request: _Request) -> None:
+        try:
+            result = await self.llm.analyze_text(request.text, tenant=request.tenant)
+        except Exception as e:
+            if not request.future.done():
+                request.future.set_exception(e)
+            return
+        if not request.future.done():
+            request.future.set_result(result)
+
+
+def create_llm_batcher(settings: Settings, llm: LLMAnalyzer) -> Optional[LLMBatcher]:
+    """Build the LLM micro-batcher configured in settings, or None when disabled"""
+    if settings.llm_batch_max_size < 2:
+        return None
+    return LLMBatcher(
+        llm,
+        max_size=settings.llm_batch_max_size,
+        max_wait_ms=settings.llm_batch_max_wait_ms,
+    )
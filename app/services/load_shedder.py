@@ -0,0 +1,235 @@
+import json
+import logging
+import os
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+from app.core.config import Settings
+from app.services.background_writer import BackgroundWriter
+
+logger = logging.getLogger(__name__)
+
+# Shed reasons, as reported in results' logs and metrics
+QUEUE_DEPTH = "queue_depth"
+BREAKER_OPEN = "breaker_open"
+LATENCY_SLO = "latency_slo"
+
+# Latency checks need this many samples in the window to trigger
+MIN_LATENCY_SAMPLES = 20
+
+# The latency p95 is computed over at most this many of the latest calls
+MAX_LATENCY_SAMPLES = 256
+
+
+class LoadShedder:
+    """
+    Decides when analyses skip the LLM and get a heuristic result instead.
+
+    Three triggers, each disabled when its limit is unset:
+      - queue depth: `max_pending` LLM calls are already in flight in this
+        worker (waiting for rate-limit budget, a batch or the provider),
+      - circuit breaker: `breaker_failures` consecutive LLM failures open the
+        breaker for `breaker_cooldown` seconds; then a single probe call is
+        let through, and its outcome closes or reopens the breaker,
+      - latency SLO: the p95 latency of LLM calls finished in the last
+        `latency_window` seconds (at most the last MAX_LATENCY_SAMPLES calls)
+        exceeds `latency_slo_ms`. Samples expire, so shedding stops once the
+        window has no recent slow calls.
+
+    Shedding only protects requests arriving after a trigger fires; calls
+    already waiting on a slow provider are bounded by `llm_timeout` (seconds),
+    after which they get a heuristic result and count as failures.
+    """
+
+    def __init__(
+        self,
+        max_pending: int = 0,
+        breaker_failures: int = 0,
+        breaker_cooldown: float = 30.0,
+        latency_slo_ms: Optional[float] = None,
+        latency_window: float = 30.0,
+        llm_timeout: Optional[float] = None,
+    ):
+        self.max_pending = max_pending
+        self.breaker_failures = breaker_failures
+        self.breaker_cooldown = breaker_cooldown
+        self.latency_slo_ms = latency_slo_ms
+        self.latency_window = latency_window
+        self.llm_timeout = llm_timeout
+
+        self.pending = 0
+        self.consecutive_failures = 0
+        self.breaker = "closed"  # "closed" | "open" | "half_open"
+        self._opened_at = 0.0
+        self._probing = False
+        # (finished at, seconds); the p95 is cached until the samples change
+        self._latencies: Deque[Tuple[float, float]] = deque(maxlen=MAX_LATENCY_SAMPLES)
+        self._p95: Optional[float] = None
+        self.shed: Dict[str, int] = {QUEUE_DEPTH: 0, BREAKER_OPEN: 0, LATENCY_SLO: 0}
+
+    def check(self) -> Optional[str]:
+        """Return the reason to shed the next analysis, or None to call the LLM"""
+        reason = self._reason()
+        if reason is not None:
+            self.shed[reason] += 1
+        return reason
+
+    def _reason(self) -> Optional[str]:
+        if self.breaker == "open":
+            if time.monotonic() - self._opened_at < self.breaker_cooldown:
+                return BREAKER_OPEN
+            self.breaker = "half_open"
+        if self.breaker == "half_open":
+            if self._probing:
+                return BREAKER_OPEN
+            # Let this call through as the probe
+            self._probing = True
+            return None
+
+        if self.max_pending and self.pending >= self.max_pending:
+            return QUEUE_DEPTH
+        if self.latency_slo_ms is not None and self.latency_p95() * 1000 > self.latency_slo_ms:
+            return LATENCY_SLO
+        return None
+
+    @contextmanager
+    def track(self) -> Iterator[None]:
+        """Count an LLM call as pending and record its latency and outcome"""
+        self.pending += 1
+        started = time.monotonic()
+        try:
+            yield
+        except Exception:
+            self._failure()
+            raise
+        except BaseException:
+            # Cancelled: no verdict on the provider, let another probe through
+            self._probing = False
+            raise
+        else:
+            self._success(time.monotonic() - started)
+        finally:
+            self.pending -= 1
+
+    def _success(self, latency: float) -> None:
+        self._probing = False
+        self.consecutive_failures = 0
+        if self.breaker != "closed":
+            logger.info("LLM circuit breaker closed")
+            self.breaker = "closed"
+        self._latencies.append((time.monotonic(), latency))
+        self._p95 = None
+
+    def _failure(self) -> None:
+        self._probing = False
+        self.consecutive_failures += 1
+        if self.breaker == "half_open" or (
+            self.breaker == "closed"
+            and self.breaker_failures
+            and self.consecutive_failures >= self.breaker_failures
+        ):
+            logger.warning(f"LLM circuit breaker opened: consecutive_failures={self.consecutive_failures}")
+            self.breaker = "open"
+            self._opened_at = time.monotonic()
+
+    def latency_p95(self) -> float:
+        """p95 of LLM call latencies in the window, in seconds (0 with too few samples)"""
+        cutoff = time.monotonic() - self.latency_window
+        while self._latencies and self._latencies[0][0] < cutoff:
+            self._latencies.popleft()
+            self._p95 = None
+        if len(self._latencies) < MIN_LATENCY_SAMPLES:
+            return 0.0
+        if self._p95 is None:
+            latencies = sorted(latency for _, latency in self._latencies)
+            self._p95 = latencies[int(len(latencies) * 0.95)]
+        return self._p95
+
+    def snapshot(self) -> dict:
+        """Trigger state and shed counts for the metrics endpoint"""
+        return {
+            "breaker": self.breaker,
+            "consecutive_failures": self.consecutive_failures,
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "latency_p95_ms": round(self.latency_p95() * 1000, 1),
+            "latency_slo_ms": self.latency_slo_ms,
+            "llm_timeout": self.llm_timeout,
+            "shed": dict(self.shed),
+        }
+
+
+class _BacklogFile:
+    """
+    JSONL file the backlog writer appends to. Each batch is one write on an
+    O_APPEND descriptor, so entries from several workers sharing the file
+    never interleave within a line.
+    """
+
+    def __init__(self, path: str):
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def append(self, entries: List[Dict[str, Any]]) -> None:
+        data = "".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries).encode("utf-8")
+        while data:
+            data = data[os.write(self._fd, data):]
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+
+class EnrichmentBacklog(BackgroundWriter):
+    """
+    Receipts answered with a heuristic result, appended to a JSONL file with
+    the id returned to the client. The file is a valid bulk import input
+    (`text` and `id` fields), so re-enrichment runs with
+    `python -m app.cli.bulk_import <backlog> --output <results>` once the
+    provider has recovered.
+
+    `add` only queues the entry; a background thread writes them in batches,
+    as for the usage ledger, so requests never wait for disk.
+    """
+
+    def __init__(self, path: str, flush_interval: float = 0.2, max_pending: int = 10_000):
+        super().__init__(
+            _BacklogFile(path), "enrichment-backlog", flush_interval=flush_interval, max_pending=max_pending
+        )
+        self.path = path
+
+    def add(self, text: str, source: str, reason: str, tenant: Optional[str]) -> str:
+        """Queue a receipt for later analysis and return its enrichment id"""
+        enrichment_id = uuid.uuid4().hex
+        self.record([{
+            "id": enrichment_id, "ts": time.time(), "tenant": tenant,
+            "source": source, "reason": reason, "text": text,
+        }])
+        return enrichment_id
+
+
+def create_load_shedder(settings: Settings) -> Optional[LoadShedder]:
+    """Build the load shedder configured in settings, or None when no trigger is set"""
+    if not (
+        settings.load_shed_max_pending
+        or settings.load_shed_breaker_failures
+        or settings.load_shed_latency_slo_ms
+        or settings.load_shed_llm_timeout
+    ):
+        return None
+    return LoadShedder(
+        max_pending=settings.load_shed_max_pending,
+        breaker_failures=settings.load_shed_breaker_failures,
+        breaker_cooldown=settings.load_shed_breaker_cooldown,
+        latency_slo_ms=settings.load_shed_latency_slo_ms,
+        latency_window=settings.load_shed_latency_window,
+        llm_timeout=settings.load_shed_llm_timeout,
+    )
+
+
+def create_enrichment_backlog(settings: Settings) -> Optional[EnrichmentBacklog]:
+    """Open the enrichment backlog configured in settings, or None when disabled"""
+    if not settings.enrichment_backlog_path:
+        return None
+    return EnrichmentBacklog(settings.enrichment_backlog_path)
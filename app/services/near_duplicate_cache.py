@@ -0,0 +1,202 @@
+import hashlib
+import logging
+import re
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Set, Tuple
+
+from app.core.config import Settings
+from app.schemas.receipt import ReceiptResult
+from app.services.receipt_text import extract_total
+
+logger = logging.getLogger(__name__)
+
+FINGERPRINT_BITS = 64
+
+_NON_WORD_RE = re.compile(r"[\W_]+")
+
+# Characters tesseract commonly confuses are folded into one class so that
+# misreads do not change the fingerprint. Numbers are compared separately on
+# the raw text (see numeric_tokens), so folding digits here is safe.
+_CONFUSABLE = str.maketrans({"0": "o", "1": "l", "i": "l", "|": "l", "5": "s", "8": "b", "c": "e"})
+
+# Numbers: digit groups joined by separators (a stray space after a
+# separator is tolerated)
+_NUMBER_RE = re.compile(r"\d+(?:[.,]\s?\d+)*")
+
+# A lone digit touching a letter is usually a misread letter ("C0rner",
+# "Apple5") rather than a number
+_LETTER_LIKE_DIGITS = "0158"
+
+# Character n-gram size for fingerprint features
+SHINGLE_SIZE = 3
+
+# _BIT_TABLES[k] maps a byte to its k-th bit, used to count set bits per
+# position across all feature hashes with C-level bytes operations
+_BIT_TABLES = [bytes((value >> k) & 1 for value in range(256)) for k in range(8)]
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase, fold confusable characters and drop whitespace/punctuation"""
+    folded = text.lower().replace("rn", "m").translate(_CONFUSABLE)
+    return _NON_WORD_RE.sub("", folded)
+
+
+def numeric_tokens(text: str) -> Tuple[str, ...]:
+    """Sorted digits of every number in text, e.g. 'Bread 45 Total 1,234.50' -> ('123450', '45')"""
+    tokens = []
+    for match in _NUMBER_RE.finditer(text):
+        number = match.group()
+        if len(number) == 1 and number in _LETTER_LIKE_DIGITS and (
+            text[match.start() - 1:match.start()].isalpha() or text[match.end():match.end() + 1].isalpha()
+        ):
+            continue
+        tokens.append(re.sub(r"\D", "", number))
+    return tuple(sorted(tokens))
+
+
+def simhash(text: str) -> int:
+    """
+    64-bit SimHash over character n-grams of normalized text.
+    A misread character only changes a few of the many n-grams, so repeated
+    OCR passes of the same receipt end up a few bits apart.
+    """
+    normalized = normalize_text(text)
+    shingles = [
+        normalized[i:i + SHINGLE_SIZE]
+        for i in range(max(1, len(normalized) - SHINGLE_SIZE + 1))
+    ]
+    digests = b"".join(
+        hashlib.blake2b(shingle.encode(), digest_size=8).digest() for shingle in shingles
+    )
+
+    # Bit b of the fingerprint is set when most shingle hashes have bit b set
+    fingerprint = 0
+    for byte in range(8):
+        column = digests[byte::8]
+        for k in range(8):
+            if column.translate(_BIT_TABLES[k]).count(1) * 2 > len(shingles):
+                fingerprint |= 1 << (byte * 8 + k)
+    return fingerprint
+
+
+def _copy_result(result: ReceiptResult) -> ReceiptResult:
+    """Copy a result so callers cannot change cached data; items are immutable and shared"""
+    return result.model_copy(update={"items": list(result.items)})
+
+
+@dataclass
+class _Entry:
+    fingerprint: int
+    total: int
+    numbers: Tuple[str, ...]
+    result: ReceiptResult
+
+
+class NearDuplicateCache:
+    """
+    Bounded cache of analysis results keyed by SimHash of the receipt text.
+
+    Fingerprints are split into `max_distance + 1` bands; by the pigeonhole
+    principle two fingerprints within `max_distance` bits share at least one
+    band exactly, so only entries in matching band buckets are compared.
+    A candidate is reused only if a receipt total was extracted from both
+    texts, the totals are equal and both texts hold the same numbers (prices,
+    quantities, dates), since the fingerprint cannot tell "45" from "49".
+    Least recently used entries are evicted past `max_entries`.
+    """
+
+    def __init__(self, max_entries: int = 10_000, max_distance: int = 6):
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.band_count = max_distance + 1
+        self.band_width = FINGERPRINT_BITS // self.band_count
+        self._band_mask = (1 << self.band_width) - 1
+
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._bands: List[Dict[int, Set[int]]] = [{} for _ in range(self.band_count)]
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _band_keys(self, fingerprint: int) -> List[int]:
+        return [
+            (fingerprint >> (band * self.band_width)) & self._band_mask
+            for band in range(self.band_count)
+        ]
+
+    def lookup(self, text: str) -> Optional[ReceiptResult]:
+        """Return a cached result for a near-duplicate receipt text, if any"""
+        total = extract_total(text)
+        if total is None:
+            # Nothing reliable to confirm a match with
+            with self._lock:
+                self.misses += 1
+            return None
+        fingerprint = simhash(text)
+        numbers = numeric_tokens(text)
+
+        with self._lock:
+            candidates: Set[int] = set()
+            for band, key in enumerate(self._band_keys(fingerprint)):
+                candidates |= self._bands[band].get(key, set())
+
+            best_id, best_distance = None, self.max_distance + 1
+            for entry_id in candidates:
+                entry = self._entries[entry_id]
+                if entry.total != total or entry.numbers != numbers:
+                    continue
+                distance = bin(entry.fingerprint ^ fingerprint).count("1")
+                if distance < best_distance:
+                    best_id, best_distance = entry_id, distance
+
+            if best_id is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(best_id)
+            self.hits += 1
+            logger.info(f"Near-duplicate cache hit: distance={best_distance}")
+            return _copy_result(self._entries[best_id].result)
+
+    def add(self, text: str, result: ReceiptResult) -> None:
+        """Store the result for a receipt text, evicting the oldest entry when full"""
+        total = extract_total(text)
+        if self.max_entries <= 0 or total is None:
+            return
+
+        fingerprint = simhash(text)
+        entry = _Entry(fingerprint, total, numeric_tokens(text), _copy_result(result))
+
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = entry
+            for band, key in enumerate(self._band_keys(fingerprint)):
+                self._bands[band].setdefault(key, set()).add(entry_id)
+
+            while len(self._entries) > self.max_entries:
+                self._evict_oldest()
+
+    def _evict_oldest(self) -> None:
+        entry_id, entry = self._entries.popitem(last=False)
+        for band, key in enumerate(self._band_keys(entry.fingerprint)):
+            bucket = self._bands[band][key]
+            bucket.discard(entry_id)
+            if not bucket:
+                del self._bands[band][key]
+
+
+def create_near_duplicate_cache(settings: Settings) -> Optional[NearDuplicateCache]:
+    """Build the near-duplicate cache configured in settings, or None when disabled"""
+    if settings.near_duplicate_cache_size <= 0:
+        return None
+    return NearDuplicateCache(
+        max_entries=settings.near_duplicate_cache_size,
+        max_distance=settings.near_duplicate_max_distance,
+    )
@@ -0,0 +1,169 @@
+import asyncio
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, List, Optional, Tuple, TypeVar
+
+from app.core.config import Settings
+from app.services.ocr_service import OCRService
+from app.services.receipt_text import DATE_RE, extract_total, has_total_line
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+def is_material_change(speculative_text: str, final_text: str) -> bool:
+    """
+    Decide whether text OCR'd after the speculative LLM call started could
+    change the analysis: the total moved, or a date appeared that the
+    speculative text lacked. Footer lines (greetings, addresses, payment
+    details with the same total) are not material.
+    """
+    if extract_total(final_text) != extract_total(speculative_text):
+        return True
+    return DATE_RE.search(speculative_text) is None and DATE_RE.search(final_text) is not None
+
+
+class OCRPipeline:
+    """
+    Pipelined OCR + LLM analysis for tall receipt images.
+
+    The image is cut into horizontal bands at the whitest rows near equal
+    intervals (gaps between text lines), and the bands are OCR'd in parallel
+    worker threads (bounded across all requests, since OCR is CPU-bound;
+    bands are submitted top-down so upper bands finish first). As soon as every band from the top down to one containing
+    the total line is done, the LLM call starts on that partial text while
+    the remaining bands finish. If the full text differs materially, the
+    speculative call is cancelled and the analysis is redone on the full text.
+    """
+
+    def __init__(
+        self,
+        ocr: OCRService,
+        bands: int = 4,
+        min_aspect_ratio: float = 2.0,
+        workers: Optional[int] = None,
+    ):
+        self.ocr = ocr
+        self.bands = bands
+        self.min_aspect_ratio = min_aspect_ratio
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers or os.cpu_count() or 1, thread_name_prefix="ocr-band"
+        )
+        self.speculative_hits = 0
+        self.speculative_redos = 0
+
+    def split(self, image) -> List:
+        """Cut an image into `bands` horizontal strips at blank rows"""
+        from PIL import Image
+
+        gray = image.convert("L")
+        height = gray.height
+        # Mean brightness of every row, computed by PIL in C
+        profile = gray.resize((1, height), Image.Resampling.BOX).tobytes()
+        window = max(1, height // (self.bands * 4))
+
+        cuts = [0]
+        for k in range(1, self.bands):
+            nominal = k * height // self.bands
+            low = max(cuts[-1] + 1, nominal - window)
+            high = min(height - 1, nominal + window)
+            if low > high:
+                continue
+            cuts.append(max(range(low, high + 1), key=lambda y: profile[y]))
+        cuts.append(height)
+
+        return [gray.crop((0, top, gray.width, bottom)) for top, bottom in zip(cuts, cuts[1:])]
+
+    async def run(
+        self, content: bytes, analyze: Callable[[str], Awaitable[T]]
+    ) -> Optional[Tuple[str, T]]:
+        """
+        OCR and analyze an image with speculative early start.
+
+        Args:
+            content: Uploaded image bytes
+            analyze: Coroutine function analyzing receipt text; a speculative
+                outcome may be discarded, so it must have no side effects
+
+        Returns:
+            (analyzed text, analysis result), or None if the image is not tall
+            enough to benefit and should take the sequential path
+        """
+        from PIL import Image
+
+        try:
+            image = Image.open(io.BytesIO(content))
+        except Exception as e:
+            logger.warning(f"Cannot open image for pipelined OCR: error={str(e)}")
+            return None
+        if self.bands < 2 or image.height < image.width * self.min_aspect_ratio:
+            return None
+
+        loop = asyncio.get_running_loop()
+        band_tasks = [
+            loop.run_in_executor(self.executor, self.ocr.extract_image_text, band)
+            for band in self.split(image)
+        ]
+        pending = {task: i for i, task in enumerate(band_tasks)}
+        texts: List[Optional[str]] = [None] * len(band_tasks)
+        speculative: Optional[asyncio.Task] = None
+        speculative_text = ""
+
+        try:
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    texts[pending.pop(task)] = task.result()
+
+                if speculative is None and pending:
+                    prefix = self._join(texts[:self._done_prefix(texts)])
+                    if has_total_line(prefix):
+                        logger.info(f"Total line found, starting LLM early: bands_pending={len(pending)}")
+                        speculative_text = prefix
+                        speculative = asyncio.ensure_future(analyze(prefix))
+        except BaseException:
+            for task in band_tasks:
+                task.cancel()
+            if speculative is not None:
+                speculative.cancel()
+            raise
+
+        full_text = self._join(texts)
+        if speculative is not None:
+            if not is_material_change(speculative_text, full_text):
+                self.speculative_hits += 1
+                return speculative_text, await speculative
+            logger.info("Later bands changed the receipt materially, redoing analysis")
+            self.speculative_redos += 1
+            if speculative.done() and not speculative.cancelled():
+                # Outcome is discarded; retrieve it so a failure is not reported as unhandled
+                speculative.exception()
+            speculative.cancel()
+
+        return full_text, await analyze(full_text)
+
+    @staticmethod
+    def _done_prefix(texts: List[Optional[str]]) -> int:
+        count = 0
+        while count < len(texts) and texts[count] is not None:
+            count += 1
+        return count
+
+    @staticmethod
+    def _join(texts: List[Optional[str]]) -> str:
+        return "\n".join(text for text in texts if text)
+
+
+def create_ocr_pipeline(settings: Settings, ocr: OCRService) -> Optional[OCRPipeline]:
+    """Build the OCR pipeline configured in settings, or None when disabled"""
+    if settings.ocr_pipeline_bands < 2:
+        return None
+    return OCRPipeline(
+        ocr,
+        bands=settings.ocr_pipeline_bands,
+        min_aspect_ratio=settings.ocr_pipeline_min_aspect_ratio,
+        workers=settings.ocr_pipeline_workers,
+    )
@@ -1,13 +1,27 @@
 # app/services/ocr_service.py
-from PIL import Image
-import pytesseract
+
 
 class OCRService:
     def __init__(self, lang='rus+eng'):
         self.lang = lang
 
+    def warm_up(self) -> None:
+        """Import PIL/pytesseract and check that the tesseract binary is available"""
+        import pytesseract
+        from PIL import Image  # noqa: F401
+
+        pytesseract.get_tesseract_version()
+
     def extract_text(self, file_path: str) -> str:
         """Extract text from an image file"""
+        from PIL import Image
+
         image = Image.open(file_path)
+        return self.extract_image_text(image)
+
+    def extract_image_text(self, image) -> str:
+        """Extract text from a PIL image (e.g. one band of a receipt)"""
+        import pytesseract
+
         text = pytesseract.image_to_string(image, lang=self.lang)
-        return text.strip()
\ No newline at end of file
+        return text.strip()
@@ -0,0 +1,237 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, Tuple
+
+from app.core.config import Settings
+
+logger = logging.getLogger(__name__)
+
+# Rough characters-per-token ratio used to estimate prompt size before a call
+CHARS_PER_TOKEN = 4
+
+# Bucket state: name -> (available tokens, last refill timestamp)
+BucketState = Dict[str, Tuple[float, float]]
+
+
+class RateLimitExceeded(Exception):
+    """Raised when rate-limit budget cannot be acquired before the deadline"""
+
+
+@dataclass(frozen=True)
+class Bucket:
+    """Token bucket definition: refills to `capacity` over one minute"""
+
+    name: str
+    capacity: float
+
+    @property
+    def rate(self) -> float:
+        return self.capacity / 60.0
+
+
+def estimate_tokens(*texts: str, completion_tokens: int = 0) -> int:
+    """Estimate total tokens for a call from its prompt texts and completion budget"""
+    return sum(len(t) for t in texts) // CHARS_PER_TOKEN + 1 + completion_tokens
+
+
+class MemoryBucketStore:
+    """Bucket state held in process memory. Limits apply to a single worker."""
+
+    def __init__(self):
+        self._state: BucketState = {}
+        self._lock = threading.Lock()
+
+    def transact(self, fn: Callable[[BucketState], Tuple[BucketState, float]]) -> float:
+        with self._lock:
+            new_state, result = fn(dict(self._state))
+            self._state = new_state
+            return result
+
+
+class SQLiteBucketStore:
+    """
+    Bucket state in a SQLite file. Shared by all processes on a host;
+    BEGIN IMMEDIATE serializes concurrent updates.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rate_limit_buckets ("
+                "name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10.0, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def transact(self, fn: Callable[[BucketState], Tuple[BucketState, float]]) -> float:
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute("SELECT name, tokens, updated FROM rate_limit_buckets").fetchall()
+            new_state, result = fn({name: (tokens, updated) for name, tokens, updated in rows})
+            conn.executemany(
+                "INSERT OR REPLACE INTO rate_limit_buckets (name, tokens, updated) VALUES (?, ?, ?)",
+                [(name, tokens, updated) for name, (tokens, updated) in new_state.items()],
+            )
+            conn.execute("COMMIT")
+            return result
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+
+class RedisBucketStore:
+    """
+    Bucket state in Redis (or any Redis-compatible server). Shared across hosts;
+    updates use optimistic WATCH/MULTI transactions. Requires the `redis` package.
+    """
+
+    def __init__(self, url: str, key: str = "wannatrack:llm_rate_limit", client=None):
+        import redis
+
+        self.key = key
+        self._redis = client or redis.Redis.from_url(url)
+        self._watch_error = redis.WatchError
+
+    def transact(self, fn: Callable[[BucketState], Tuple[BucketState, float]]) -> float:
+        with self._redis.pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(self.key)
+                    raw = pipe.get(self.key)
+                    state = {k: tuple(v) for k, v in json.loads(raw).items()} if raw else {}
+                    new_state, result = fn(state)
+                    pipe.multi()
+                    pipe.set(self.key, json.dumps(new_state))
+                    pipe.execute()
+                    return result
+                except self._watch_error:
+                    continue
+
+
+class TokenBucketRateLimiter:
+    """
+    Rate limiter over requests-per-minute and tokens-per-minute buckets.
+
+    Both buckets are debited atomically before each LLM call. Callers in the
+    same process queue in FIFO order; when budget is short the head of the
+    queue sleeps until the buckets refill, up to `max_wait` seconds.
+    """
+
+    def __init__(
+        self,
+        store,
+        rpm: Optional[int] = None,
+        tpm: Optional[int] = None,
+        max_wait: float = 30.0,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.store = store
+        self.max_wait = max_wait
+        self.clock = clock
+        self.buckets = [
+            Bucket(name, capacity)
+            for name, capacity in (("requests", rpm), ("tokens", tpm))
+            if capacity
+        ]
+        self._queue = asyncio.Lock()
+
+    def try_acquire(self, requests: int = 1, tokens: int = 0) -> float:
+        """
+        Debit budget if available.
+
+        Returns:
+            0 if the budget was acquired, otherwise seconds until it may be
+        """
+        cost = {"requests": requests, "tokens": tokens}
+
+        def apply(state: BucketState) -> Tuple[BucketState, float]:
+            # Read the clock inside the transaction so concurrent writers
+            # never move a bucket's refill timestamp backwards
+            now = self.clock()
+            levels = {}
+            wait = 0.0
+            for bucket in self.buckets:
+                available, updated = state.get(bucket.name, (bucket.capacity, now))
+                available = min(bucket.capacity, available + max(0.0, now - updated) * bucket.rate)
+                # Requests larger than the bucket are capped so they can eventually run
+                needed = min(cost[bucket.name], bucket.capacity)
+                if available < needed:
+                    wait = max(wait, (needed - available) / bucket.rate)
+                levels[bucket.name] = (available, needed)
+
+            new_state = dict(state)
+            for name, (available, needed) in levels.items():
+                new_state[name] = (available - needed if wait == 0 else available, now)
+            return new_state, wait
+
+        return self.store.transact(apply)
+
+    async def acquire(self, tokens: int = 0, requests: int = 1, timeout: Optional[float] = None) -> None:
+        """
+        Wait for rate-limit budget.
+
+        Args:
+            tokens: Estimated tokens the call will consume
+            requests: Number of requests the call counts as
+            timeout: Maximum wait in seconds, defaults to `max_wait`
+
+        Raises:
+            RateLimitExceeded: If the budget cannot be acquired before the deadline
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (self.max_wait if timeout is None else timeout)
+
+        try:
+            await asyncio.wait_for(self._queue.acquire(), max(0.0, deadline - loop.time()))
+        except asyncio.TimeoutError:
+            raise RateLimitExceeded("Timed out waiting in rate-limit queue") from None
+
+        try:
+            while True:
+                wait = await asyncio.to_thread(self.try_acquire, requests, tokens)
+                if wait <= 0:
+                    return
+                if loop.time() + wait > deadline:
+                    raise RateLimitExceeded(
+                        f"Rate-limit budget unavailable within deadline (needs {wait:.2f}s more)"
+                    )
+                logger.info(f"Rate limit reached, waiting {wait:.2f}s: tokens={tokens}")
+                await asyncio.sleep(wait)
+        finally:
+            self._queue.release()
+
+
+def create_rate_limiter(settings: Settings) -> Optional[TokenBucketRateLimiter]:
+    """Build the rate limiter configured in settings, or None when disabled"""
+    if not settings.llm_rate_limit_rpm and not settings.llm_rate_limit_tpm:
+        return None
+
+    backend = settings.llm_rate_limit_backend
+    if backend == "memory":
+        store = MemoryBucketStore()
+    elif backend == "sqlite":
+        store = SQLiteBucketStore(settings.llm_rate_limit_url or "/tmp/wannatrack_rate_limit.sqlite3")
+    elif backend == "redis":
+        store = RedisBucketStore(settings.llm_rate_limit_url or "redis://localhost:6379/0")
+    else:
+        raise ValueError(f"Unknown rate limit backend: {backend}")
+
+    return TokenBucketRateLimiter(
+        store,
+        rpm=settings.llm_rate_limit_rpm,
+        tpm=settings.llm_rate_limit_tpm,
+        max_wait=settings.llm_rate_limit_max_wait,
+    )
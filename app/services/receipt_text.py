@@ -0,0 +1,114 @@
+import re
+from datetime import date
+from typing import List, Optional, Tuple
+
+# Words that mark the line carrying the receipt total
+TOTAL_KEYWORDS = ("total", "итог", "сумма", "к оплате", "amount due", "รวม", "summe")
+
+# An amount with two decimals, optionally with thousands grouped by space,
+# comma or dot; the group separator differs from the decimal one
+# ("1,234.56", "1.234,56", "1 234,56")
+_AMOUNT_RE = re.compile(
+    r"(?<![\d.,])(?:\d{1,3}(?P<sep>[ \u00a0,.])\d{3}(?:(?P=sep)\d{3})*(?!(?P=sep))[.,]\d{2}"
+    r"|\d+[.,]\d{2})(?!\d)"
+)
+
+# A total keyword standing on its own, so "Subtotal" is not taken for "Total"
+_TOTAL_LINE_RE = re.compile(
+    r"(?<!\w)(?:" + "|".join(re.escape(k) for k in TOTAL_KEYWORDS) + r")",
+    re.IGNORECASE,
+)
+
+DATE_RE = re.compile(r"(?<!\d)(?:\d{4}[-./]\d{1,2}[-./]\d{1,2}|\d{1,2}[-./]\d{1,2}[-./]\d{2,4})(?!\d)")
+
+
+def extract_amounts(text: str) -> List[int]:
+    """Return monetary amounts (in cents) found in text, e.g. '1 234,50' -> 123450"""
+    amounts = []
+    for match in _AMOUNT_RE.finditer(text):
+        digits = re.sub(r"[^\d]", "", match.group())
+        amounts.append(int(digits))
+    return amounts
+
+
+def _total_line(lines: List[str]) -> Optional[Tuple[int, int]]:
+    """(line index, total in cents) read from receipt lines, or None without amounts"""
+    for i in range(len(lines) - 1, -1, -1):
+        if _TOTAL_LINE_RE.search(lines[i]):
+            amounts = extract_amounts(lines[i])
+            if amounts:
+                return i, amounts[-1]
+    largest = [(max(amounts), i) for i, amounts in enumerate(map(extract_amounts, lines)) if amounts]
+    if not largest:
+        return None
+    amount, i = max(largest)
+    return i, amount
+
+
+def extract_total(text: str) -> Optional[int]:
+    """
+    Return the receipt total in cents: the last amount on the last line with a
+    standalone total keyword ("Subtotal" does not count), or the largest
+    amount in the text when no such line exists.
+    """
+    found = _total_line(text.splitlines())
+    return found[1] if found else None
+
+
+def total_line_index(text: str) -> Optional[int]:
+    """Return the index (in text.splitlines()) of the line extract_total reads the total from"""
+    found = _total_line(text.splitlines())
+    return found[0] if found else None
+
+
+def has_total_line(text: str) -> bool:
+    """True if text contains a standalone total keyword followed by an amount on the same line"""
+    for line in text.splitlines():
+        match = _TOTAL_LINE_RE.search(line)
+        if match and extract_amounts(line[match.end():]):
+            return True
+    return False
+
+
+# ISO 4217 codes and the symbols or words that stand for them on receipts;
+# ambiguous symbols map to their most common currency
+CURRENCY_CODES = ("USD", "EUR", "GBP", "RUB", "THB", "JPY", "CNY", "INR", "CHF", "CAD", "AUD", "PLN", "UAH", "KZT", "TRY")
+CURRENCY_SYMBOLS = {
+    "€": "EUR", "£": "GBP", "₽": "RUB", "руб": "RUB", "฿": "THB", "บาท": "THB",
+    "¥": "JPY", "₹": "INR", "zł": "PLN", "₴": "UAH", "₸": "KZT", "₺": "TRY", "$": "USD",
+}
+
+_CURRENCY_CODE_RE = re.compile(r"(?<![A-Za-z])(" + "|".join(CURRENCY_CODES) + r")(?![A-Za-z])")
+
+
+def extract_currency(text: str) -> Optional[str]:
+    """Return the ISO 4217 code of the first currency code found in text, else of the first currency symbol"""
+    match = _CURRENCY_CODE_RE.search(text)
+    if match:
+        return match.group(1)
+    lowered = text.lower()
+    found = [(lowered.find(symbol), code) for symbol, code in CURRENCY_SYMBOLS.items() if symbol in lowered]
+    return min(found)[1] if found else None
+
+
+def extract_date(text: str) -> Optional[str]:
+    """
+    Return the first valid date in text as YYYY-MM-DD. Day-first order is
+    assumed unless the date uses slashes and reads as month/day (US style).
+    """
+    for match in DATE_RE.finditer(text):
+        raw = match.group()
+        first, second, third = re.split(r"[-./]", raw)
+        if len(first) == 4:
+            year, month, day = int(first), int(second), int(third)
+        else:
+            day, month, year = int(first), int(second), int(third)
+            if "/" in raw and day <= 12:
+                day, month = month, day
+            if year < 100:
+                year += 2000
+        try:
+            return date(year, month, day).isoformat()
+        except ValueError:
+            continue
+    return None
@@ -0,0 +1,264 @@
+import asyncio
+import itertools
+import logging
+import math
+import time
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Deque, Dict, Literal, Optional, Tuple, TypeVar
+
+from app.core.config import Settings
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+Priority = Literal["interactive", "bulk"]
+
+# Lanes in strict priority order: a bulk request is only dispatched when
+# no interactive request can run
+PRIORITIES: Tuple[Priority, ...] = ("interactive", "bulk")
+
+# Number of recent wait samples kept per tenant for percentile metrics
+WAIT_SAMPLES = 256
+
+
+@dataclass
+class _Waiter:
+    tenant: str
+    priority: Priority
+    start_tag: float
+    seq: int
+    enqueued_at: float
+    future: asyncio.Future
+
+
+@dataclass
+class TenantStats:
+    """Per-tenant counters exposed through scheduler metrics"""
+
+    running: int = 0
+    completed: int = 0
+    waited: int = 0
+    wait_total: float = 0.0
+    wait_max: float = 0.0
+    recent_waits: Deque[float] = field(default_factory=lambda: deque(maxlen=WAIT_SAMPLES))
+    last_active: float = field(default_factory=time.monotonic)
+
+    def record_wait(self, wait: float) -> None:
+        self.waited += 1
+        self.wait_total += wait
+        self.wait_max = max(self.wait_max, wait)
+        self.recent_waits.append(wait)
+
+
+class FairScheduler:
+    """
+    Admission scheduler for analysis requests.
+
+    Requests are grouped into priority lanes (interactive before bulk). Within
+    a lane, tenants share capacity by start-time weighted fair queuing: each
+    request gets a virtual start tag and the smallest tag runs next, so a
+    tenant with weight 2 is served twice as often as a tenant with weight 1
+    while both have requests queued. A tenant never holds more than
+    `tenant_concurrency` slots, leaving room for others.
+
+    Tenant identities come from client headers, so per-tenant stats of idle
+    tenants (nothing running or queued) are dropped after `stats_ttl` seconds
+    without requests, and the oldest idle ones first once more than
+    `max_tracked_tenants` are tracked.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 16,
+        tenant_concurrency: int = 4,
+        weights: Optional[Dict[str, float]] = None,
+        stats_ttl: float = 600.0,
+        max_tracked_tenants: int = 10_000,
+    ):
+        for tenant, weight in (weights or {}).items():
+            if not (weight > 0 and math.isfinite(weight)):
+                raise ValueError(f"Tenant weight must be a positive number: {tenant}={weight}")
+        self.max_concurrency = max_concurrency
+        self.tenant_concurrency = tenant_concurrency
+        self.weights = weights or {}
+        self.stats_ttl = stats_ttl
+        self.max_tracked_tenants = max_tracked_tenants
+
+        self._lanes: Dict[Priority, Dict[str, Deque[_Waiter]]] = {p: {} for p in PRIORITIES}
+        self._virtual_time: Dict[Priority, float] = {p: 0.0 for p in PRIORITIES}
+        self._last_finish: Dict[Priority, Dict[str, float]] = {p: {} for p in PRIORITIES}
+        self._seq = itertools.count()
+        self._running = 0
+        self.stats: Dict[str, TenantStats] = defaultdict(TenantStats)
+        self._last_prune = time.monotonic()
+
+    async def run(self, tenant: str, priority: Priority, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        Wait for a slot, then run `fn`.
+
+        Args:
+            tenant: Tenant identity the request is accounted to
+            priority: Scheduling lane ("interactive" or "bulk")
+            fn: Coroutine factory performing the work
+
+        Returns:
+            Result of `fn`
+        """
+        await self.acquire(tenant, priority)
+        try:
+            return await fn()
+        finally:
+            self.release(tenant)
+
+    async def acquire(self, tenant: str, priority: Priority) -> None:
+        """Queue for a slot and return once the request may run"""
+        if priority not in self._lanes:
+            raise ValueError(f"Unknown priority: {priority}")
+
+        loop = asyncio.get_running_loop()
+        self._prune_stats()
+        self.stats[tenant].last_active = time.monotonic()
+        weight = self.weights.get(tenant, 1.0)
+        lane_finish = self._last_finish[priority]
+        start_tag = max(self._virtual_time[priority], lane_finish.get(tenant, 0.0))
+        lane_finish[tenant] = start_tag + 1.0 / weight
+
+        waiter = _Waiter(tenant, priority, start_tag, next(self._seq), loop.time(), loop.create_future())
+        self._lanes[priority].setdefault(tenant, deque()).append(waiter)
+        self._dispatch()
+
+        try:
+            await waiter.future
+        except asyncio.CancelledError:
+            if waiter.future.done() and not waiter.future.cancelled():
+                # Slot was granted just before cancellation: hand it back
+                self.release(tenant)
+            else:
+                self._remove(waiter)
+            raise
+
+        self.stats[tenant].record_wait(loop.time() - waiter.enqueued_at)
+
+    def release(self, tenant: str) -> None:
+        """Free the slot held by `tenant` and dispatch queued requests"""
+        stats = self.stats[tenant]
+        stats.running -= 1
+        stats.completed += 1
+        stats.last_active = time.monotonic()
+        self._running -= 1
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        while self._running < self.max_concurrency:
+            waiter = self._next_waiter()
+            if waiter is None:
+                return
+            self._running += 1
+            self.stats[waiter.tenant].running += 1
+            waiter.future.set_result(None)
+
+    def _next_waiter(self) -> Optional[_Waiter]:
+        for priority in PRIORITIES:
+            lane = self._lanes[priority]
+            best: Optional[_Waiter] = None
+            for tenant, queue in lane.items():
+                if self.stats[tenant].running >= self.tenant_concurrency:
+                    continue
+                head = queue[0]
+                if best is None or (head.start_tag, head.seq) < (best.start_tag, best.seq):
+                    best = head
+            if best is not None:
+                self._virtual_time[priority] = best.start_tag
+                self._pop(best)
+                return best
+        return None
+
+    def _pop(self, waiter: _Waiter) -> None:
+        lane = self._lanes[waiter.priority]
+        queue = lane[waiter.tenant]
+        queue.popleft()
+        if not queue:
+            del lane[waiter.tenant]
+            self._forget_idle(waiter.priority)
+
+    def _remove(self, waiter: _Waiter) -> None:
+        lane = self._lanes[waiter.priority]
+        queue = lane.get(waiter.tenant)
+        if queue is not None and waiter in queue:
+            queue.remove(waiter)
+            if not queue:
+                del lane[waiter.tenant]
+        # A cancelled waiter may have been blocking others behind its tenant cap
+        self._dispatch()
+
+    def _forget_idle(self, priority: Priority) -> None:
+        # Finish tags at or below virtual time carry no information: a new
+        # request would start at virtual time anyway. Drop them to keep the
+        # table bounded by the number of active tenants.
+        virtual_time = self._virtual_time[priority]
+        lane = self._lanes[priority]
+        finishes = self._last_finish[priority]
+        for tenant in [t for t, f in finishes.items() if f <= virtual_time and t not in lane]:
+            del finishes[tenant]
+
+    def _prune_stats(self) -> None:
+        # Runs at most every quarter TTL, unless the table is over its cap
+        now = time.monotonic()
+        if now - self._last_prune < self.stats_ttl / 4 and len(self.stats) <= self.max_tracked_tenants:
+            return
+        self._last_prune = now
+        queued = {tenant for lane in self._lanes.values() for tenant in lane}
+        idle = sorted(
+            (stats.last_active, tenant)
+            for tenant, stats in self.stats.items()
+            if stats.running == 0 and tenant not in queued
+        )
+        excess = len(self.stats) - self.max_tracked_tenants
+        for i, (last_active, tenant) in enumerate(idle):
+            if i >= excess and now - last_active <= self.stats_ttl:
+                break
+            del self.stats[tenant]
+    
+    def snapshot(self) -> dict:
+        """Return queue depth, concurrency and wait-time metrics per tenant"""
+        tenants = {}
+        for tenant, stats in self.stats.items():
+            waits = sorted(stats.recent_waits)
+            tenants[tenant] = {
+                "queued": {
+                    priority: len(self._lanes[priority].get(tenant, ()))
+                    for priority in PRIORITIES
+                },
+                "running": stats.running,
+                "completed": stats.completed,
+                "weight": self.weights.get(tenant, 1.0),
+                "wait_ms": {
+                    "avg": round(stats.wait_total / stats.waited * 1000, 3) if stats.waited else 0.0,
+                    "p50": round(waits[len(waits) // 2] * 1000, 3) if waits else 0.0,
+                    "p95": round(waits[int(len(waits) * 0.95)] * 1000, 3) if waits else 0.0,
+                    "max": round(stats.wait_max * 1000, 3),
+                },
+            }
+        return {
+            "running": self._running,
+            "max_concurrency": self.max_concurrency,
+            "tenant_concurrency": self.tenant_concurrency,
+            "queued": {
+                priority: sum(len(q) for q in self._lanes[priority].values())
+                for priority in PRIORITIES
+            },
+            "tenants": tenants,
+        }
+
+
+def create_scheduler(settings: Settings) -> FairScheduler:
+    """Build the scheduler configured in settings"""
+    return FairScheduler(
+        max_concurrency=settings.scheduler_max_concurrency,
+        tenant_concurrency=settings.scheduler_tenant_concurrency,
+        weights=settings.scheduler_tenant_weights,
+        stats_ttl=settings.scheduler_stats_ttl,
+        max_tracked_tenants=settings.scheduler_max_tracked_tenants,
+    )
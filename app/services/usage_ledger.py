@@ -0,0 +1,285 @@
+import json
+import logging
+import os
+import sqlite3
+import time
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from app.core.config import Settings
+from app.services.background_writer import BackgroundWriter
+
+logger = logging.getLogger(__name__)
+
+# Tenant the current request is accounted to; set by the API and the bulk
+# import CLI, read when LLM usage is recorded
+current_tenant: ContextVar[Optional[str]] = ContextVar("current_tenant", default=None)
+
+# USD per million tokens: (prompt, cached prompt, completion)
+MODEL_PRICES: Dict[str, Tuple[float, float, float]] = {
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4o": (2.50, 1.25, 10.00),
+}
+
+# Columns reports can be grouped by
+GROUP_COLUMNS = ("tenant", "day", "model", "kind")
+
+
+def cost_usd(model: str, prompt_tokens: int, cached_tokens: int, completion_tokens: int) -> float:
+    """Price a call from its token counts; 0 for models without a known price"""
+    prices = MODEL_PRICES.get(model)
+    if prices is None:
+        return 0.0
+    prompt_price, cached_price, completion_price = prices
+    return (
+        (prompt_tokens - cached_tokens) * prompt_price
+        + cached_tokens * cached_price
+        + completion_tokens * completion_price
+    ) / 1_000_000
+
+
+@dataclass
+class UsageRecord:
+    """
+    Token usage and cost of one analysis. A batched LLM call is split into
+    one record per receipt, with prompt tokens shared by receipt length.
+    """
+
+    ts: float
+    tenant: str
+    model: str
+    kind: str  # "single" | "batch"
+    receipts: int  # receipts sharing the LLM call
+    prompt_tokens: int
+    cached_tokens: int
+    completion_tokens: int
+    retries: int
+    cost_usd: float
+
+    @property
+    def day(self) -> str:
+        return datetime.fromtimestamp(self.ts, timezone.utc).strftime("%Y-%m-%d")
+
+
+def split_usage(
+    tenants: Sequence[Optional[str]],
+    texts: Sequence[str],
+    model: str,
+    kind: str,
+    prompt_tokens: int,
+    cached_tokens: int,
+    completion_tokens: int,
+    retries: int,
+) -> List[UsageRecord]:
+    """Build usage records for the receipts of one LLM call"""
+    now = time.time()
+    total_chars = sum(len(text) for text in texts) or 1
+    records = []
+    for tenant, text in zip(tenants, texts):
+        share = len(text) / total_chars if len(texts) > 1 else 1.0
+        prompt, cached = round(prompt_tokens * share), round(cached_tokens * share)
+        completion = round(completion_tokens / len(texts))
+        records.append(UsageRecord(
+            ts=now,
+            tenant=tenant or "anonymous",
+            model=model,
+            kind=kind,
+            receipts=len(texts),
+            prompt_tokens=prompt,
+            cached_tokens=cached,
+            completion_tokens=completion,
+            retries=retries,
+            cost_usd=cost_usd(model, prompt, cached, completion),
+        ))
+    return records
+
+
+class _Totals:
+    """Running sums for one report group"""
+
+    def __init__(self):
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.completion_tokens = 0
+        self.retries = 0
+        self.cost_usd = 0.0
+
+    def add(self, row: Dict[str, Any]) -> None:
+        self.requests += 1
+        self.prompt_tokens += row["prompt_tokens"]
+        self.cached_tokens += row["cached_tokens"]
+        self.completion_tokens += row["completion_tokens"]
+        self.retries += row["retries"]
+        self.cost_usd += row["cost_usd"]
+
+
+def _report_row(group: Dict[str, Any], requests: int, prompt: int, cached: int, completion: int, retries: int, cost: float) -> Dict[str, Any]:
+    return {
+        **group,
+        "requests": requests,
+        "prompt_tokens": prompt,
+        "cached_tokens": cached,
+        "completion_tokens": completion,
+        "retries": retries,
+        "cost_usd": round(cost, 6),
+        "avg_prompt_tokens": round(prompt / requests, 1) if requests else 0.0,
+    }
+
+
+def _check_group_by(group_by: Sequence[str]) -> None:
+    unknown = [column for column in group_by if column not in GROUP_COLUMNS]
+    if unknown:
+        raise ValueError(f"Cannot group usage by {', '.join(unknown)}; use: {', '.join(GROUP_COLUMNS)}")
+
+
+class SQLiteUsageStore:
+    """Usage records in a SQLite table, aggregated with SQL"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        conn = self._connect()
+        try:
+            # WAL lets reports read while the ledger appends
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_usage ("
+                "ts REAL NOT NULL, day TEXT NOT NULL, tenant TEXT NOT NULL, model TEXT NOT NULL, "
+                "kind TEXT NOT NULL, receipts INTEGER NOT NULL, prompt_tokens INTEGER NOT NULL, "
+                "cached_tokens INTEGER NOT NULL, completion_tokens INTEGER NOT NULL, "
+                "retries INTEGER NOT NULL, cost_usd REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS llm_usage_day ON llm_usage (day)")
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=10.0)
+
+    def append(self, records: List[UsageRecord]) -> None:
+        # Called from the ledger's writer thread only
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.path, timeout=10.0, check_same_thread=False)
+        with self._conn:
+            self._conn.executemany(
+                "INSERT INTO llm_usage VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (r.ts, r.day, r.tenant, r.model, r.kind, r.receipts, r.prompt_tokens,
+                     r.cached_tokens, r.completion_tokens, r.retries, r.cost_usd)
+                    for r in records
+                ],
+            )
+
+    def aggregate(
+        self, group_by: Sequence[str], since: Optional[str] = None, until: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        _check_group_by(group_by)
+        columns = ", ".join(group_by)
+        query = (
+            f"SELECT {columns + ', ' if columns else ''}COUNT(*), SUM(prompt_tokens), SUM(cached_tokens), "
+            f"SUM(completion_tokens), SUM(retries), SUM(cost_usd) FROM llm_usage "
+            f"WHERE day >= ? AND day <= ?"
+        )
+        if columns:
+            query += f" GROUP BY {columns} ORDER BY {columns}"
+        conn = self._connect()
+        try:
+            rows = conn.execute(query, (since or "", until or "9999-12-31")).fetchall()
+        finally:
+            conn.close()
+        return [
+            _report_row(dict(zip(group_by, row)), *row[len(group_by):])
+            for row in rows
+            if row[len(group_by)]
+        ]
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+class JSONLUsageStore:
+    """Usage records appended to a JSONL file, aggregated by streaming over it"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def append(self, records: List[UsageRecord]) -> None:
+        lines = "".join(json.dumps({**asdict(r), "day": r.day}) + "\n" for r in records)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(lines)
+
+    def aggregate(
+        self, group_by: Sequence[str], since: Optional[str] = None, until: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        _check_group_by(group_by)
+        groups: Dict[Tuple, _Totals] = {}
+        for row in self._rows():
+            if (since and row["day"] < since) or (until and row["day"] > until):
+                continue
+            key = tuple(row[column] for column in group_by)
+            groups.setdefault(key, _Totals()).add(row)
+        return [
+            _report_row(
+                dict(zip(group_by, key)), totals.requests, totals.prompt_tokens,
+                totals.cached_tokens, totals.completion_tokens, totals.retries, totals.cost_usd,
+            )
+            for key, totals in sorted(groups.items())
+        ]
+
+    def _rows(self) -> Iterable[Dict[str, Any]]:
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                # A torn last line from a crash mid-write is skipped
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+
+    def close(self) -> None:
+        pass
+
+
+class UsageLedger(BackgroundWriter):
+    """Append-only usage ledger, written by a BackgroundWriter thread"""
+
+    def __init__(self, store, batch_size: int = 200, flush_interval: float = 1.0, max_pending: int = 10_000):
+        super().__init__(store, "usage-ledger", batch_size, flush_interval, max_pending)
+
+    def aggregate(
+        self, group_by: Sequence[str] = ("tenant", "day", "model"),
+        since: Optional[str] = None, until: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Sum usage per group.
+
+        Args:
+            group_by: Columns from GROUP_COLUMNS
+            since: First day included (YYYY-MM-DD, UTC)
+            until: Last day included (YYYY-MM-DD, UTC)
+
+        Returns:
+            One row per group with requests, token sums, retries and cost
+        """
+        return self.store.aggregate(group_by, since, until)
+
+
+def create_usage_store(path: str):
+    """Open the store for a ledger path: JSONL for .jsonl files, SQLite otherwise"""
+    if path.endswith(".jsonl"):
+        return JSONLUsageStore(path)
+    return SQLiteUsageStore(path)
+
+
+def create_usage_ledger(settings: Settings) -> Optional[UsageLedger]:
+    """Build the usage ledger configured in settings, or None when disabled"""
+    if not settings.usage_ledger_path:
+        return None
+    return UsageLedger(create_usage_store(settings.usage_ledger_path))
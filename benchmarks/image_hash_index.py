@@ -0,0 +1,154 @@
+"""
+Image hash index benchmark: hashing cost, lookup latency, memory per million
+entries, and match accuracy on rendered receipt images, before and after
+confirming candidates. Candidates are confirmed by AnalyzerService itself;
+only the OCR of the total band is simulated, by reading the rendered text
+lines that fall inside the cropped rows.
+
+Usage:
+    python -m benchmarks.image_hash_index [--entries N]
+"""
+import argparse
+import hashlib
+import io
+import random
+import statistics
+import time
+import tracemalloc
+from unittest.mock import MagicMock
+
+from PIL import Image, ImageEnhance
+
+from app.services.analyzer import AnalyzerService
+from app.services.image_hash_index import HASH_BITS, ImageHashIndex, IndexedImage, dhash
+from benchmarks.receipt_corpus import LINE_HEIGHT, change_total, corpus, to_jpeg
+from benchmarks.receipt_corpus import render_receipt as render
+
+
+def reupload(image: Image.Image, rng: random.Random) -> bytes:
+    """The same photo resized, brightened and recompressed, as messengers do"""
+    scale = rng.uniform(0.5, 1.5)
+    image = image.resize((int(image.width * scale), int(image.height * scale)))
+    image = ImageEnhance.Brightness(image).enhance(rng.uniform(0.9, 1.1))
+    return to_jpeg(image, rng.randint(40, 95))
+
+
+def band_text(text: str, height: int, band) -> str:
+    """Lines of a rendered receipt whose middle lies in the band, as OCR of the crop would read"""
+    lines = text.splitlines()
+    scale = height / (40 + len(lines) * LINE_HEIGHT)
+    top, bottom = band
+    return "\n".join(
+        line for i, line in enumerate(lines) if top <= (20 + (i + 0.5) * LINE_HEIGHT) * scale < bottom
+    )
+
+
+class RenderedBandOCR:
+    """
+    Stands in for OCR of a crop of the current upload: the rows of the crop
+    are located in the decoded upload, and the rendered lines inside them read.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.image = None
+
+    def upload(self, text: str, content: bytes) -> None:
+        self.text = text
+        self.image = Image.open(io.BytesIO(content))
+        self.image.load()
+
+    def extract_image_text(self, crop: Image.Image) -> str:
+        row_bytes = self.image.width * len(self.image.getbands())
+        top = self.image.tobytes().find(crop.tobytes()) // row_bytes
+        return band_text(self.text, self.image.height, (top, top + crop.height))
+
+
+def reused(analyzer: AnalyzerService, content: bytes, text: str):
+    """(candidate found, text reused) for an upload of `text`, decided by AnalyzerService"""
+    analyzer.ocr.upload(text, content)
+    hits = analyzer.image_index.hits
+    _, stored_text = analyzer._lookup_image("upload.jpg", content)
+    return analyzer.image_index.hits > hits, stored_text
+
+
+def flip_bits(value: int, count: int, rng: random.Random) -> int:
+    for bit in rng.sample(range(HASH_BITS), count):
+        value ^= 1 << bit
+    return value
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--entries", type=int, default=1_000_000)
+    parser.add_argument("--lookups", type=int, default=10_000)
+    parser.add_argument("--images", type=int, default=200)
+    parser.add_argument("--max-distance", type=int, default=8)
+    args = parser.parse_args()
+    rng = random.Random(3)
+
+    # Hashing cost on a full-resolution photo-sized JPEG
+    photo = to_jpeg(render(corpus(1, seed=9, items=30)[0]).resize((1500, 4500)))
+    started = time.perf_counter()
+    for _ in range(20):
+        dhash(photo)
+    print(f"dhash of {len(photo) // 1024} KiB JPEG: {(time.perf_counter() - started) / 20 * 1000:.2f} ms")
+
+    # Memory and lookup latency (values share one string so only the index is measured)
+    hashes = [rng.getrandbits(HASH_BITS) for _ in range(args.entries)]
+    tracemalloc.start()
+    index = ImageHashIndex(max_entries=args.entries, max_distance=args.max_distance)
+    for image_hash in hashes:
+        index.add(image_hash, "text")
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print(
+        f"index memory: {memory / 2**20:.1f} MiB for {args.entries} entries "
+        f"({memory / args.entries:.1f} bytes/entry)"
+    )
+
+    for label, queries in (
+        ("hit", [flip_bits(rng.choice(hashes), rng.randint(0, args.max_distance), rng) for _ in range(args.lookups)]),
+        ("miss", [rng.getrandbits(HASH_BITS) for _ in range(args.lookups)]),
+    ):
+        latencies = []
+        for query in queries:
+            started = time.perf_counter()
+            index.lookup(query)
+            latencies.append((time.perf_counter() - started) * 1_000_000)
+        latencies.sort()
+        print(
+            f"lookup ({label}): median={statistics.median(latencies):.1f} us  "
+            f"p99={latencies[int(len(latencies) * 0.99)]:.1f} us"
+        )
+
+    # Accuracy on rendered receipts: re-uploaded copies, receipts from the
+    # same template with another total, and unrelated receipts
+    texts = corpus(args.images * 2, seed=11)
+    stored, unseen = texts[:args.images], texts[args.images:]
+    index = ImageHashIndex(max_entries=args.images, max_distance=args.max_distance)
+    for text in stored:
+        content = to_jpeg(render(text))
+        index.add(dhash(content), IndexedImage(text, hashlib.sha256(content).digest()))
+    analyzer = AnalyzerService(llm=MagicMock(), ocr=RenderedBandOCR(), image_index=index)
+
+    def probe(label, uploads):
+        candidates = correct = wrong = 0
+        for text, image in uploads:
+            content = reupload(image, rng) if label == "re-uploads" else to_jpeg(image)
+            found, value = reused(analyzer, content, text)
+            candidates += found
+            correct += value == text
+            wrong += value is not None and value != text
+        print(
+            f"{label}: {candidates}/{len(uploads)} index candidates, "
+            f"{correct} reused correctly, {wrong} reused wrongly"
+        )
+
+    probe("re-uploads", [(text, render(text)) for text in stored])
+    changed = [change_total(text, rng) for text in stored]
+    probe("same template, other total", [(text, render(text)) for text in changed])
+    probe("unrelated receipts", [(text, render(text)) for text in unseen])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+LLM micro-batching benchmark: throughput vs latency per batch window.
+
+Open-loop Poisson traffic of single-receipt analyses goes through
+AnalyzerService with the real LLMAnalyzer (retries, RPM rate limiter,
+worker-thread calls) against a simulated provider. A call takes a fixed
+overhead plus generation time per receipt in it, so batching saves the
+overhead and the per-request RPM budget but makes each answer wait for its
+batch-mates. A small share of batched receipts comes back invalid and is
+retried solo.
+
+Each window is reported with throughput (successful analyses per second),
+latency percentiles, provider calls, mean batch size, solo retries and failed
+analyses (rate-limit timeouts answered with the fallback result).
+
+Usage:
+    python -m benchmarks.llm_batching [--rate 10] [--rpm 120] [--windows 1:0 4:50 8:200]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import statistics
+import threading
+import time
+
+# Measure the LLM path only: no result reuse between requests
+os.environ.setdefault("NEAR_DUPLICATE_CACHE_SIZE", "0")
+os.environ.setdefault("IMAGE_HASH_INDEX_SIZE", "0")
+
+from unittest.mock import MagicMock  # noqa: E402
+
+from app.services.analyzer import AnalyzerService  # noqa: E402
+from app.services.llm_analyzer import LLMAnalyzer  # noqa: E402
+from app.services.llm_batcher import LLMBatcher  # noqa: E402
+from app.services.rate_limiter import MemoryBucketStore, TokenBucketRateLimiter  # noqa: E402
+from app.services.receipt_text import extract_total  # noqa: E402
+from benchmarks.receipt_corpus import corpus  # noqa: E402
+
+class SimulatedProvider:
+    """Chat completions stand-in with per-call overhead and per-receipt generation time"""
+
+    def __init__(self, overhead_ms: float, per_receipt_ms: float, invalid_rate: float, seed: int = 3):
+        self.overhead_ms = overhead_ms
+        self.per_receipt_ms = per_receipt_ms
+        self.invalid_rate = invalid_rate
+        self.rng = random.Random(seed)
+        self.calls = 0
+        self._lock = threading.Lock()
+        self.chat = MagicMock()
+        self.chat.completions.create = self.create
+
+    def _result(self, text: str, batched: bool) -> dict:
+        with self._lock:
+            invalid = batched and self.rng.random() < self.invalid_rate
+        return {
+            "merchant": text.strip().splitlines()[0], "total": (extract_total(text) or 0) / 100,
+            "currency": "dollars" if invalid else "USD", "date": None, "items": [],
+            "language": "en", "confidence": 0.9,
+        }
+
+    def create(self, model, messages, temperature):
+        content = messages[1]["content"]
+        with self._lock:
+            self.calls += 1
+        if not content.startswith("[{"):
+            receipts, body = 1, self._result(content, batched=False)
+        else:
+            batch = json.loads(content)
+            receipts = len(batch)
+            body = {"receipts": [dict(self._result(r["text"], batched=True), index=r["index"]) for r in batch]}
+        time.sleep((self.overhead_ms + self.per_receipt_ms * receipts) / 1000)
+
+        response = MagicMock()
+        response.choices[0].message.content = json.dumps(body)
+        return response
+
+
+async def run_window(args, max_size: int, max_wait_ms: float, texts) -> dict:
+    provider = SimulatedProvider(args.overhead_ms, args.per_receipt_ms, args.invalid_rate)
+    limiter = TokenBucketRateLimiter(MemoryBucketStore(), rpm=args.rpm, max_wait=args.max_wait)
+    llm = LLMAnalyzer(client=provider, rate_limiter=limiter)
+    batcher = LLMBatcher(llm, max_size=max_size, max_wait_ms=max_wait_ms) if max_size > 1 else None
+    analyzer = AnalyzerService(llm=llm, ocr=MagicMock(), batcher=batcher)
+    analyzer.batcher = batcher
+
+    rng = random.Random(11)
+    latencies, failed = [], 0
+
+    async def one(text: str) -> None:
+        nonlocal failed
+        started = time.perf_counter()
+        result = await analyzer.analyze_text(text)
+        latencies.append(time.perf_counter() - started)
+        failed += result.confidence <= 0.1
+
+    started = time.perf_counter()
+    tasks = []
+    for text in texts:
+        tasks.append(asyncio.ensure_future(one(text)))
+        await asyncio.sleep(rng.expovariate(args.rate))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "throughput": (len(texts) - failed) / elapsed,
+        "p50": statistics.median(latencies),
+        "p95": latencies[int(len(latencies) * 0.95)],
+        "calls": provider.calls,
+        "batch": batcher.batched_requests / batcher.batches_sent if batcher and batcher.batches_sent else 1.0,
+        "solo": batcher.solo_fallbacks if batcher else 0,
+        "failed": failed,
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--rate", type=float, default=10.0, help="Arriving requests per second")
+    parser.add_argument("--rpm", type=int, default=120, help="Provider requests per minute")
+    parser.add_argument("--max-wait", type=float, default=30.0, help="Rate-limit queue deadline, seconds")
+    parser.add_argument("--overhead-ms", type=float, default=400.0, help="Fixed latency per provider call")
+    parser.add_argument("--per-receipt-ms", type=float, default=150.0, help="Generation time per receipt")
+    parser.add_argument("--invalid-rate", type=float, default=0.02, help="Share of batched receipts returned invalid")
+    parser.add_argument(
+        "--windows", nargs="+", default=["1:0", "4:20", "4:50", "8:100", "8:200", "16:400"],
+        help="max_size:max_wait_ms pairs (1 disables batching)",
+    )
+    args = parser.parse_args()
+    # Failed analyses are counted in the table instead of logged
+    logging.disable(logging.CRITICAL)
+
+    texts = corpus(args.requests, seed=5)
+    print(
+        f"{args.requests} requests at {args.rate}/s, provider limit {args.rpm} RPM, "
+        f"call = {args.overhead_ms:.0f} ms + {args.per_receipt_ms:.0f} ms/receipt"
+    )
+    print(
+        f"{'window':>10} {'ok/s':>6} {'p50':>7} {'p95':>7} {'calls':>6} "
+        f"{'batch':>6} {'solo':>5} {'failed':>6}"
+    )
+    for window in args.windows:
+        size, wait = window.split(":")
+        stats = await run_window(args, int(size), float(wait), texts)
+        print(
+            f"{size + 'x' + wait + 'ms':>10} {stats['throughput']:>6.2f} {stats['p50']:>6.2f}s "
+            f"{stats['p95']:>6.2f}s {stats['calls']:>6} {stats['batch']:>6.1f} "
+            f"{stats['solo']:>5} {stats['failed']:>6}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
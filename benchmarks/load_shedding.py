@@ -0,0 +1,178 @@
+"""
+Load shedding benchmark: latency through a simulated provider incident.
+
+Open-loop Poisson traffic goes through AnalyzerService and the real
+LLMAnalyzer (retries, provider deadline, LLM worker threads) against a
+simulated provider for three equal phases: healthy, incident (slow calls, a
+share of them failing after a timeout) and recovered. Like the synchronous
+OpenAI client, a provider call blocks its worker thread until it answers or
+the request timeout passed by LLMAnalyzer expires; cancelling the waiting
+request does not free the thread. Each configuration is reported with
+latency percentiles over all requests and per phase, the share of heuristic
+results (shed or failed LLM calls), the number of provider calls made and the
+peak of busy provider threads.
+
+Usage:
+    python -m benchmarks.load_shedding [--rate 20] [--phase 10] [--incident-ms 4000]
+"""
+import argparse
+import asyncio
+import functools
+import json
+import logging
+import os
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+# Measure the LLM path only: no result reuse between requests
+os.environ.setdefault("NEAR_DUPLICATE_CACHE_SIZE", "0")
+os.environ.setdefault("IMAGE_HASH_INDEX_SIZE", "0")
+
+from unittest.mock import MagicMock  # noqa: E402
+
+from app.services.analyzer import AnalyzerService  # noqa: E402
+from app.services.llm_analyzer import LLMAnalyzer  # noqa: E402
+from app.services.load_shedder import LoadShedder  # noqa: E402
+from app.services.receipt_text import extract_total  # noqa: E402
+from benchmarks.receipt_corpus import corpus  # noqa: E402
+
+
+class SimulatedProvider:
+    """Synchronous chat completions stand-in whose latency and failure rate depend on the incident phase"""
+
+    def __init__(self, args, started: float):
+        self.args = args
+        self.started = started
+        self.rng = random.Random(7)
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.busy = 0
+        self.max_busy = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def with_options(self, timeout=None, max_retries=None):
+        return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(
+            create=functools.partial(self.create, timeout=timeout)
+        )))
+
+    def create(self, model, messages, temperature, timeout=None):
+        with self.lock:
+            self.calls += 1
+            self.busy += 1
+            self.max_busy = max(self.max_busy, self.busy)
+            elapsed = time.perf_counter() - self.started
+            if self.args.phase <= elapsed < 2 * self.args.phase:
+                latency = self.rng.uniform(0.5, 1.5) * self.args.incident_ms / 1000
+                failed = self.rng.random() < self.args.failure_rate
+            else:
+                latency, failed = self.rng.uniform(0.5, 1.5) * self.args.healthy_ms / 1000, False
+        try:
+            if timeout is not None and latency > timeout:
+                time.sleep(timeout)
+                raise TimeoutError("request timed out")
+            time.sleep(latency)
+            if failed:
+                raise TimeoutError("provider timeout")
+        finally:
+            with self.lock:
+                self.busy -= 1
+
+        text = messages[1]["content"]
+        response = SimpleNamespace(usage=None, choices=[SimpleNamespace(message=SimpleNamespace(content=json.dumps({
+            "merchant": text.strip().splitlines()[0], "total": (extract_total(text) or 0) / 100,
+            "currency": "USD", "date": None, "items": [], "language": "en", "confidence": 0.9,
+        })))])
+        return response
+
+
+def percentile(values, q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * q))] if values else 0.0
+
+
+async def run(args, shedder, texts) -> dict:
+    started = time.perf_counter()
+    provider = SimulatedProvider(args, started)
+    llm = LLMAnalyzer(
+        client=provider, timeout=shedder.llm_timeout if shedder else None, workers=args.workers
+    )
+    analyzer = AnalyzerService(llm=llm, ocr=MagicMock(), shedder=shedder)
+    analyzer.shedder = shedder
+
+    rng = random.Random(11)
+    samples = []  # (phase, latency, heuristic)
+
+    async def one(text: str) -> None:
+        phase = min(2, int((time.perf_counter() - started) / args.phase))
+        request_started = time.perf_counter()
+        result = await analyzer.analyze_text(text)
+        samples.append((phase, time.perf_counter() - request_started, result.needs_enrichment))
+
+    tasks = []
+    for text in texts:
+        if time.perf_counter() - started >= 3 * args.phase:
+            break
+        tasks.append(asyncio.ensure_future(one(text)))
+        await asyncio.sleep(rng.expovariate(args.rate))
+    await asyncio.gather(*tasks)
+    llm.close()
+
+    latencies = [latency for _, latency, _ in samples]
+    return {
+        "p50": percentile(latencies, 0.5),
+        "p99": percentile(latencies, 0.99),
+        "phase_p99": [percentile([l for p, l, _ in samples if p == phase], 0.99) for phase in range(3)],
+        "heuristic": sum(h for _, _, h in samples) / len(samples),
+        "calls": provider.calls,
+        "threads": provider.max_busy,
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rate", type=float, default=20.0, help="Arriving requests per second")
+    parser.add_argument("--phase", type=float, default=10.0, help="Seconds per phase")
+    parser.add_argument("--healthy-ms", type=float, default=300.0, help="Mean LLM latency when healthy")
+    parser.add_argument("--incident-ms", type=float, default=4000.0, help="Mean LLM latency during the incident")
+    parser.add_argument("--failure-rate", type=float, default=0.5, help="Share of incident calls that fail")
+    parser.add_argument("--workers", type=int, default=16, help="LLM worker threads (LLM_WORKERS)")
+    args = parser.parse_args()
+    # Shed and failed analyses are counted in the table instead of logged
+    logging.disable(logging.CRITICAL)
+
+    texts = corpus(int(args.rate * args.phase * 6), seed=5)
+    configs = {
+        "none": None,
+        "queue": lambda: LoadShedder(max_pending=int(args.rate)),
+        "breaker": lambda: LoadShedder(breaker_failures=5, breaker_cooldown=args.phase / 4),
+        "slo": lambda: LoadShedder(latency_slo_ms=args.healthy_ms * 3, latency_window=args.phase / 4),
+        "timeout": lambda: LoadShedder(llm_timeout=args.healthy_ms * 4 / 1000),
+        "all": lambda: LoadShedder(
+            max_pending=int(args.rate), breaker_failures=5, breaker_cooldown=args.phase / 4,
+            latency_slo_ms=args.healthy_ms * 3, latency_window=args.phase / 4,
+            llm_timeout=args.healthy_ms * 4 / 1000,
+        ),
+    }
+    print(
+        f"{args.rate}/s for 3 x {args.phase:.0f} s, LLM {args.healthy_ms:.0f} ms, "
+        f"incident {args.incident_ms:.0f} ms with {args.failure_rate:.0%} failures, "
+        f"{args.workers} LLM threads"
+    )
+    print(
+        f"{'shedding':>9} {'p50':>7} {'p99':>7} {'p99 healthy':>12} {'p99 incident':>13} "
+        f"{'p99 recovered':>14} {'heuristic':>10} {'calls':>6} {'threads':>8}"
+    )
+    for name, factory in configs.items():
+        stats = await run(args, factory() if factory else None, texts)
+        healthy, incident, recovered = stats["phase_p99"]
+        print(
+            f"{name:>9} {stats['p50']:>6.2f}s {stats['p99']:>6.2f}s {healthy:>11.2f}s "
+            f"{incident:>12.2f}s {recovered:>13.2f}s {stats['heuristic']:>10.1%} {stats['calls']:>6} "
+            f"{stats['threads']:>8}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
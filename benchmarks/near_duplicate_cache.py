@@ -0,0 +1,94 @@
+"""
+Near-duplicate cache benchmark: lookup cost, reuse rate and false-reuse rate.
+
+A cache is filled with receipts from the synthetic corpus, then probed with:
+  - noisy re-reads of cached receipts (should be reused),
+  - distinct receipts not in the cache (must not be reused),
+  - cached receipts with one item price changed, with decimal amounts and
+    with whole-number amounts (RUB, JPY style), whose texts are only a few
+    fingerprint bits apart (must not be reused).
+
+Usage:
+    python -m benchmarks.near_duplicate_cache [--size N] [--noise RATE]
+"""
+import argparse
+import random
+import statistics
+import time
+
+from app.schemas.receipt import ReceiptResult
+from app.services.near_duplicate_cache import NearDuplicateCache
+from app.services.receipt_text import extract_total
+from benchmarks.receipt_corpus import change_item_price, corpus, ocr_noise
+
+
+def _result(text: str) -> ReceiptResult:
+    total = extract_total(text) or 0
+    return ReceiptResult(
+        type="text", merchant=text.splitlines()[0], total=total / 100, currency="USD",
+        date=None, items=[], confidence=0.9, language="en",
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", type=int, default=10_000)
+    parser.add_argument("--probes", type=int, default=2_000)
+    parser.add_argument("--noise", type=float, default=0.02)
+    parser.add_argument("--max-distance", type=int, default=6)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    cached = corpus(args.size, seed=1)
+    unseen = corpus(args.probes, seed=2)
+    cache = NearDuplicateCache(max_entries=args.size, max_distance=args.max_distance)
+
+    started = time.perf_counter()
+    results = {}
+    for text in cached:
+        result = _result(text)
+        results[id(result)] = text
+        cache.add(text, result)
+    add_ms = (time.perf_counter() - started) * 1000 / len(cached)
+
+    latencies = []
+    reused = wrong = 0
+    for text in rng.sample(cached, min(args.probes, len(cached))):
+        started = time.perf_counter()
+        hit = cache.lookup(ocr_noise(text, rng, args.noise))
+        latencies.append((time.perf_counter() - started) * 1000)
+        if hit is not None:
+            reused += 1
+            if hit.merchant != text.splitlines()[0] or hit.total != (extract_total(text) or 0) / 100:
+                wrong += 1
+
+    false_reuse = 0
+    for text in unseen:
+        started = time.perf_counter()
+        hit = cache.lookup(text)
+        latencies.append((time.perf_counter() - started) * 1000)
+        if hit is not None:
+            false_reuse += 1
+
+    # Same layout, different numbers: one changed price
+    whole = corpus(args.probes, seed=3, whole=True)
+    for text in whole:
+        cache.add(text, _result(text))
+    siblings = [change_item_price(text, rng) for text in rng.sample(cached, min(args.probes, len(cached)))]
+    siblings += [change_item_price(text, rng) for text in whole]
+    false_sibling = sum(cache.lookup(text) is not None for text in siblings)
+
+    latencies.sort()
+    probes = min(args.probes, len(cached))
+    print(f"entries: {len(cache)}  add: {add_ms:.3f} ms/entry")
+    print(
+        f"lookup: median={statistics.median(latencies):.3f} ms  "
+        f"p99={latencies[int(len(latencies) * 0.99)]:.3f} ms"
+    )
+    print(f"noisy duplicates reused: {reused}/{probes} ({reused / probes:.1%}), wrong result: {wrong}")
+    print(f"false reuse on unseen receipts: {false_reuse}/{len(unseen)} ({false_reuse / len(unseen):.2%})")
+    print(f"false reuse on changed-price receipts (decimal and whole amounts): {false_sibling}/{len(siblings)}")
+
+
+if __name__ == "__main__":
+    main()
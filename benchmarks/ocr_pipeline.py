@@ -0,0 +1,135 @@
+"""
+Pipelined OCR + LLM benchmark: end-to-end latency of AnalyzerService.analyze
+on tall receipts, sequential path vs banded pipeline with speculative LLM start.
+
+By default OCR and LLM latency are simulated: OCR takes time proportional to
+the number of pixel rows it reads (with --ocr-workers bands at a time, as
+on a host with that many cores), the LLM takes a base latency plus time per
+input character. Simulated calls sleep, so band parallelism behaves like on a
+multi-core host even here. With --real, tesseract runs for OCR (the LLM stays simulated).
+
+Usage:
+    python -m benchmarks.ocr_pipeline [--bands N] [--real]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+# Measure the OCR/LLM path only: no result reuse between runs
+os.environ.setdefault("NEAR_DUPLICATE_CACHE_SIZE", "0")
+os.environ.setdefault("IMAGE_HASH_INDEX_SIZE", "0")
+
+from unittest.mock import MagicMock  # noqa: E402
+
+from app.services.analyzer import AnalyzerService  # noqa: E402
+from app.services.ocr_pipeline import OCRPipeline  # noqa: E402
+from app.services.ocr_service import OCRService  # noqa: E402
+from app.services.receipt_text import extract_total  # noqa: E402
+from benchmarks.receipt_corpus import LINE_HEIGHT, corpus, render_receipt, to_jpeg  # noqa: E402
+
+
+class SimulatedOCR(OCRService):
+    """Returns the rendered lines inside an image band after a row-proportional delay"""
+
+    def __init__(self, lines, ms_per_row: float):
+        super().__init__()
+        self.lines = lines
+        self.ms_per_row = ms_per_row
+
+    def extract_text(self, file_path: str) -> str:
+        from PIL import Image
+
+        return self.extract_image_text(Image.open(file_path))
+
+    def extract_image_text(self, image) -> str:
+        time.sleep(image.height * self.ms_per_row / 1000)
+        top = image.info.get("top", 0)
+        return "\n".join(
+            line
+            for i, line in enumerate(self.lines)
+            if top <= 20 + i * LINE_HEIGHT + LINE_HEIGHT // 2 < top + image.height
+        )
+
+
+class OffsetPipeline(OCRPipeline):
+    """Records each band's vertical offset so the simulated OCR knows what it sees"""
+
+    def split(self, image):
+        bands = super().split(image)
+        top = 0
+        for band in bands:
+            band.info["top"] = top
+            top += band.height
+        return bands
+
+
+def _llm(base_ms: float, ms_per_char: float):
+    async def analyze_text(text: str) -> dict:
+        await asyncio.sleep((base_ms + ms_per_char * len(text)) / 1000)
+        return {
+            "merchant": text.splitlines()[0], "total": (extract_total(text) or 0) / 100,
+            "currency": "USD", "date": None, "items": [], "language": "en", "confidence": 0.9,
+        }
+    return analyze_text
+
+
+async def _measure(analyzer: AnalyzerService, content: bytes, runs: int) -> float:
+    upload = MagicMock()
+    upload.filename = "bench_receipt.jpg"
+
+    async def read():
+        return content
+
+    upload.read = read
+    latencies = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        await analyzer.analyze(file=upload)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return statistics.median(latencies)
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--bands", type=int, default=4)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--ocr-ms-per-row", type=float, default=1.0)
+    parser.add_argument("--llm-base-ms", type=float, default=800.0)
+    parser.add_argument("--llm-ms-per-char", type=float, default=0.3)
+    parser.add_argument("--ocr-workers", type=int, default=2, help="Band OCR threads (CPU cores)")
+    parser.add_argument("--footer-lines", type=int, default=12, help="Promo/policy lines after the total")
+    parser.add_argument("--real", action="store_true", help="Use tesseract instead of simulated OCR")
+    args = parser.parse_args()
+
+    print(
+        f"{'items':>5} {'height':>6} {'sequential':>11} {'pipelined':>10} "
+        f"{'speedup':>8} {'early':>5} {'redos':>5}"
+    )
+    footer = [f"Return policy line {i}: keep this receipt for exchanges" for i in range(args.footer_lines)]
+    for items in (10, 30, 60, 100):
+        text = "\n".join([corpus(1, seed=items, items=items)[0], *footer])
+        image = render_receipt(text)
+        content = to_jpeg(image)
+        ocr = OCRService() if args.real else SimulatedOCR(text.splitlines(), args.ocr_ms_per_row)
+        pipeline = (OCRPipeline if args.real else OffsetPipeline)(
+            ocr, bands=args.bands, min_aspect_ratio=0, workers=args.ocr_workers
+        )
+        # One analyzer without and one with the pipeline, sharing the simulated LLM
+        llm = MagicMock()
+        llm.analyze_text = _llm(args.llm_base_ms, args.llm_ms_per_char)
+        sequential = AnalyzerService(llm=llm, ocr=ocr)
+        sequential.pipeline = None
+        pipelined = AnalyzerService(llm=llm, ocr=ocr, pipeline=pipeline)
+
+        seq_ms = await _measure(sequential, content, args.runs)
+        pipe_ms = await _measure(pipelined, content, args.runs)
+        print(
+            f"{items:>5} {image.height:>6} {seq_ms:>9.0f}ms {pipe_ms:>8.0f}ms "
+            f"{seq_ms / pipe_ms:>7.2f}x {pipeline.speculative_hits:>5} {pipeline.speculative_redos:>5}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,115 @@
+"""
+Deterministic synthetic receipt corpus shared by the benchmarks.
+
+Receipts look like OCR output of real till slips: a merchant header, dated
+item lines, subtotal, tax and total. `ocr_noise` imitates re-photographing
+the same receipt (character confusions, dropped characters, spacing).
+"""
+import io
+import random
+from typing import List
+
+MERCHANTS = [
+    "FRESH MARKET", "CITY PHARMACY", "CORNER CAFE", "HOME & GARDEN",
+    "TECH WORLD", "BOOK NOOK", "QUICK FUEL", "GREEN GROCER",
+]
+PRODUCTS = [
+    "Milk 1L", "Bread white", "Eggs 10pcs", "Coffee beans", "Orange juice",
+    "Bananas", "Chicken breast", "Rice 1kg", "Pasta", "Tomatoes", "Cheese",
+    "Yogurt", "Apples", "Butter", "Olive oil", "Paper towels", "Shampoo",
+    "Toothpaste", "Batteries AA", "Notebook", "Pen blue", "Chocolate bar",
+]
+# Vertical pixels per rendered text line
+LINE_HEIGHT = 28
+
+# Characters tesseract commonly confuses (never applied to digits, so amounts survive)
+CONFUSIONS = {"o": "0", "l": "1", "e": "c", "a": "o", "i": "l", "s": "5", "B": "8", "m": "rn"}
+
+
+def _amount(cents: int, whole: bool) -> str:
+    return str(cents // 100) if whole else f"{cents / 100:.2f}"
+
+
+def generate_receipt(rng: random.Random, items: int = None, whole: bool = False) -> str:
+    """Return one synthetic receipt text; `whole` prints amounts without decimals (RUB, JPY style)"""
+    count = items or rng.randint(3, 12)
+    lines = [
+        rng.choice(MERCHANTS),
+        f"{rng.randint(1, 999)} Main Street",
+        f"Date: 2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} {rng.randint(8, 21):02d}:{rng.randint(0, 59):02d}",
+        f"Receipt #{rng.randint(10000, 99999)}",
+    ]
+    subtotal = 0
+    for _ in range(count):
+        qty = rng.randint(1, 3)
+        price = rng.randint(50, 5000)
+        subtotal += qty * price
+        lines.append(f"{rng.choice(PRODUCTS)} {qty} x {_amount(price, whole)}  {_amount(qty * price, whole)}")
+    tax = subtotal * 7 // 100
+    lines += [
+        f"Subtotal {_amount(subtotal, whole)}",
+        f"Tax 7% {_amount(tax, whole)}",
+        f"TOTAL {_amount(subtotal + tax, whole)}",
+        "Thank you for shopping!",
+    ]
+    return "\n".join(lines)
+
+
+def ocr_noise(text: str, rng: random.Random, rate: float = 0.02) -> str:
+    """Return text as a second OCR pass of the same receipt might read it"""
+    out: List[str] = []
+    for ch in text:
+        roll = rng.random()
+        if ch.isdigit() or roll > rate:
+            out.append(ch)
+        elif roll < rate / 3:
+            continue  # dropped character
+        elif roll < rate * 2 / 3:
+            out.append(ch + " ")  # spurious space
+        else:
+            out.append(CONFUSIONS.get(ch, ch))
+    return "".join(out)
+
+
+def corpus(size: int, seed: int = 42, items: int = None, whole: bool = False) -> List[str]:
+    """Return `size` distinct receipts"""
+    rng = random.Random(seed)
+    return [generate_receipt(rng, items, whole) for _ in range(size)]
+
+
+def change_item_price(text: str, rng: random.Random) -> str:
+    """Return the receipt with one item's price changed, the rest of the text (total included) kept"""
+    lines = text.splitlines()
+    item_lines = [i for i, line in enumerate(lines) if " x " in line]
+    i = rng.choice(item_lines)
+    head, _, amount = lines[i].rpartition(" ")
+    digit = int(amount[-1])
+    lines[i] = f"{head} {amount[:-1]}{(digit + rng.randint(1, 9)) % 10}"
+    return "\n".join(lines)
+
+
+def change_total(text: str, rng: random.Random) -> str:
+    """Return the receipt with the last digit of its total changed, as on another sale from the same till"""
+    lines = text.splitlines()
+    i = max(i for i, line in enumerate(lines) if line.startswith("TOTAL "))
+    digit = int(lines[i][-1])
+    lines[i] = f"{lines[i][:-1]}{(digit + rng.randint(1, 9)) % 10}"
+    return "\n".join(lines)
+
+
+def render_receipt(text: str, width: int = 600):
+    """Render receipt text as a grayscale till-slip image (LINE_HEIGHT px per line)"""
+    from PIL import Image, ImageDraw
+
+    lines = text.splitlines()
+    image = Image.new("L", (width, 40 + len(lines) * LINE_HEIGHT), 245)
+    draw = ImageDraw.Draw(image)
+    for i, line in enumerate(lines):
+        draw.text((30, 20 + i * LINE_HEIGHT), line, fill=20, font_size=20)
+    return image
+
+
+def to_jpeg(image, quality: int = 85) -> bytes:
+    buffer = io.BytesIO()
+    image.convert("RGB").save(buffer, "JPEG", quality=quality)
+    return buffer.getvalue()
@@ -0,0 +1,124 @@
+"""
+Result serialization benchmark: LLM JSON to HTTP response body.
+
+Times the per-request path after the LLM answers, for receipts with 10 to
+1,000 items:
+  - legacy: json.loads, ReceiptLLMResult(**raw), a fresh ReceiptItem per item
+    in a new ReceiptResult, a deep copy into the near-duplicate cache, then
+    FastAPI's response_model handling (validate + serialize with the
+    installed FastAPI, and jsonable_encoder + json.dumps as older releases do),
+  - current: LLMAnalyzer parsing, AnalyzerService._validate_result, the
+    cache copy and the response body written by the /analyze route.
+
+Usage:
+    python -m benchmarks.serialization [--items 10 100 1000]
+"""
+import argparse
+import asyncio
+import json
+import time
+from typing import Callable
+from unittest.mock import MagicMock
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.routing import serialize_response
+from pydantic import BaseModel
+from pydantic_core import from_json
+
+from app.routers.analyze import router
+from app.schemas.receipt import ReceiptItem, ReceiptResult
+from app.schemas.receipt_llm import ReceiptLLMResult
+from app.services.analyzer import AnalyzerService
+from app.services.near_duplicate_cache import _copy_result
+
+
+class LegacyItem(BaseModel):
+    name: str
+    price: float
+
+
+class LegacyLLMResult(ReceiptLLMResult):
+    """LLM schema with its own item model, as before items were shared"""
+
+    items: list[LegacyItem]
+
+
+def llm_content(items: int) -> str:
+    return json.dumps({
+        "merchant": "Corner Market",
+        "total": round(sum(1.25 + i * 0.5 for i in range(items)), 2),
+        "currency": "USD",
+        "date": "2024-03-01",
+        "items": [{"name": f"Item {i} organic whole milk 1L", "price": 1.25 + i * 0.5} for i in range(items)],
+        "language": "en",
+        "confidence": 0.92,
+    })
+
+
+def legacy_result(content: str) -> ReceiptResult:
+    llm_result = LegacyLLMResult(**json.loads(content))
+    return ReceiptResult(
+        type="text",
+        merchant=llm_result.merchant,
+        total=llm_result.total,
+        currency=llm_result.currency,
+        date=llm_result.date,
+        items=[ReceiptItem(name=item.name, price=item.price) for item in llm_result.items],
+        confidence=llm_result.confidence,
+        language=llm_result.language,
+    )
+
+
+def timed(fn: Callable[[], object], budget: float = 0.5) -> float:
+    """Mean time per call over a fixed time budget, in microseconds"""
+    fn()
+    runs, started = 0, time.perf_counter()
+    while time.perf_counter() - started < budget:
+        fn()
+        runs += 1
+    return (time.perf_counter() - started) / runs * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--items", type=int, nargs="+", default=[10, 100, 1000])
+    args = parser.parse_args()
+
+    analyzer = AnalyzerService(llm=MagicMock(), ocr=MagicMock())
+    response_field = router.routes[0].response_field
+    loop = asyncio.new_event_loop()
+
+    def fastapi_response(result: ReceiptResult) -> bytes:
+        return loop.run_until_complete(
+            serialize_response(field=response_field, response_content=result, dump_json=True)
+        )
+
+    print(f"{'items':>6} {'legacy (installed FastAPI)':>27} {'legacy (jsonable_encoder)':>26} {'current':>10} {'speedup':>8}")
+    for items in args.items:
+        content = llm_content(items)
+
+        def legacy_installed():
+            result = legacy_result(content)
+            result.model_copy(deep=True)
+            return fastapi_response(result)
+
+        def legacy_encoder():
+            result = legacy_result(content)
+            result.model_copy(deep=True)
+            return json.dumps(jsonable_encoder(result)).encode()
+
+        def current():
+            result = analyzer._validate_result(from_json(content), "text")
+            _copy_result(result)
+            return result.model_dump_json()
+
+        assert json.loads(legacy_installed()) == json.loads(current())
+        installed_us, encoder_us, current_us = timed(legacy_installed), timed(legacy_encoder), timed(current)
+        print(
+            f"{items:>6} {installed_us:>24.0f} us {encoder_us:>23.0f} us "
+            f"{current_us:>7.0f} us {installed_us / current_us:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Startup benchmark: import time of app.main and time to first /analyze request.
+
+Each sample runs in a fresh interpreter so module caches do not skew results.
+The LLM call is stubbed so only application startup is measured.
+
+Usage:
+    python -m benchmarks.startup [--runs N]
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+_SAMPLE = r"""
+import json, time
+t0 = time.perf_counter()
+import app.main
+t_import = time.perf_counter() - t0
+
+from unittest.mock import AsyncMock, patch
+from fastapi.testclient import TestClient
+
+stub = {"merchant": None, "total": 1.0, "currency": "USD", "date": None,
+        "items": [], "language": "en", "confidence": 0.9}
+with patch("app.services.llm_analyzer.LLMAnalyzer.analyze_text", AsyncMock(return_value=stub)):
+    with TestClient(app.main.app) as client:
+        response = client.post("/analyze", data={"text": "Total: 1.00 USD"})
+        t_first = time.perf_counter() - t0
+        assert response.status_code == 200, response.text
+print(json.dumps({"import": t_import, "first_request": t_first}))
+"""
+
+
+def _sample() -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", _SAMPLE],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    samples = [_sample() for _ in range(args.runs)]
+    for key in ("import", "first_request"):
+        values = [s[key] * 1000 for s in samples]
+        print(
+            f"{key:>14}: median={statistics.median(values):7.1f} ms  "
+            f"min={min(values):7.1f} ms  max={max(values):7.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
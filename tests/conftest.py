@@ -6,6 +6,7 @@ from unittest.mock import AsyncMock, MagicMock, patch
 from fastapi.testclient import TestClient
 from httpx import AsyncClient, ASGITransport
 from app.main import app
+from app.core.dependencies import get_analyzer
 
 
 @pytest.fixture
@@ -53,3 +54,12 @@ async def async_client():
     async with AsyncClient(transport=transport, base_url="http://test") as ac:
         yield ac
 
+
+
+@pytest.fixture
+def mock_analyzer():
+    """Mock AnalyzerService injected into the app via dependency override"""
+    analyzer = MagicMock()
+    app.dependency_overrides[get_analyzer] = lambda: analyzer
+    yield analyzer
+    app.dependency_overrides.pop(get_analyzer, None)
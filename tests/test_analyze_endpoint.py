@@ -2,7 +2,7 @@
 Tests for /analyze FastAPI endpoint
 """
 import pytest
-from unittest.mock import AsyncMock, patch, MagicMock
+from unittest.mock import AsyncMock
 from httpx import AsyncClient
 from app.main import app
 from app.schemas.receipt import ReceiptResult
@@ -12,99 +12,97 @@ class TestAnalyzeEndpoint:
     """Test suite for /analyze endpoint"""
 
     @pytest.mark.asyncio
-    async def test_analyze_with_text_only(self, async_client, mock_llm_response):
+    async def test_analyze_with_text_only(self, async_client, mock_llm_response, mock_analyzer):
         """Test endpoint with text input only"""
-        with patch('app.routers.analyze.analyzer') as mock_analyzer:
-            # Create mock ReceiptResult
-            from app.schemas.receipt import ReceiptResult, ReceiptItem
-            mock_result = ReceiptResult(
-                type="text",
-                merchant="Test Store",
-                total=150.50,
-                currency="USD",
-                date="2024-01-15",
-                items=[
-                    ReceiptItem(name="Item 1", price=50.00),
-                    ReceiptItem(name="Item 2", price=100.50)
-                ],
-                confidence=0.95,
-                language="en"
-            )
+        # Create mock ReceiptResult
+        from app.schemas.receipt import ReceiptResult, ReceiptItem
+        mock_result = ReceiptResult(
+            type="text",
+            merchant="Test Store",
+            total=150.50,
+            currency="USD",
+            date="2024-01-15",
+            items=[
+                ReceiptItem(name="Item 1", price=50.00),
+                ReceiptItem(name="Item 2", price=100.50)
+            ],
+            confidence=0.95,
+            language="en"
+        )
 
-            mock_analyzer.analyze = AsyncMock(return_value=mock_result)
+        mock_analyzer.analyze = AsyncMock(return_value=mock_result)
 
-            # Make request with text
-            response = await async_client.post(
-                "/analyze",
-                data={"text": "Test receipt text"}
-            )
+        # Make request with text
+        response = await async_client.post(
+            "/analyze",
+            data={"text": "Test receipt text"}
+        )
 
-            # Verify response
-            assert response.status_code == 200
-            data = response.json()
-
-            # Verify structure matches ReceiptResult schema
-            assert data["type"] == "text"
-            assert data["merchant"] == "Test Store"
-            assert data["total"] == 150.50
-            assert data["currency"] == "USD"
-            assert data["date"] == "2024-01-15"
-            assert data["confidence"] == 0.95
-            assert data["language"] == "en"
-            assert len(data["items"]) == 2
-            assert data["items"][0]["name"] == "Item 1"
-            assert data["items"][0]["price"] == 50.00
-
-            # Verify service was called correctly
-            mock_analyzer.analyze.assert_called_once()
-            call_kwargs = mock_analyzer.analyze.call_args[1]
-            assert call_kwargs["text"] == "Test receipt text"
-            assert call_kwargs["file"] is None
+        # Verify response
+        assert response.status_code == 200
+        data = response.json()
+
+        # Verify structure matches ReceiptResult schema
+        assert data["type"] == "text"
+        assert data["merchant"] == "Test Store"
+        assert data["total"] == 150.50
+        assert data["currency"] == "USD"
+        assert data["date"] == "2024-01-15"
+        assert data["confidence"] == 0.95
+        assert data["language"] == "en"
+        assert len(data["items"]) == 2
+        assert data["items"][0]["name"] == "Item 1"
+        assert data["items"][0]["price"] == 50.00
+
+        # Verify service was called correctly
+        mock_analyzer.analyze.assert_called_once()
+        call_kwargs = mock_analyzer.analyze.call_args[1]
+        assert call_kwargs["text"] == "Test receipt text"
+        assert call_kwargs["file"] is None
 
     @pytest.mark.asyncio
-    async def test_analyze_with_file_only(self, async_client, mock_llm_response):
+    async def test_analyze_with_file_only(self, async_client, mock_llm_response, mock_analyzer):
         """Test endpoint with file input only"""
-        with patch('app.routers.analyze.analyzer') as mock_analyzer:
-            from app.schemas.receipt import ReceiptResult, ReceiptItem
-            mock_result = ReceiptResult(
-                type="text",
-                merchant="Store from OCR",
-                total=200.0,
-                currency="EUR",
-                date=None,
-                items=[ReceiptItem(name="OCR Item", price=200.0)],
-                confidence=0.85,
-                language="ru"
-            )
+        from app.schemas.receipt import ReceiptResult, ReceiptItem
+        mock_result = ReceiptResult(
+            type="text",
+            merchant="Store from OCR",
+            total=200.0,
+            currency="EUR",
+            date=None,
+            items=[ReceiptItem(name="OCR Item", price=200.0)],
+            confidence=0.85,
+            language="ru"
+        )
 
-            mock_analyzer.analyze = AsyncMock(return_value=mock_result)
+        mock_analyzer.analyze = AsyncMock(return_value=mock_result)
 
-            # Create fake file content
-            files = {"file": ("receipt.jpg", b"fake image data", "image/jpeg")}
+        # Create fake file content
+        files = {"file": ("receipt.jpg", b"fake image data", "image/jpeg")}
 
-            # Make request with file
-            response = await async_client.post(
-                "/analyze",
-                files=files
-            )
+        # Make request with file
+        response = await async_client.post(
+            "/analyze",
+            files=files
+        )
 
-            # Verify response
-            assert response.status_code == 200
-            data = response.json()
+        # Verify response
+        assert response.status_code == 200
+        data = response.json()
 
-            # Verify structure
-            assert data["type"] == "text"
-            assert data["merchant"] == "Store from OCR"
-            assert data["total"] == 200.0
-            assert data["currency"] == "EUR"
-            assert data["date"] is None
-            assert len(data["items"]) == 1
+        # Verify structure
+        assert data["type"] == "text"
+        assert data["merchant"] == "Store from OCR"
+        assert data["total"] == 200.0
+        assert data["currency"] == "EUR"
+        assert data["date"] is None
+        assert len(data["items"]) == 1
 
-            # Verify service was called with file
-            mock_analyzer.analyze.assert_called_once()
-            call_kwargs = mock_analyzer.analyze.call_args[1]
-            assert call_kwargs["text"] is None
-            assert call_kwargs["file"] is not None
+        # Verify service was called with file
+        mock_analyzer.analyze.assert_called_once()
+        call_kwargs = mock_analyzer.analyze.call_args[1]
+        assert call_kwargs["text"] is None
+        assert call_kwargs["file"] is not None
 
     @pytest.mark.asyncio
     async def test_analyze_no_input_returns_400(self, async_client):
@@ -130,41 +128,53 @@ class TestAnalyzeEndpoint:
         assert "Provide only one input source" in response.json()["detail"]
 
     @pytest.mark.asyncio
-    async def test_analyze_response_validates_against_schema(self, async_client, mock_llm_response):
+    async def test_analyze_response_validates_against_schema(self, async_client, mock_llm_response, mock_analyzer):
         """Test that endpoint response matches ReceiptResult Pydantic schema"""
-        with patch('app.routers.analyze.analyzer') as mock_analyzer:
-            from app.schemas.receipt import ReceiptResult, ReceiptItem
-            mock_result = ReceiptResult(
-                type="text",
-                merchant="Schema Test",
-                total=99.99,
-                currency="THB",
-                date="2024-12-31",
-                items=[
-                    ReceiptItem(name="Test Item", price=99.99)
-                ],
-                confidence=0.99,
-                language="th"
-            )
+        from app.schemas.receipt import ReceiptResult, ReceiptItem
+        mock_result = ReceiptResult(
+            type="text",
+            merchant="Schema Test",
+            total=99.99,
+            currency="THB",
+            date="2024-12-31",
+            items=[
+                ReceiptItem(name="Test Item", price=99.99)
+            ],
+            confidence=0.99,
+            language="th"
+        )
 
-            mock_analyzer.analyze = AsyncMock(return_value=mock_result)
+        mock_analyzer.analyze = AsyncMock(return_value=mock_result)
 
-            response = await async_client.post(
-                "/analyze",
-                data={"text": "test"}
-            )
+        response = await async_client.post(
+            "/analyze",
+            data={"text": "test"}
+        )
 
-            assert response.status_code == 200
-            data = response.json()
+        assert response.status_code == 200
+        data = response.json()
 
-            # Validate response can be parsed as ReceiptResult
-            result = ReceiptResult(**data)
-            assert isinstance(result, ReceiptResult)
-            assert result.type == "text"
-            assert result.merchant == "Schema Test"
-            assert result.total == 99.99
-            assert result.currency == "THB"
-            assert result.language == "th"
+        # Validate response can be parsed as ReceiptResult
+        result = ReceiptResult(**data)
+        assert isinstance(result, ReceiptResult)
+        assert result.type == "text"
+        assert result.merchant == "Schema Test"
+        assert result.total == 99.99
+        assert result.currency == "THB"
+        assert result.language == "th"
+
+    @pytest.mark.asyncio
+    async def test_analyze_response_is_service_result_json(self, async_client, mock_llm_response, mock_analyzer):
+        """Test the response body is the service result serialized once, as JSON"""
+        from app.schemas.receipt import ReceiptResult
+        mock_result = ReceiptResult(type="text", **mock_llm_response)
+        mock_analyzer.analyze = AsyncMock(return_value=mock_result)
+
+        response = await async_client.post("/analyze", data={"text": "test receipt"})
+
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/json"
+        assert response.content == mock_result.model_dump_json().encode()
 
     @pytest.mark.asyncio
     async def test_analyze_empty_text_returns_400(self, async_client):
@@ -178,33 +188,92 @@ class TestAnalyzeEndpoint:
         assert response.status_code == 400
 
     @pytest.mark.asyncio
-    async def test_analyze_with_null_values_in_response(self, async_client):
+    async def test_analyze_with_null_values_in_response(self, async_client, mock_analyzer):
         """Test endpoint handles null values correctly in response"""
-        with patch('app.routers.analyze.analyzer') as mock_analyzer:
-            from app.schemas.receipt import ReceiptResult, ReceiptItem
-            mock_result = ReceiptResult(
-                type="text",
-                merchant=None,
-                total=50.0,
-                currency="RUB",
-                date=None,
-                items=[ReceiptItem(name="Item", price=50.0)],
-                confidence=0.7,
-                language="auto"
-            )
+        from app.schemas.receipt import ReceiptResult, ReceiptItem
+        mock_result = ReceiptResult(
+            type="text",
+            merchant=None,
+            total=50.0,
+            currency="RUB",
+            date=None,
+            items=[ReceiptItem(name="Item", price=50.0)],
+            confidence=0.7,
+            language="auto"
+        )
 
-            mock_analyzer.analyze = AsyncMock(return_value=mock_result)
+        mock_analyzer.analyze = AsyncMock(return_value=mock_result)
 
+        response = await async_client.post(
+            "/analyze",
+            data={"text": "test"}
+        )
+
+        assert response.status_code == 200
+        data = response.json()
+
+        # Verify null values are included in JSON
+        assert data["merchant"] is None
+        assert data["date"] is None
+        assert data["total"] == 50.0
+
+
+    @pytest.mark.asyncio
+    async def test_analyze_accounts_request_to_tenant(self, async_client, mock_analyzer):
+        """Test tenant and priority headers are passed to the scheduler"""
+        from app.core.dependencies import get_scheduler
+        from app.services.scheduler import FairScheduler
+        from app.schemas.receipt import ReceiptResult
+
+        scheduler = FairScheduler()
+        app.dependency_overrides[get_scheduler] = lambda: scheduler
+        mock_analyzer.analyze = AsyncMock(return_value=ReceiptResult(
+            type="text", merchant=None, total=1.0, currency="USD", date=None,
+            items=[], confidence=0.9, language="en"
+        ))
+
+        try:
             response = await async_client.post(
                 "/analyze",
-                data={"text": "test"}
+                data={"text": "Test receipt text"},
+                headers={"X-Tenant-ID": "acme", "X-Priority": "bulk"},
             )
+        finally:
+            app.dependency_overrides.pop(get_scheduler, None)
+
+        assert response.status_code == 200
+        assert scheduler.snapshot()["tenants"]["acme"]["completed"] == 1
+
+        metrics = await async_client.get("/metrics/scheduler")
+        assert metrics.status_code == 200
+
+    @pytest.mark.asyncio
+    async def test_analyze_invalid_priority_returns_400(self, async_client, mock_analyzer):
+        """Test endpoint rejects unknown priority lanes"""
+        response = await async_client.post(
+            "/analyze",
+            data={"text": "Test receipt text"},
+            headers={"X-Priority": "urgent"},
+        )
+
+        assert response.status_code == 400
+        assert "X-Priority" in response.json()["detail"]
+
+    def test_api_key_tenant_is_fingerprinted(self):
+        """Test raw API keys are not used as tenant identity"""
+        from app.core.dependencies import get_tenant
+
+        tenant = get_tenant(x_tenant_id=None, x_api_key="secret-key")
+
+        assert tenant.startswith("key-")
+        assert "secret" not in tenant
+        assert get_tenant(x_tenant_id=None, x_api_key=None) == "anonymous"
 
-            assert response.status_code == 200
-            data = response.json()
+    def test_api_key_tenant_wins_over_header(self):
+        """Test a client with an API key cannot claim another tenant through X-Tenant-ID"""
+        from app.core.dependencies import get_tenant
 
-            # Verify null values are included in JSON
-            assert data["merchant"] is None
-            assert data["date"] is None
-            assert data["total"] == 50.0
+        keyed = get_tenant(x_tenant_id=None, x_api_key="secret-key")
 
+        assert get_tenant(x_tenant_id="acme", x_api_key="secret-key") == keyed
+        assert get_tenant(x_tenant_id="acme", x_api_key=None) == "acme"
@@ -170,3 +170,15 @@ class TestAnalyzerService:
             with pytest.raises(Exception):  # Pydantic ValidationError
                 await analyzer.analyze_text("Test text")
 
+    def test_validate_result_reuses_validated_items(self, analyzer, mock_llm_response):
+        """Test the result is built from the parsed LLM items without copying them"""
+        llm_result = ReceiptLLMResult.model_validate(mock_llm_response)
+
+        result = analyzer._normalize_output(llm_result, "text", 0.95)
+
+        assert result.items is llm_result.items
+        assert all(isinstance(item, ReceiptItem) for item in result.items)
+        assert result.model_dump() == ReceiptResult(**result.model_dump()).model_dump()
+        with pytest.raises(Exception):  # Items are immutable, so sharing them is safe
+            result.items[0].price = 0.0
+
@@ -0,0 +1,305 @@
+"""
+Tests for the bulk import CLI and its streaming engine
+"""
+import asyncio
+import io
+import json
+
+import pytest
+from unittest.mock import MagicMock, patch
+
+from app.cli import bulk_import as cli
+from app.schemas.receipt import ReceiptResult
+from app.services.bulk_import import (
+    BulkImporter,
+    Checkpoint,
+    JSONLResultWriter,
+    Progress,
+    count_rows,
+    read_rows,
+)
+
+
+def _result(total: float) -> ReceiptResult:
+    return ReceiptResult(
+        type="text", merchant="Shop", total=total, currency="USD", date=None,
+        items=[], confidence=0.9, language="en",
+    )
+
+
+class Crash(BaseException):
+    """Simulates the process dying mid-import"""
+
+
+class FakeAnalyzer:
+    """Analyzer stand-in: the total is the row text's length, short text fails, `degrade` rows get heuristic results"""
+
+    def __init__(self, delay: float = 0.0, fail_after: int = None, degrade=()):
+        self.delay = delay
+        self.fail_after = fail_after
+        self.degrade = set(degrade)
+        self.llm = MagicMock()
+        self.calls = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    def close(self):
+        pass
+
+    async def _analyze_receipt(self, text, source):
+        if self.fail_after is not None and len(self.calls) >= self.fail_after:
+            raise Crash
+        self.calls.append(text)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.in_flight -= 1
+        if len(text) < 5:
+            raise ValueError("Text is too short")
+        if text in self.degrade:
+            return _result(float(len(text))).model_copy(update={"confidence": 0.3, "needs_enrichment": True})
+        return _result(float(len(text)))
+
+
+def _write_jsonl(path, count):
+    with open(path, "w") as f:
+        for i in range(count):
+            f.write(json.dumps({"id": f"r{i}", "text": "receipt " + "x" * i}) + "\n")
+
+
+def _read_jsonl(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f]
+
+
+def _importer(analyzer, output, checkpoint_path, checkpoint=None, **kwargs):
+    checkpoint = checkpoint or Checkpoint(input="in", output=str(output), text_field="text")
+    return BulkImporter(analyzer, JSONLResultWriter(str(output)), str(checkpoint_path), checkpoint, **kwargs)
+
+
+class TestReadRows:
+    """Test suite for lazy input readers"""
+
+    def test_csv_rows(self, tmp_path):
+        """Test CSV rows with quoted multi-line text and a missing field"""
+        path = tmp_path / "in.csv"
+        path.write_text('id,text\n1,"SHOP\nTOTAL 5.00"\n2,\n')
+
+        rows = list(read_rows(str(path)))
+
+        assert rows[0] == (0, "1", "SHOP\nTOTAL 5.00", None)
+        assert rows[1] == (1, "2", "", None)
+
+    def test_jsonl_rows_report_bad_lines(self, tmp_path):
+        """Test invalid JSON and missing text are yielded as row errors"""
+        path = tmp_path / "in.jsonl"
+        path.write_text('{"id": 7, "text": "SHOP TOTAL"}\n\nnot json\n{"id": 9}\n')
+
+        rows = list(read_rows(str(path)))
+
+        assert rows[0] == (0, "7", "SHOP TOTAL", None)
+        assert rows[1][0] == 1 and rows[1][3].startswith("Invalid JSON")
+        assert rows[2] == (2, "9", None, "Missing field: text")
+        assert count_rows(str(path)) == 4
+
+    def test_reader_is_lazy(self, tmp_path):
+        """Test rows are read on demand rather than loaded up front"""
+        path = tmp_path / "in.jsonl"
+        _write_jsonl(path, 1000)
+
+        rows = read_rows(str(path))
+
+        assert next(rows)[0] == 0
+        rows.close()
+
+
+class TestBulkImporter:
+    """Test suite for BulkImporter"""
+
+    @pytest.mark.asyncio
+    async def test_writes_every_row_with_bounded_concurrency(self, tmp_path):
+        """Test all rows are written once and at most `concurrency` run at a time"""
+        source = tmp_path / "in.jsonl"
+        _write_jsonl(source, 50)
+        analyzer = FakeAnalyzer(delay=0.001)
+        importer = _importer(analyzer, tmp_path / "out.jsonl", tmp_path / "ckpt.json", concurrency=4)
+
+        checkpoint = await importer.run(read_rows(str(source)))
+        importer.writer.close()
+
+        records = _read_jsonl(tmp_path / "out.jsonl")
+        assert sorted(r["row"] for r in records) == list(range(50))
+        assert analyzer.max_in_flight == 4
+        assert checkpoint.watermark == 50 and checkpoint.done == []
+        assert records[0]["status"] == "ok" and records[0]["result"]["total"] > 0
+
+    @pytest.mark.asyncio
+    async def test_failed_rows_are_recorded(self, tmp_path):
+        """Test analysis and read errors become error records, not crashes"""
+        source = tmp_path / "in.jsonl"
+        source.write_text('{"id": 1, "text": "abc"}\n{"id": 2}\n{"id": 3, "text": "SHOP TOTAL"}\n')
+        importer = _importer(FakeAnalyzer(), tmp_path / "out.jsonl", tmp_path / "ckpt.json")
+
+        checkpoint = await importer.run(read_rows(str(source)))
+        importer.writer.close()
+
+        records = {r["id"]: r for r in _read_jsonl(tmp_path / "out.jsonl")}
+        assert records["1"]["status"] == "error" and "too short" in records["1"]["error"]
+        assert records["2"]["error"] == "Missing field: text"
+        assert records["3"]["status"] == "ok"
+        assert checkpoint.failed == 2
+
+    @pytest.mark.asyncio
+    async def test_resume_after_interruption(self, tmp_path):
+        """Test a rerun skips checkpointed rows and drops uncommitted output"""
+        source = tmp_path / "in.jsonl"
+        output = tmp_path / "out.jsonl"
+        checkpoint_path = tmp_path / "ckpt.json"
+        _write_jsonl(source, 30)
+
+        importer = _importer(FakeAnalyzer(fail_after=17), output, checkpoint_path, concurrency=1, checkpoint_every=5)
+        with pytest.raises(Crash):
+            await importer.run(read_rows(str(source)))
+        importer.writer.close()
+
+        checkpoint = Checkpoint.load(str(checkpoint_path))
+        assert checkpoint.watermark == 17
+        # A record written after the last checkpoint (process killed) is dropped
+        with open(output, "a") as f:
+            f.write(json.dumps({"row": 17, "status": "ok"}) + "\n")
+
+        analyzer = FakeAnalyzer()
+        importer = _importer(analyzer, output, checkpoint_path, checkpoint=checkpoint, concurrency=3)
+        await importer.run(read_rows(str(source)))
+        importer.writer.close()
+
+        assert len(analyzer.calls) == 13
+        assert sorted(r["row"] for r in _read_jsonl(output)) == list(range(30))
+        assert Checkpoint.load(str(checkpoint_path)).done == []
+
+    @pytest.mark.asyncio
+    async def test_degraded_rows_redone_by_next_run(self, tmp_path):
+        """Test heuristic results are marked degraded and analyzed again on rerun"""
+        source = tmp_path / "in.jsonl"
+        output = tmp_path / "out.jsonl"
+        checkpoint_path = tmp_path / "ckpt.json"
+        _write_jsonl(source, 10)
+        degraded_texts = {"receipt " + "x" * i for i in (3, 7)}
+
+        importer = _importer(FakeAnalyzer(degrade=degraded_texts), output, checkpoint_path, checkpoint_every=4)
+        checkpoint = await importer.run(read_rows(str(source)))
+        importer.writer.close()
+
+        records = _read_jsonl(output)
+        assert [r["row"] for r in records if r["status"] == "degraded"] == [3, 7]
+        assert records[3]["result"]["needs_enrichment"]
+        saved = Checkpoint.load(str(checkpoint_path))
+        assert (saved.pass_number, saved.redo_rows, saved.degraded) == (1, 2, [])
+
+        analyzer = FakeAnalyzer()
+        importer = _importer(analyzer, output, checkpoint_path, checkpoint=checkpoint)
+        checkpoint = await importer.run(read_rows(str(source)))
+        importer.writer.close()
+
+        assert sorted(analyzer.calls) == sorted(degraded_texts)
+        latest = {r["row"]: r["status"] for r in _read_jsonl(output)}
+        assert set(latest.values()) == {"ok"} and len(latest) == 10
+        assert checkpoint.redo_rows == 0 and checkpoint.done == []
+        assert not list(tmp_path.glob("ckpt.json.degraded-*"))
+
+    @pytest.mark.asyncio
+    async def test_degraded_rows_kept_out_of_the_checkpoint(self, tmp_path):
+        """Test degraded rows go to a side file, so the checkpoint stays small and resumes consistently"""
+        source = tmp_path / "in.jsonl"
+        output = tmp_path / "out.jsonl"
+        checkpoint_path = tmp_path / "ckpt.json"
+        _write_jsonl(source, 30)
+        texts = {"receipt " + "x" * i for i in range(30)}
+
+        importer = _importer(
+            FakeAnalyzer(fail_after=17, degrade=texts), output, checkpoint_path, concurrency=1, checkpoint_every=5
+        )
+        with pytest.raises(Crash):
+            await importer.run(read_rows(str(source)))
+        importer.writer.close()
+
+        checkpoint = Checkpoint.load(str(checkpoint_path))
+        assert (checkpoint.watermark, checkpoint.degraded_rows, checkpoint.degraded) == (17, 17, [])
+
+        importer = _importer(FakeAnalyzer(degrade=texts), output, checkpoint_path, checkpoint=checkpoint, concurrency=3)
+        checkpoint = await importer.run(read_rows(str(source)))
+        importer.writer.close()
+        assert (checkpoint.pass_number, checkpoint.redo_rows) == (1, 30)
+        assert [r["row"] for r in _read_jsonl(importer.degraded_path(0))] == list(range(30))
+
+        analyzer = FakeAnalyzer()
+        importer = _importer(analyzer, output, checkpoint_path, checkpoint=checkpoint, concurrency=3)
+        checkpoint = await importer.run(read_rows(str(source)))
+        importer.writer.close()
+        assert sorted(analyzer.calls) == sorted(texts)
+        assert checkpoint.redo_rows == 0
+
+    @pytest.mark.asyncio
+    async def test_parquet_output(self, tmp_path):
+        """Test Parquet parts are written at each checkpoint and read back"""
+        pq = pytest.importorskip("pyarrow.parquet")
+        from app.services.bulk_import import ParquetResultWriter
+
+        source = tmp_path / "in.jsonl"
+        _write_jsonl(source, 25)
+        output = tmp_path / "out.parquet"
+        importer = BulkImporter(
+            FakeAnalyzer(), ParquetResultWriter(str(output)), str(tmp_path / "ckpt.json"),
+            Checkpoint(input="in", output=str(output), text_field="text"), checkpoint_every=10,
+        )
+
+        await importer.run(read_rows(str(source)))
+
+        assert len(list(output.iterdir())) == 3
+        table = pq.read_table(str(output))
+        assert sorted(table.column("row").to_pylist()) == list(range(25))
+        assert table.column("currency").to_pylist()[0] == "USD"
+        assert table.column("needs_enrichment").to_pylist()[0] is False
+        assert table.column("enrichment_id").to_pylist()[0] is None
+
+
+class TestProgress:
+    """Test suite for the progress line"""
+
+    def test_reports_throughput_and_eta(self):
+        """Test throughput over the window and the ETA from the remaining rows"""
+        stream = io.StringIO()
+        progress = Progress(total=1000, stream=stream)
+
+        with patch("app.services.bulk_import.time.monotonic", side_effect=[100.0, 110.0]):
+            progress.update(0, 0, 0, force=True)
+            progress.update(100, 100, 2, force=True)
+
+        line = stream.getvalue().split("\r")[-1]
+        assert "100/~1,000 rows (10.0%)" in line
+        assert "10.0 rows/s" in line and "failed 2" in line
+        assert "ETA 1m 30s" in line
+
+
+class TestBulkImportCLI:
+    """Test suite for the command line entry point"""
+
+    def test_cli_runs_and_refuses_foreign_checkpoint(self, tmp_path):
+        """Test a full CLI run, then a mismatched rerun over the same output"""
+        source = tmp_path / "in.jsonl"
+        _write_jsonl(source, 5)
+        output = tmp_path / "out.jsonl"
+
+        with patch.object(cli, "AnalyzerService", return_value=FakeAnalyzer()), \
+                patch.object(cli, "close_client"):
+            assert cli.main([str(source), "--output", str(output)]) == 0
+            assert len(_read_jsonl(output)) == 5
+
+            with pytest.raises(SystemExit):
+                cli.main([str(source), "--output", str(output), "--text-field", "body"])
+
+            # A rerun of the finished import analyzes nothing
+            assert cli.main([str(source), "--output", str(output)]) == 0
+            assert len(_read_jsonl(output)) == 5
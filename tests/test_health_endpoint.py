@@ -0,0 +1,86 @@
+"""
+Tests for /health and /ready endpoints and lazy startup
+"""
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+from unittest.mock import MagicMock, patch
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services.analyzer import AnalyzerService
+
+
+class TestHealthEndpoint:
+    """Test suite for liveness/readiness endpoints"""
+
+    @pytest.mark.asyncio
+    async def test_health_returns_ok(self, async_client):
+        """Test liveness endpoint always returns ok"""
+        response = await async_client.get("/health")
+
+        assert response.status_code == 200
+        assert response.json() == {"status": "ok"}
+
+    @pytest.mark.asyncio
+    async def test_ready_returns_503_while_cold(self, async_client, mock_analyzer):
+        """Test readiness endpoint reports warming until pools are warm"""
+        mock_analyzer.ready = False
+        mock_analyzer.components = {"llm": "cold", "ocr": "cold"}
+
+        response = await async_client.get("/ready")
+
+        assert response.status_code == 503
+        assert response.json()["status"] == "warming"
+        assert response.json()["components"] == {"llm": "cold", "ocr": "cold"}
+
+    def test_ready_after_lifespan_warm_up(self):
+        """Test lifespan creates the analyzer and warm-up marks it ready"""
+        with patch("app.main.AnalyzerService") as service_cls:
+            service = AnalyzerService(llm=MagicMock(), ocr=MagicMock())
+            service_cls.return_value = service
+
+            with TestClient(app) as client:
+                # Warm-up runs in a background thread; wait for it
+                for _ in range(100):
+                    response = client.get("/ready")
+                    if response.status_code == 200:
+                        break
+                    time.sleep(0.01)
+
+            assert app.state.analyzer is service
+            assert response.status_code == 200
+            assert response.json()["status"] == "ready"
+            service.llm.warm_up.assert_called_once()
+            service.ocr.warm_up.assert_called_once()
+        app.state.analyzer = None
+
+    def test_warm_up_records_component_errors(self):
+        """Test failing warm-up is reported per component instead of raised"""
+        ocr = MagicMock()
+        ocr.warm_up.side_effect = RuntimeError("tesseract not installed")
+        service = AnalyzerService(llm=MagicMock(), ocr=ocr)
+
+        service.warm_up()
+
+        assert service.components == {"llm": "ready", "ocr": "error"}
+        assert service.ready is False
+
+    def test_import_does_not_load_heavy_dependencies(self):
+        """Test importing the app does not import openai, PIL or pytesseract"""
+        code = (
+            "import sys, app.main; "
+            "print(sorted(m for m in ('openai', 'PIL', 'pytesseract') if m in sys.modules))"
+        )
+        output = subprocess.run(
+            [sys.executable, "-c", code],
+            cwd=Path(__file__).resolve().parent.parent,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout
+
+        assert output.strip() == "[]"
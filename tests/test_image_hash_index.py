@@ -0,0 +1,197 @@
+"""
+Tests for ImageHashIndex and perceptual image hashing
+"""
+import io
+import threading
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock, mock_open, patch
+from PIL import Image, ImageDraw
+
+from app.services.analyzer import AnalyzerService
+from app.services.image_hash_index import HASH_BITS, ImageHashIndex, dhash, total_band
+
+
+def _receipt_image(lines, size=(300, 600), quality=90) -> bytes:
+    image = Image.new("L", size, 245)
+    draw = ImageDraw.Draw(image)
+    for i, line in enumerate(lines):
+        draw.text((20, 20 + i * 24), line, fill=20, font_size=18)
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+RECEIPT_LINES = ["FRESH MARKET", "Milk 2.90", "Bread 2.10", "Coffee 12.99", "TOTAL 17.99"]
+OTHER_LINES = ["CITY PHARMACY", "Vitamin C", "Bandages", "Aspirin", "Cough syrup", "TOTAL 23.40"]
+# Same template as RECEIPT_LINES, other prices and total
+SAME_TEMPLATE_LINES = ["FRESH MARKET", "Milk 2.90", "Bread 2.60", "Coffee 12.99", "TOTAL 18.49"]
+
+
+def _upload(content: bytes) -> MagicMock:
+    upload = MagicMock()
+    upload.filename = "receipt.jpg"
+    upload.read = AsyncMock(return_value=content)
+    return upload
+
+
+class TestImageHash:
+    """Test suite for dhash"""
+
+    def test_recompressed_copy_is_close(self):
+        """Test the same receipt resized and recompressed hashes a few bits apart"""
+        original = dhash(_receipt_image(RECEIPT_LINES))
+        copy = dhash(_receipt_image(RECEIPT_LINES, size=(300, 600), quality=40))
+
+        assert bin(original ^ copy).count("1") <= 8
+
+    def test_different_receipt_is_far(self):
+        """Test different receipts are well beyond the match threshold"""
+        first = dhash(_receipt_image(RECEIPT_LINES))
+        second = dhash(_receipt_image(OTHER_LINES))
+
+        assert bin(first ^ second).count("1") > 8
+
+    def test_same_template_is_close(self):
+        """Test receipts from one template hash within the threshold despite other amounts"""
+        first = dhash(_receipt_image(RECEIPT_LINES))
+        second = dhash(_receipt_image(SAME_TEMPLATE_LINES))
+
+        assert bin(first ^ second).count("1") <= 8
+
+    def test_rejects_non_image_data(self):
+        """Test hashing non-image bytes raises"""
+        with pytest.raises(Exception):
+            dhash(b"fake image data")
+
+
+class TestImageHashIndex:
+    """Test suite for ImageHashIndex"""
+
+    def test_lookup_within_distance(self):
+        """Test hashes within max_distance bits match and farther ones miss"""
+        index = ImageHashIndex(max_entries=10, max_distance=4)
+        stored = (1 << HASH_BITS) - 12345
+        index.add(stored, "receipt text")
+
+        assert index.lookup(stored ^ 0b1011) == "receipt text"
+        assert index.lookup(stored ^ 0b11111) is None
+        assert (index.hits, index.misses) == (1, 1)
+
+    def test_returns_closest_match(self):
+        """Test the nearest of several candidates is returned"""
+        index = ImageHashIndex(max_entries=10, max_distance=4)
+        index.add(0b1111, "far")
+        index.add(0b0001, "near")
+
+        assert index.lookup(0) == "near"
+
+    def test_ring_buffer_overwrites_oldest(self):
+        """Test the index keeps a fixed capacity and forgets the oldest entry"""
+        index = ImageHashIndex(max_entries=3, max_distance=2)
+        # Disjoint 64-bit blocks: every pair is 128 bits apart
+        hashes = [((1 << 64) - 1) << (64 * i) for i in range(4)]
+        for i, image_hash in enumerate(hashes):
+            index.add(image_hash, f"text {i}")
+
+        assert len(index) == 3
+        assert index.lookup(hashes[0]) is None
+        assert [index.lookup(h) for h in hashes[1:]] == ["text 1", "text 2", "text 3"]
+
+
+class TestTotalBand:
+    """Test the image band expected to hold the total"""
+
+    def test_band_covers_total_line(self):
+        """Test the band is centred on the total line's share of the text"""
+        text = "\n".join(["Header"] * 15 + ["Subtotal 9.00", "TOTAL 10.00", "Thanks", "Bye", "Visit again"])
+        top, bottom = total_band(text, 2000)
+
+        assert top < 16.5 / 20 * 2000 < bottom
+        assert bottom - top < 2000 / 2
+
+    def test_no_amount(self):
+        """Test text without amounts has no band to confirm"""
+        assert total_band("FRESH MARKET\nThank you", 600) is None
+
+
+class TestAnalyzerServiceImageIndex:
+    """Test image hash index use in AnalyzerService"""
+
+    @pytest.mark.asyncio
+    async def test_repeat_upload_skips_ocr(self, mock_llm_response, mock_ocr_text):
+        """Test a re-uploaded photo reuses the stored OCR text"""
+        analyzer = AnalyzerService(image_index=ImageHashIndex(max_entries=10))
+        upload = _upload(_receipt_image(RECEIPT_LINES))
+
+        with patch.object(analyzer.ocr, 'extract_text', return_value=mock_ocr_text) as mock_ocr, \
+                patch.object(analyzer.ocr, 'extract_image_text') as mock_band_ocr, \
+                patch.object(analyzer.llm, 'analyze_text', new_callable=AsyncMock) as mock_llm, \
+                patch('builtins.open', mock_open()):
+            mock_llm.return_value = mock_llm_response
+
+            first = await analyzer.analyze(file=upload)
+            second = await analyzer.analyze(file=upload)
+
+            mock_ocr.assert_called_once()
+            # Identical bytes need no confirmation
+            mock_band_ocr.assert_not_called()
+            assert second == first
+
+    @pytest.mark.asyncio
+    async def test_recompressed_copy_confirmed_by_total(self, mock_llm_response):
+        """Test a re-encoded copy reuses the text once its total band reads the same total"""
+        analyzer = AnalyzerService(image_index=ImageHashIndex(max_entries=10))
+        text = "\n".join(RECEIPT_LINES)
+
+        with patch.object(analyzer.ocr, 'extract_text', return_value=text) as mock_ocr, \
+                patch.object(analyzer.ocr, 'extract_image_text', return_value="Coffee 12.99\nTOTAL 17.99") as mock_band_ocr, \
+                patch.object(analyzer.llm, 'analyze_text', new_callable=AsyncMock, return_value=mock_llm_response), \
+                patch('builtins.open', mock_open()):
+            await analyzer.analyze(file=_upload(_receipt_image(RECEIPT_LINES)))
+            await analyzer.analyze(file=_upload(_receipt_image(RECEIPT_LINES, quality=40)))
+
+            mock_ocr.assert_called_once()
+            mock_band_ocr.assert_called_once()
+            band = mock_band_ocr.call_args.args[0]
+            assert band.height < 600
+
+    @pytest.mark.asyncio
+    async def test_same_template_different_total_runs_ocr(self, mock_llm_response):
+        """Test a receipt from the same template with another total is not given the stored text"""
+        analyzer = AnalyzerService(image_index=ImageHashIndex(max_entries=10))
+        texts = ["\n".join(RECEIPT_LINES), "\n".join(SAME_TEMPLATE_LINES)]
+
+        with patch.object(analyzer.ocr, 'extract_text', side_effect=texts) as mock_ocr, \
+                patch.object(analyzer.ocr, 'extract_image_text', return_value="Coffee 12.99\nTOTAL 18.49"), \
+                patch.object(analyzer.llm, 'analyze_text', new_callable=AsyncMock, return_value=mock_llm_response) as mock_llm, \
+                patch('builtins.open', mock_open()):
+            await analyzer.analyze(file=_upload(_receipt_image(RECEIPT_LINES)))
+            await analyzer.analyze(file=_upload(_receipt_image(SAME_TEMPLATE_LINES)))
+
+            assert mock_ocr.call_count == 2
+            assert mock_llm.call_args.args[0] == texts[1]
+
+    @pytest.mark.asyncio
+    async def test_lookup_runs_off_event_loop(self, mock_llm_response):
+        """Test hashing and confirmation OCR do not block the event loop thread"""
+        analyzer = AnalyzerService(image_index=ImageHashIndex(max_entries=10))
+        text = "\n".join(RECEIPT_LINES)
+        band_threads = []
+
+        def band_ocr(image):
+            band_threads.append(threading.current_thread())
+            return "Coffee 12.99\nTOTAL 17.99"
+
+        with patch.object(analyzer.ocr, 'extract_text', return_value=text), \
+                patch.object(analyzer.ocr, 'extract_image_text', side_effect=band_ocr), \
+                patch.object(analyzer.llm, 'analyze_text', new_callable=AsyncMock, return_value=mock_llm_response), \
+                patch('builtins.open', mock_open()):
+            await analyzer.analyze(file=_upload(_receipt_image(RECEIPT_LINES)))
+            await analyzer.analyze(file=_upload(_receipt_image(RECEIPT_LINES, quality=40)))
+
+        assert band_threads and band_threads[0] is not threading.current_thread()
+
+    def test_index_is_opt_in(self):
+        """Test the index is disabled unless IMAGE_HASH_INDEX_SIZE is set"""
+        assert AnalyzerService().image_index is None
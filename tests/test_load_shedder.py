@@ -0,0 +1,380 @@
+"""
+Tests for load shedding and heuristic results without the LLM
+"""
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from app.core.config import Settings
+from app.core.dependencies import get_load_shedder
+from app.main import app
+from app.services.analyzer import LLM_ERROR, AnalyzerService
+from app.services.bulk_import import read_rows
+from app.services.llm_analyzer import LLMAnalyzer
+from app.services.load_shedder import (
+    BREAKER_OPEN,
+    LATENCY_SLO,
+    MAX_LATENCY_SAMPLES,
+    QUEUE_DEPTH,
+    EnrichmentBacklog,
+    LoadShedder,
+    create_load_shedder,
+)
+from app.services.receipt_text import extract_currency, extract_date, extract_total, total_line_index
+from app.services.usage_ledger import current_tenant
+
+RECEIPT = "Corner Market\n25.12.2023\nMilk 2.50\nBread 3.00\nTOTAL 5.50 EUR\n"
+
+
+class Clock:
+    """Stand-in for time.monotonic that only moves when told to"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _fail(shedder: LoadShedder) -> None:
+    with pytest.raises(RuntimeError):
+        with shedder.track():
+            raise RuntimeError("provider down")
+
+
+def _analyzer(shedder=None, backlog=None, llm_result=None) -> AnalyzerService:
+    analyzer = AnalyzerService(llm=MagicMock(), ocr=MagicMock(), shedder=shedder, backlog=backlog)
+    analyzer.cache = None
+    analyzer.llm.analyze_text = AsyncMock(return_value=llm_result)
+    return analyzer
+
+
+class TestHeuristicExtraction:
+    """Test local currency and date extraction"""
+
+    @pytest.mark.parametrize("text,currency", [
+        ("TOTAL 12.00 USD", "USD"),
+        ("Итого 150,00 руб", "RUB"),
+        ("Total € 5.00", "EUR"),
+        ("TAX 1.00\nTOTAL $3.00", "USD"),
+        ("TOTAL 3.00", None),
+    ])
+    def test_currency(self, text, currency):
+        """Test ISO codes win over symbols and words like TAX are not codes"""
+        assert extract_currency(text) == currency
+
+    @pytest.mark.parametrize("text,date", [
+        ("Date: 2024-03-01", "2024-03-01"),
+        ("25.12.2023 14:02", "2023-12-25"),
+        ("12/25/23", "2023-12-25"),
+        ("31/01/2024", "2024-01-31"),
+        ("Ref 99.99.2024 on 01.02.2024", "2024-02-01"),
+        ("no date", None),
+    ])
+    def test_date(self, text, date):
+        """Test dates are normalized to ISO and invalid ones skipped"""
+        assert extract_date(text) == date
+
+    @pytest.mark.parametrize("text,total", [
+        ("Total: 1.234,56 EUR", 123456),
+        ("Итого 1 234,56", 123456),
+        ("TOTAL 1,234.56", 123456),
+        ("TOTAL 12.345.678,90", 1234567890),
+        ("TOTAL 11.00\nSubtotal 10.00", 1100),
+        ("Subtotal 10.00\nTax 0.70", 1000),
+    ])
+    def test_total(self, text, total):
+        """Test grouped amounts in either style and that Subtotal is not the total line"""
+        assert extract_total(text) == total
+
+    def test_total_line_skips_subtotal(self):
+        """Test the total line index points at the standalone keyword"""
+        assert total_line_index("Shop\nTOTAL 11.00\nSubtotal 10.00") == 1
+
+
+class TestLoadShedder:
+    """Test the shedding triggers"""
+
+    def test_queue_depth(self):
+        """Test analyses are shed while max_pending LLM calls are in flight"""
+        shedder = LoadShedder(max_pending=2)
+        with shedder.track():
+            assert shedder.check() is None
+            with shedder.track():
+                assert shedder.check() == QUEUE_DEPTH
+        assert shedder.check() is None
+        assert shedder.shed[QUEUE_DEPTH] == 1
+
+    def test_breaker_opens_and_probes(self):
+        """Test consecutive failures open the breaker and one probe closes it"""
+        clock = Clock()
+        shedder = LoadShedder(breaker_failures=3, breaker_cooldown=10)
+        with patch("app.services.load_shedder.time.monotonic", clock):
+            _fail(shedder)
+            _fail(shedder)
+            assert shedder.check() is None
+            _fail(shedder)
+            assert shedder.check() == BREAKER_OPEN
+
+            clock.now += 10
+            assert shedder.check() is None  # the probe
+            assert shedder.check() == BREAKER_OPEN  # while the probe is in flight
+            with shedder.track():
+                pass
+            assert shedder.breaker == "closed"
+            assert shedder.check() is None
+
+    def test_failed_probe_reopens_breaker(self):
+        """Test a failing probe starts a new cooldown"""
+        clock = Clock()
+        shedder = LoadShedder(breaker_failures=1, breaker_cooldown=10)
+        with patch("app.services.load_shedder.time.monotonic", clock):
+            _fail(shedder)
+            clock.now += 10
+            assert shedder.check() is None
+            _fail(shedder)
+            assert shedder.breaker == "open"
+            clock.now += 5
+            assert shedder.check() == BREAKER_OPEN
+
+    @pytest.mark.asyncio
+    async def test_cancelled_probe_allows_another(self):
+        """Test a cancelled probe does not leave the breaker half-open forever"""
+        shedder = LoadShedder(breaker_failures=1, breaker_cooldown=0)
+        _fail(shedder)
+        assert shedder.check() is None
+
+        async def probe():
+            with shedder.track():
+                await asyncio.sleep(10)
+
+        task = asyncio.ensure_future(probe())
+        await asyncio.sleep(0)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert shedder.check() is None
+
+    def test_latency_slo(self):
+        """Test a slow p95 sheds load until the slow samples leave the window"""
+        clock = Clock()
+        shedder = LoadShedder(latency_slo_ms=1000, latency_window=30)
+        with patch("app.services.load_shedder.time.monotonic", clock):
+            for _ in range(20):
+                shedder._success(2.0)
+            assert shedder.check() == LATENCY_SLO
+            clock.now += 31
+            assert shedder.check() is None
+
+    def test_latency_samples_bounded(self):
+        """Test the p95 follows the latest calls, keeping at most MAX_LATENCY_SAMPLES"""
+        shedder = LoadShedder(latency_slo_ms=1000)
+        for _ in range(MAX_LATENCY_SAMPLES):
+            shedder._success(2.0)
+        assert shedder.check() == LATENCY_SLO
+
+        for _ in range(MAX_LATENCY_SAMPLES):
+            shedder._success(0.1)
+        assert len(shedder._latencies) == MAX_LATENCY_SAMPLES
+        assert shedder.check() is None
+
+    def test_disabled_by_default(self):
+        """Test no shedder is created unless a trigger is configured"""
+        assert create_load_shedder(Settings()) is None
+        shedder = create_load_shedder(Settings(load_shed_breaker_failures=5))
+        assert (shedder.breaker_failures, shedder.max_pending, shedder.latency_slo_ms) == (5, 0, None)
+
+
+class TestDegradedResults:
+    """Test AnalyzerService answers without the LLM"""
+
+    @pytest.mark.asyncio
+    async def test_shed_result_from_text(self, tmp_path):
+        """Test a shed analysis skips the LLM and is queued for re-enrichment"""
+        shedder = LoadShedder(max_pending=1)
+        shedder.pending = 1
+        backlog = EnrichmentBacklog(str(tmp_path / "backlog.jsonl"))
+        analyzer = _analyzer(shedder, backlog)
+
+        token = current_tenant.set("acme")
+        try:
+            result = await analyzer.analyze_text(RECEIPT)
+        finally:
+            current_tenant.reset(token)
+        backlog.close()
+
+        analyzer.llm.analyze_text.assert_not_called()
+        assert (result.total, result.currency, result.date) == (5.5, "EUR", "2023-12-25")
+        assert result.confidence == 0.3 and result.needs_enrichment
+
+        [entry] = [json.loads(line) for line in open(backlog.path)]
+        assert (entry["id"], entry["tenant"], entry["reason"]) == (result.enrichment_id, "acme", QUEUE_DEPTH)
+        # The backlog is a bulk import input
+        [(_, row_id, text, error)] = list(read_rows(backlog.path, "text", "id"))
+        assert (row_id, text, error) == (result.enrichment_id, RECEIPT, None)
+
+    @pytest.mark.asyncio
+    async def test_llm_failure_uses_heuristic_result(self):
+        """Test a failed LLM call returns the extracted total instead of 0"""
+        analyzer = _analyzer()
+        analyzer.llm.analyze_text.side_effect = RuntimeError("timeout")
+
+        result = await analyzer.analyze_text(RECEIPT)
+        grouped = await analyzer.analyze_text("Shop\nTotal: 1.234,56 EUR\nSubtotal 1.000,00")
+
+        assert result.total == 5.5 and result.needs_enrichment
+        assert result.enrichment_id is None
+        assert grouped.total == 1234.56
+
+    @pytest.mark.asyncio
+    async def test_no_total_keeps_fallback_confidence(self):
+        """Test text without amounts gives the minimal fallback result"""
+        analyzer = _analyzer(LoadShedder(breaker_failures=1))
+        analyzer.shedder.breaker, analyzer.shedder._opened_at = "open", float("inf")
+
+        result = await analyzer.analyze_text("Unreadable receipt")
+
+        assert (result.total, result.currency, result.confidence) == (0.0, "UNKNOWN", 0.1)
+
+    @pytest.mark.asyncio
+    async def test_llm_failures_trip_breaker(self, mock_llm_response):
+        """Test LLM calls from the service feed the breaker"""
+        analyzer = _analyzer(LoadShedder(breaker_failures=2, breaker_cooldown=60), llm_result=mock_llm_response)
+        analyzer.llm.analyze_text.side_effect = RuntimeError("timeout")
+
+        for _ in range(3):
+            await analyzer.analyze_text(RECEIPT)
+
+        assert analyzer.llm.analyze_text.await_count == 2
+        assert analyzer.shedder.shed[BREAKER_OPEN] == 1
+
+    @pytest.mark.asyncio
+    async def test_slow_llm_call_times_out(self, mock_llm_response):
+        """Test a call past llm_timeout gets the heuristic result and counts as a failure"""
+        analyzer = _analyzer(LoadShedder(llm_timeout=0.01, breaker_failures=1))
+
+        async def slow(text, **kwargs):
+            await asyncio.sleep(1)
+            return mock_llm_response
+
+        analyzer.llm.analyze_text.side_effect = slow
+
+        result = await asyncio.wait_for(analyzer.analyze_text(RECEIPT), 0.5)
+
+        assert result.total == 5.5 and result.needs_enrichment
+        assert analyzer.shedder.breaker == "open"
+
+    @pytest.mark.asyncio
+    async def test_normal_results_not_flagged(self, mock_llm_response):
+        """Test LLM results are not marked for enrichment"""
+        result = await _analyzer(LoadShedder(max_pending=4), llm_result=mock_llm_response).analyze_text(RECEIPT)
+
+        assert not result.needs_enrichment and result.confidence == 0.95
+
+
+class TestEnrichmentBacklog:
+    """Test backlog writes"""
+
+    def test_large_entries_from_workers_never_interleave(self, tmp_path):
+        """Test entries above the 8 KiB buffer size stay whole lines with two writers on one file"""
+        path = str(tmp_path / "backlog.jsonl")
+        workers = [EnrichmentBacklog(path), EnrichmentBacklog(path)]
+
+        def add(backlog, n):
+            for i in range(25):
+                backlog.add(f"{n}-{i} " + "x" * 20_000, "text", QUEUE_DEPTH, "acme")
+
+        threads = [threading.Thread(target=add, args=(backlog, n)) for n, backlog in enumerate(workers * 2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for backlog in workers:
+            backlog.close()
+
+        entries = [json.loads(line) for line in open(path)]
+        assert len(entries) == 100 and len({entry["id"] for entry in entries}) == 100
+        assert all(len(entry["text"]) > 20_000 for entry in entries)
+
+    def test_add_only_queues(self, tmp_path):
+        """Test add returns without writing; flush makes entries visible"""
+        backlog = EnrichmentBacklog(str(tmp_path / "backlog.jsonl"), flush_interval=60)
+        enrichment_id = backlog.add(RECEIPT, "ocr", LLM_ERROR, None)
+
+        assert open(backlog.path).read() == ""
+        backlog.flush()
+        [entry] = [json.loads(line) for line in open(backlog.path)]
+        assert entry["id"] == enrichment_id
+        backlog.close()
+
+
+class TestProviderDeadline:
+    """Test the LLM timeout reaches the provider call"""
+
+    @pytest.mark.asyncio
+    async def test_deadline_passed_to_provider(self, mock_llm_response):
+        """Test the request gets the remaining deadline, no SDK retries, and its own thread pool"""
+        threads = []
+
+        def create(**kwargs):
+            threads.append(threading.current_thread().name)
+            response = MagicMock()
+            response.choices[0].message.content = json.dumps(mock_llm_response)
+            return response
+
+        client = MagicMock()
+        client.with_options.return_value.chat.completions.create.side_effect = create
+        llm = LLMAnalyzer(client=client, timeout=5)
+
+        await llm.analyze_text(RECEIPT)
+        llm.close()
+
+        options = client.with_options.call_args.kwargs
+        assert options["max_retries"] == 0 and 4 < options["timeout"] <= 5
+        assert threads[0].startswith("llm-call")
+        client.chat.completions.create.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_no_retry_after_deadline(self):
+        """Test retries stop once the deadline has passed"""
+        def create(**kwargs):
+            time.sleep(0.06)
+            raise RuntimeError("503 Service Unavailable")
+
+        client = MagicMock()
+        client.with_options.return_value.chat.completions.create.side_effect = create
+        llm = LLMAnalyzer(client=client, timeout=0.1)
+
+        with pytest.raises(TimeoutError):
+            await llm.analyze_text(RECEIPT)
+        llm.close()
+
+        assert client.with_options.call_count == 2
+        assert client.with_options.call_args.kwargs["timeout"] < 0.05
+
+
+class TestLoadSheddingMetrics:
+    """Test the /metrics/load-shedding endpoint"""
+
+    @pytest.mark.asyncio
+    async def test_metrics(self, async_client):
+        """Test trigger state is exposed, and 404 when disabled"""
+        shedder = LoadShedder(max_pending=1)
+        shedder.pending = 1
+        shedder.check()
+        app.dependency_overrides[get_load_shedder] = lambda: shedder
+        try:
+            response = await async_client.get("/metrics/load-shedding")
+            app.dependency_overrides[get_load_shedder] = lambda: None
+            disabled = await async_client.get("/metrics/load-shedding")
+        finally:
+            app.dependency_overrides.pop(get_load_shedder, None)
+
+        assert response.status_code == 200
+        assert response.json()["shed"][QUEUE_DEPTH] == 1
+        assert response.json()["breaker"] == "closed"
+        assert disabled.status_code == 404
@@ -0,0 +1,168 @@
+"""
+Tests for NearDuplicateCache
+"""
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from app.schemas.receipt import ReceiptItem, ReceiptResult
+from app.services.analyzer import AnalyzerService
+from app.services.near_duplicate_cache import NearDuplicateCache, numeric_tokens, simhash
+from app.services.receipt_text import extract_total
+
+RECEIPT = """FRESH MARKET
+12 Main Street
+Date: 2024-03-14 18:22
+Milk 1L 2 x 1.45  2.90
+Bread white 1 x 2.10  2.10
+Coffee beans 1 x 12.99  12.99
+Subtotal 17.99
+TOTAL 17.99
+Thank you for shopping!"""
+
+# Same receipt photographed again: misread and dropped letters, spacing changes
+RECEIPT_REREAD = """FRESH MARKET
+12 Main  Street
+Date: 2024-03-14 18:22
+Mi1k 1L 2 x 1.45  2.90
+Bread whitc 1 x 2.10  2.10
+Coffee beans 1 x 12.99 12.99
+Subtota1 17.99
+TOTAL 17.99
+Thank you for shoping!"""
+
+
+def _result(total: float = 17.99) -> ReceiptResult:
+    return ReceiptResult(
+        type="text", merchant="Fresh Market", total=total, currency="USD",
+        date="2024-03-14", items=[], confidence=0.9, language="en",
+    )
+
+
+class TestNearDuplicateCache:
+    """Test suite for NearDuplicateCache"""
+
+    def test_reuses_result_for_reread_receipt(self):
+        """Test a noisy re-read of a cached receipt returns the stored result"""
+        cache = NearDuplicateCache()
+        cache.add(RECEIPT, _result())
+
+        hit = cache.lookup(RECEIPT_REREAD)
+
+        assert hit == _result()
+        assert cache.hits == 1
+
+    def test_requires_matching_total(self):
+        """Test similar text with a different total is not reused"""
+        cache = NearDuplicateCache()
+        cache.add(RECEIPT, _result())
+
+        assert cache.lookup(RECEIPT.replace("TOTAL 17.99", "TOTAL 19.99")) is None
+        assert cache.misses == 1
+
+    def test_requires_matching_numbers(self):
+        """Test a receipt with the same layout and total but another item price is not reused"""
+        cache = NearDuplicateCache()
+        cache.add(RECEIPT, _result())
+
+        assert cache.lookup(RECEIPT.replace("2.10  2.10", "2.40  2.40")) is None
+
+    @pytest.mark.parametrize("cached,probe", [
+        ("LAVKA\nMilk 89\nBread 45\nTotal 134 RUB", "LAVKA\nMilk 89\nBread 49\nTotal 138 RUB"),
+        ("paid total 45 USD", "paid total 46 USD"),
+    ])
+    def test_whole_number_amounts_are_not_reused(self, cached, probe):
+        """Test receipts without a parsable total are never matched, as their fingerprints barely differ"""
+        cache = NearDuplicateCache()
+        cache.add(cached, _result(134.0))
+
+        assert cache.lookup(probe) is None
+        assert cache.lookup(cached) is None
+        assert len(cache) == 0
+
+    def test_different_receipt_is_not_reused(self):
+        """Test an unrelated receipt with the same total misses"""
+        cache = NearDuplicateCache()
+        cache.add(RECEIPT, _result())
+
+        other = "CITY PHARMACY\nDate: 2023-11-02\nVitamin C 17.99\nTOTAL 17.99"
+
+        assert cache.lookup(other) is None
+
+    def test_evicts_least_recently_used(self):
+        """Test the cache stays bounded and evicts the least recently used entry"""
+        cache = NearDuplicateCache(max_entries=2)
+        first = RECEIPT
+        second = RECEIPT.replace("17.99", "21.50")
+        third = RECEIPT.replace("17.99", "8.75")
+        cache.add(first, _result())
+        cache.add(second, _result(21.50))
+        cache.lookup(first)
+
+        cache.add(third, _result(8.75))
+
+        assert len(cache) == 2
+        assert cache.lookup(first) is not None
+        assert cache.lookup(second) is None
+        assert all(bucket for band in cache._bands for bucket in band.values())
+
+    def test_returned_result_is_a_copy(self):
+        """Test callers cannot mutate cached entries"""
+        cache = NearDuplicateCache()
+        cache.add(RECEIPT, _result())
+
+        cache.lookup(RECEIPT).merchant = "Changed"
+
+        assert cache.lookup(RECEIPT).merchant == "Fresh Market"
+
+    def test_returned_items_list_is_a_copy(self):
+        """Test removing items from a returned result leaves the cache intact"""
+        cache = NearDuplicateCache()
+        result = _result()
+        result.items = [ReceiptItem(name="Bread", price=2.5)]
+        cache.add(RECEIPT, result)
+
+        cache.lookup(RECEIPT).items.clear()
+
+        assert len(cache.lookup(RECEIPT).items) == 1
+
+    def test_fingerprint_and_total_extraction(self):
+        """Test near-duplicates are a few bits apart and totals are parsed"""
+        distance = bin(simhash(RECEIPT) ^ simhash(RECEIPT_REREAD)).count("1")
+
+        assert distance <= 6
+        assert extract_total(RECEIPT) == 1799
+        assert extract_total("Итого: 1 234,50 руб") == 123450
+        assert extract_total("no amounts here") is None
+        assert numeric_tokens(RECEIPT) == numeric_tokens(RECEIPT_REREAD)
+        assert numeric_tokens("C0rner Bread 45\nTotal 1,234.50") == ("123450", "45")
+
+
+class TestAnalyzerServiceCache:
+    """Test near-duplicate cache use in AnalyzerService"""
+
+    @pytest.mark.asyncio
+    async def test_near_duplicate_skips_llm(self, mock_llm_response):
+        """Test a re-read receipt is answered from cache without an LLM call"""
+        analyzer = AnalyzerService(cache=NearDuplicateCache())
+
+        with patch.object(analyzer.llm, 'analyze_text', new_callable=AsyncMock) as mock_llm:
+            mock_llm.return_value = mock_llm_response
+
+            first = await analyzer.analyze_text(RECEIPT)
+            second = await analyzer.analyze_text(RECEIPT_REREAD)
+
+            mock_llm.assert_called_once_with(RECEIPT)
+            assert second == first
+
+    @pytest.mark.asyncio
+    async def test_low_confidence_result_is_not_cached(self, mock_llm_response):
+        """Test low-confidence results are analyzed again instead of reused"""
+        analyzer = AnalyzerService(cache=NearDuplicateCache())
+
+        with patch.object(analyzer.llm, 'analyze_text', new_callable=AsyncMock) as mock_llm:
+            mock_llm.return_value = {**mock_llm_response, "confidence": 0.2}
+
+            await analyzer.analyze_text(RECEIPT)
+            await analyzer.analyze_text(RECEIPT)
+
+            assert mock_llm.call_count == 2
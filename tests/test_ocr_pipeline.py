@@ -0,0 +1,174 @@
+"""
+Tests for OCRPipeline (banded OCR with speculative LLM start)
+"""
+import asyncio
+import io
+import time
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock, patch
+from PIL import Image, ImageDraw
+
+from app.services.analyzer import AnalyzerService
+from app.services.ocr_pipeline import OCRPipeline, is_material_change
+
+
+def _image_bytes(size=(100, 400)) -> bytes:
+    buffer = io.BytesIO()
+    Image.new("L", size, 245).save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+class FakeBandOCR:
+    """OCR stand-in: each band is a (delay seconds, text) tuple"""
+
+    def extract_image_text(self, band):
+        delay, text = band
+        time.sleep(delay)
+        return text
+
+
+def _pipeline(bands):
+    pipeline = OCRPipeline(FakeBandOCR(), bands=len(bands), workers=len(bands))
+    pipeline.split = lambda image: bands
+    return pipeline
+
+
+class TestOCRPipeline:
+    """Test suite for OCRPipeline"""
+
+    def test_split_cuts_between_text_lines(self):
+        """Test band boundaries fall on blank rows, not through text"""
+        image = Image.new("L", (300, 1200), 245)
+        draw = ImageDraw.Draw(image)
+        for y in range(20, 1180, 28):
+            draw.rectangle((20, y, 280, y + 16), fill=20)
+
+        bands = OCRPipeline(MagicMock(), bands=4).split(image)
+
+        assert len(bands) == 4
+        assert sum(band.height for band in bands) == 1200
+        # The first row of every band after the first is blank paper
+        for band in bands[1:]:
+            assert min(band.crop((0, 0, 300, 1)).tobytes()) == 245
+
+    @pytest.mark.asyncio
+    async def test_starts_llm_before_last_band(self):
+        """Test the LLM starts once the bands down to the total are OCR'd"""
+        started_at = []
+        pipeline = _pipeline([
+            (0.0, "SHOP 2024-01-05"),
+            (0.0, "Milk 2.00\nTOTAL 2.00"),
+            (0.2, "Thank you, come again"),
+        ])
+
+        async def analyze(text):
+            started_at.append(time.perf_counter())
+            return text
+
+        begun = time.perf_counter()
+        text, result = await pipeline.run(_image_bytes(), analyze)
+
+        assert result == "SHOP 2024-01-05\nMilk 2.00\nTOTAL 2.00"
+        assert text == result
+        assert started_at[0] - begun < 0.15
+        assert (pipeline.speculative_hits, pipeline.speculative_redos) == (1, 0)
+
+    @pytest.mark.asyncio
+    async def test_redoes_on_material_change(self):
+        """Test a later band changing the total cancels and redoes the analysis"""
+        pipeline = _pipeline([
+            (0.0, "SHOP\nSubtotal 2.00\nTOTAL 2.00"),
+            (0.1, "Tip 1.00\nTOTAL 3.00"),
+        ])
+        cancelled = []
+
+        async def analyze(text):
+            try:
+                await asyncio.sleep(0.5 if "3.00" not in text else 0)
+            except asyncio.CancelledError:
+                cancelled.append(text)
+                raise
+            return text
+
+        text, result = await pipeline.run(_image_bytes(), analyze)
+
+        assert result.endswith("TOTAL 3.00")
+        assert text == result
+        assert pipeline.speculative_redos == 1
+        await asyncio.sleep(0)
+        assert cancelled == ["SHOP\nSubtotal 2.00\nTOTAL 2.00"]
+
+    @pytest.mark.asyncio
+    async def test_skips_images_that_are_not_tall(self):
+        """Test square images fall back to the sequential path"""
+        pipeline = OCRPipeline(FakeBandOCR(), bands=4, min_aspect_ratio=2.0)
+
+        assert await pipeline.run(_image_bytes((400, 400)), AsyncMock()) is None
+        assert await pipeline.run(b"fake image data", AsyncMock()) is None
+
+    def test_material_change_rules(self):
+        """Test footer text is immaterial but new totals and dates are material"""
+        partial = "SHOP\nTOTAL 12.00"
+
+        assert not is_material_change(partial, partial + "\nThank you!\nCash 20.00")
+        assert is_material_change(partial, partial + "\nTOTAL DUE 14.00")
+        assert is_material_change(partial, partial + "\n05.01.2024 12:30")
+
+
+class TestAnalyzerServicePipeline:
+    """Test OCRPipeline use in AnalyzerService"""
+
+    @pytest.mark.asyncio
+    async def test_tall_upload_uses_pipeline(self, mock_llm_response):
+        """Test tall images are analyzed through the pipeline without the sequential OCR"""
+        pipeline = _pipeline([(0.0, "SHOP\nTOTAL 150.50"), (0.0, "Thanks")])
+        analyzer = AnalyzerService(pipeline=pipeline)
+        upload = MagicMock()
+        upload.filename = "tall.png"
+        upload.read = AsyncMock(return_value=_image_bytes())
+
+        with patch.object(analyzer.ocr, 'extract_text') as mock_ocr, \
+                patch.object(analyzer.llm, 'analyze_text', new_callable=AsyncMock) as mock_llm:
+            mock_llm.return_value = mock_llm_response
+
+            result = await analyzer.analyze(file=upload)
+
+            mock_ocr.assert_not_called()
+            mock_llm.assert_called_once()
+            assert result.total == 150.50
+
+    @pytest.mark.asyncio
+    async def test_discarded_speculation_has_no_side_effects(self, mock_llm_response):
+        """Test only the accepted analysis is cached or added to the enrichment backlog"""
+        pipeline = _pipeline([(0.0, "SHOP\nSubtotal 2.00\nTOTAL 2.00"), (0.1, "Tip 1.00\nTOTAL 3.00")])
+        cache, backlog = MagicMock(), MagicMock()
+        cache.lookup.return_value = None
+        analyzer = AnalyzerService(pipeline=pipeline, cache=cache, backlog=backlog)
+        upload = MagicMock()
+        upload.filename = "tall.png"
+        upload.read = AsyncMock(return_value=_image_bytes())
+
+        async def analyze_text(text):
+            if "3.00" not in text:
+                raise RuntimeError("LLM unavailable")
+            return mock_llm_response
+
+        with patch.object(analyzer.llm, 'analyze_text', side_effect=analyze_text):
+            result = await analyzer.analyze(file=upload)
+
+        assert pipeline.speculative_redos == 1
+        assert not result.needs_enrichment
+        backlog.add.assert_not_called()
+        cache.add.assert_called_once()
+        assert cache.add.call_args.args[0].endswith("TOTAL 3.00")
+
+    def test_close_stops_band_workers(self):
+        """Test closing the analyzer shuts down the pipeline's OCR threads"""
+        pipeline = _pipeline([(0.0, "SHOP")])
+        analyzer = AnalyzerService(pipeline=pipeline)
+
+        analyzer.close()
+
+        with pytest.raises(RuntimeError):
+            pipeline.executor.submit(time.sleep, 0)
@@ -0,0 +1,205 @@
+"""
+Tests for TokenBucketRateLimiter and its bucket stores
+"""
+import asyncio
+import multiprocessing
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from app.core.config import Settings
+from app.services.llm_analyzer import LLMAnalyzer
+from app.services.rate_limiter import (
+    MemoryBucketStore,
+    RateLimitExceeded,
+    SQLiteBucketStore,
+    TokenBucketRateLimiter,
+    create_rate_limiter,
+    estimate_tokens,
+)
+
+
+class FakeClock:
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _acquire_in_process(path: str, results) -> None:
+    limiter = TokenBucketRateLimiter(SQLiteBucketStore(path), rpm=10)
+    results.append(limiter.try_acquire())
+
+
+class TestTokenBucketRateLimiter:
+    """Test suite for TokenBucketRateLimiter"""
+
+    def test_debits_requests_and_tokens(self):
+        """Test both buckets are debited and the shortest refill wait is reported"""
+        clock = FakeClock()
+        limiter = TokenBucketRateLimiter(MemoryBucketStore(), rpm=60, tpm=600, clock=clock)
+
+        assert limiter.try_acquire(tokens=400) == 0
+        # 200 tokens left, 300 needed: 100 tokens at 10 tokens/s
+        assert limiter.try_acquire(tokens=300) == pytest.approx(10.0)
+
+        clock.now += 10
+        assert limiter.try_acquire(tokens=300) == 0
+
+    def test_failed_acquire_does_not_debit(self):
+        """Test a request that cannot run leaves both buckets untouched"""
+        clock = FakeClock()
+        limiter = TokenBucketRateLimiter(MemoryBucketStore(), rpm=2, tpm=100, clock=clock)
+
+        assert limiter.try_acquire(tokens=100) == 0
+        assert limiter.try_acquire(tokens=50) > 0
+        clock.now += 60
+        assert limiter.try_acquire(tokens=100) == 0
+        assert limiter.try_acquire(tokens=0) == 0
+
+    def test_oversized_request_is_capped_to_capacity(self):
+        """Test a request larger than the bucket can still eventually run"""
+        limiter = TokenBucketRateLimiter(MemoryBucketStore(), tpm=100, clock=FakeClock())
+
+        assert limiter.try_acquire(tokens=10_000) == 0
+
+    @pytest.mark.asyncio
+    async def test_acquire_waits_for_refill(self):
+        """Test acquire sleeps until budget refills instead of failing"""
+        limiter = TokenBucketRateLimiter(MemoryBucketStore(), rpm=600, max_wait=1.0)
+        limiter.try_acquire(requests=600)
+
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        await limiter.acquire()
+
+        # 1 request at 10 requests/s
+        assert loop.time() - started >= 0.09
+
+    @pytest.mark.asyncio
+    async def test_acquire_raises_past_deadline(self):
+        """Test acquire raises when budget cannot be available before the deadline"""
+        limiter = TokenBucketRateLimiter(MemoryBucketStore(), rpm=1, max_wait=0.1)
+        await limiter.acquire()
+
+        with pytest.raises(RateLimitExceeded):
+            await limiter.acquire()
+
+    @pytest.mark.asyncio
+    async def test_waiters_are_served_in_fifo_order(self):
+        """Test queued callers acquire budget in arrival order"""
+        limiter = TokenBucketRateLimiter(MemoryBucketStore(), rpm=1200, max_wait=2.0)
+        limiter.try_acquire(requests=1200)
+        order = []
+
+        async def call(i: int):
+            await limiter.acquire()
+            order.append(i)
+
+        await asyncio.gather(*(call(i) for i in range(5)))
+
+        assert order == [0, 1, 2, 3, 4]
+
+    def test_sqlite_store_shares_budget_across_processes(self, tmp_path):
+        """Test the SQLite backend enforces one limit for several processes"""
+        path = str(tmp_path / "limits.sqlite3")
+        with multiprocessing.Manager() as manager:
+            results = manager.list()
+            processes = [
+                multiprocessing.Process(target=_acquire_in_process, args=(path, results))
+                for _ in range(15)
+            ]
+            for process in processes:
+                process.start()
+            for process in processes:
+                process.join()
+            waits = list(results)
+
+        assert len(waits) == 15
+        assert sum(1 for wait in waits if wait == 0) == 10
+
+    def test_redis_store_shares_budget(self):
+        """Test the Redis backend debits a single shared bucket"""
+        fakeredis = pytest.importorskip("fakeredis")
+        from app.services.rate_limiter import RedisBucketStore
+
+        server = fakeredis.FakeServer()
+        stores = [
+            RedisBucketStore("redis://", key="test", client=fakeredis.FakeRedis(server=server))
+            for _ in range(2)
+        ]
+        clock = FakeClock()
+        limiters = [TokenBucketRateLimiter(store, rpm=3, clock=clock) for store in stores]
+
+        waits = [limiters[i % 2].try_acquire() for i in range(4)]
+
+        assert waits[:3] == [0, 0, 0]
+        assert waits[3] > 0
+
+
+class TestRateLimiterIntegration:
+    """Test rate limiter configuration and use in LLMAnalyzer"""
+
+    def test_disabled_without_limits(self):
+        """Test no limiter is created when RPM and TPM are unset"""
+        assert create_rate_limiter(Settings()) is None
+
+    def test_create_from_settings(self, tmp_path):
+        """Test limiter backend and limits are taken from settings"""
+        limiter = create_rate_limiter(
+            Settings(
+                llm_rate_limit_rpm=100,
+                llm_rate_limit_tpm=10_000,
+                llm_rate_limit_backend="sqlite",
+                llm_rate_limit_url=str(tmp_path / "limits.sqlite3"),
+            )
+        )
+
+        assert isinstance(limiter.store, SQLiteBucketStore)
+        assert [(b.name, b.capacity) for b in limiter.buckets] == [
+            ("requests", 100),
+            ("tokens", 10_000),
+        ]
+
+    @pytest.mark.asyncio
+    async def test_llm_analyzer_acquires_before_each_attempt(self, mock_llm_response):
+        """Test LLMAnalyzer debits estimated tokens before every attempt"""
+        import json
+
+        client = MagicMock()
+        bad = MagicMock()
+        bad.choices[0].message.content = "not json"
+        good = MagicMock()
+        good.choices[0].message.content = json.dumps(mock_llm_response)
+        client.chat.completions.create.side_effect = [bad, good]
+        limiter = MagicMock()
+        limiter.acquire = AsyncMock()
+
+        result = await LLMAnalyzer(client=client, rate_limiter=limiter).analyze_text("Receipt text")
+
+        assert result == mock_llm_response
+        assert limiter.acquire.await_count == 2
+        assert limiter.acquire.call_args.kwargs["tokens"] > estimate_tokens("Receipt text")
+
+    @pytest.mark.asyncio
+    async def test_llm_analyzer_does_not_retry_rate_limit_timeout(self):
+        """Test RateLimitExceeded propagates without calling the provider"""
+        client = MagicMock()
+        limiter = MagicMock()
+        limiter.acquire = AsyncMock(side_effect=RateLimitExceeded("busy"))
+
+        with pytest.raises(RateLimitExceeded):
+            await LLMAnalyzer(client=client, rate_limiter=limiter).analyze_text("Receipt text")
+
+        client.chat.completions.create.assert_not_called()
+
+    def test_client_leaves_retries_to_llm_analyzer(self, monkeypatch):
+        """Test the SDK client does not retry, so every attempt goes through the limiter"""
+        from app.core.openai_client import create_client
+
+        monkeypatch.setenv("OPENAI_API_KEY", "sk-test")
+        client = create_client()
+
+        assert client.max_retries == 0
+        client.close()
@@ -0,0 +1,165 @@
+"""
+Tests for FairScheduler
+"""
+import asyncio
+
+import pytest
+from unittest.mock import patch
+
+from app.core.config import Settings
+from app.services.scheduler import FairScheduler
+
+
+async def _run_all(scheduler, requests):
+    """Queue (tenant, priority) requests behind a blocker and return completion order"""
+    order = []
+    gate = asyncio.Event()
+
+    async def blocker():
+        await gate.wait()
+
+    async def work(tenant, priority, i):
+        order.append((tenant, i))
+
+    # Occupy the only slot so every request queues before dispatch starts
+    blocking = asyncio.create_task(scheduler.run("blocker", "interactive", blocker))
+    await asyncio.sleep(0)
+    tasks = [
+        asyncio.create_task(scheduler.run(tenant, priority, lambda t=tenant, p=priority, i=i: work(t, p, i)))
+        for i, (tenant, priority) in enumerate(requests)
+    ]
+    await asyncio.sleep(0)
+    gate.set()
+    await asyncio.gather(blocking, *tasks)
+    return order
+
+
+class TestFairScheduler:
+    """Test suite for FairScheduler"""
+
+    @pytest.mark.asyncio
+    async def test_interleaves_tenants_fairly(self):
+        """Test a bulk importer cannot starve another tenant in the same lane"""
+        scheduler = FairScheduler(max_concurrency=1)
+        requests = [("importer", "bulk")] * 4 + [("small", "bulk")] * 2
+
+        order = await _run_all(scheduler, requests)
+
+        tenants = [tenant for tenant, _ in order]
+        assert tenants[:4] == ["importer", "small", "importer", "small"]
+
+    @pytest.mark.asyncio
+    async def test_weights_share_capacity(self):
+        """Test a tenant with weight 2 is served twice as often"""
+        scheduler = FairScheduler(max_concurrency=1, weights={"gold": 2.0})
+        requests = [("gold", "bulk")] * 6 + [("basic", "bulk")] * 6
+
+        order = await _run_all(scheduler, requests)
+
+        first_six = [tenant for tenant, _ in order[:6]]
+        assert first_six.count("gold") == 4
+        assert first_six.count("basic") == 2
+
+    @pytest.mark.asyncio
+    async def test_interactive_has_strict_priority(self):
+        """Test queued interactive requests run before earlier bulk requests"""
+        scheduler = FairScheduler(max_concurrency=1)
+        requests = [("importer", "bulk")] * 3 + [("user", "interactive")] * 2
+
+        order = await _run_all(scheduler, requests)
+
+        assert [tenant for tenant, _ in order[:2]] == ["user", "user"]
+
+    @pytest.mark.asyncio
+    async def test_per_tenant_concurrency_cap(self):
+        """Test one tenant cannot hold more than its concurrency cap"""
+        scheduler = FairScheduler(max_concurrency=10, tenant_concurrency=2)
+        active = 0
+        peak = 0
+
+        async def work():
+            nonlocal active, peak
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.01)
+            active -= 1
+
+        await asyncio.gather(*(scheduler.run("importer", "bulk", work) for _ in range(6)))
+
+        assert peak == 2
+        assert scheduler.snapshot()["tenants"]["importer"]["completed"] == 6
+
+    @pytest.mark.asyncio
+    async def test_cancelled_waiter_leaves_queue(self):
+        """Test cancelling a queued request frees its place and keeps counts consistent"""
+        scheduler = FairScheduler(max_concurrency=1)
+        gate = asyncio.Event()
+
+        holder = asyncio.create_task(scheduler.run("a", "interactive", gate.wait))
+        queued = asyncio.create_task(scheduler.run("b", "interactive", gate.wait))
+        await asyncio.sleep(0)
+        assert scheduler.snapshot()["queued"]["interactive"] == 1
+
+        queued.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await queued
+        gate.set()
+        await holder
+
+        snapshot = scheduler.snapshot()
+        assert snapshot["running"] == 0
+        assert snapshot["queued"] == {"interactive": 0, "bulk": 0}
+
+    @pytest.mark.asyncio
+    async def test_snapshot_reports_queue_depth_and_waits(self):
+        """Test metrics expose per-tenant queue depth and wait times"""
+        scheduler = FairScheduler(max_concurrency=1)
+        gate = asyncio.Event()
+
+        tasks = [asyncio.create_task(scheduler.run("t1", "bulk", gate.wait)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        snapshot = scheduler.snapshot()
+        gate.set()
+        await asyncio.gather(*tasks)
+
+        assert snapshot["tenants"]["t1"]["queued"] == {"interactive": 0, "bulk": 2}
+        assert snapshot["tenants"]["t1"]["running"] == 1
+        wait_ms = scheduler.snapshot()["tenants"]["t1"]["wait_ms"]
+        assert wait_ms["max"] >= 10
+        assert set(wait_ms) == {"avg", "p50", "p95", "max"}
+
+    @pytest.mark.asyncio
+    async def test_idle_tenant_stats_expire(self):
+        """Test stats of tenants seen once are dropped after the TTL, active ones kept"""
+        now = [1000.0]
+        with patch("app.services.scheduler.time.monotonic", lambda: now[0]):
+            scheduler = FairScheduler(max_concurrency=2, stats_ttl=60)
+            gate = asyncio.Event()
+            busy = asyncio.create_task(scheduler.run("busy", "interactive", gate.wait))
+            for i in range(5):
+                await scheduler.run(f"spoofed-{i}", "interactive", lambda: asyncio.sleep(0))
+
+            now[0] += 61
+            await scheduler.run("fresh", "interactive", lambda: asyncio.sleep(0))
+            gate.set()
+            await busy
+
+        assert set(scheduler.snapshot()["tenants"]) == {"busy", "fresh"}
+
+    @pytest.mark.asyncio
+    async def test_tracked_tenants_capped(self):
+        """Test the oldest idle tenants are dropped once over the cap"""
+        scheduler = FairScheduler(max_tracked_tenants=3)
+        for i in range(10):
+            await scheduler.run(f"t{i}", "interactive", lambda: asyncio.sleep(0))
+
+        assert len(scheduler.stats) <= 4
+        assert "t9" in scheduler.stats and "t0" not in scheduler.stats
+
+    def test_non_positive_weight_rejected(self):
+        """Test a zero or negative weight fails at startup instead of on every request"""
+        with pytest.raises(ValueError):
+            FairScheduler(weights={"acme": 0.0})
+        with patch.dict("os.environ", {"SCHEDULER_TENANT_WEIGHTS": "acme=3,free=0"}):
+            with pytest.raises(ValueError):
+                Settings.from_env()
@@ -0,0 +1,331 @@
+"""
+Tests for the LLM usage ledger, its reports and LLMAnalyzer usage capture
+"""
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from app.cli import usage_report
+from app.core.config import Settings
+from app.core.dependencies import get_usage_ledger
+from app.main import app
+from app.services.llm_analyzer import LLMAnalyzer
+from app.services.usage_ledger import (
+    JSONLUsageStore,
+    SQLiteUsageStore,
+    UsageLedger,
+    UsageRecord,
+    cost_usd,
+    create_usage_ledger,
+    current_tenant,
+    split_usage,
+)
+
+
+def _record(tenant: str, ts: float, prompt: int = 1000, model: str = "gpt-4o-mini") -> UsageRecord:
+    return UsageRecord(
+        ts=ts, tenant=tenant, model=model, kind="single", receipts=1, prompt_tokens=prompt,
+        cached_tokens=0, completion_tokens=100, retries=0, cost_usd=cost_usd(model, prompt, 0, 100),
+    )
+
+
+# 2024-03-01 and 2024-03-02, 12:00 UTC
+DAY_1, DAY_2 = 1709294400.0, 1709380800.0
+
+
+def _response(content: str, prompt: int = 500, cached: int = 100, completion: int = 80) -> MagicMock:
+    response = MagicMock()
+    response.choices[0].message.content = content
+    response.usage.prompt_tokens = prompt
+    response.usage.prompt_tokens_details.cached_tokens = cached
+    response.usage.completion_tokens = completion
+    return response
+
+
+def _limiter() -> MagicMock:
+    limiter = MagicMock()
+    limiter.acquire = AsyncMock()
+    return limiter
+
+
+class SlowStore:
+    """Store stand-in whose writes block until released"""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.records = []
+
+    def append(self, records):
+        self.release.wait(5)
+        self.records.extend(records)
+
+    def close(self):
+        pass
+
+
+class TestUsageAccounting:
+    """Test cost and per-receipt split of LLM calls"""
+
+    def test_cost_prices_cached_tokens_lower(self):
+        """Test cached prompt tokens are billed at the cached rate"""
+        assert cost_usd("gpt-4o-mini", 1_000_000, 0, 0) == pytest.approx(0.15)
+        assert cost_usd("gpt-4o-mini", 1_000_000, 1_000_000, 1_000_000) == pytest.approx(0.675)
+        assert cost_usd("unknown-model", 1000, 0, 1000) == 0.0
+
+    def test_batch_call_split_by_receipt_length(self):
+        """Test a batched call's prompt tokens are shared by text length"""
+        records = split_usage(
+            ["acme", None], ["x" * 300, "y" * 100], model="gpt-4o-mini", kind="batch",
+            prompt_tokens=800, cached_tokens=0, completion_tokens=200, retries=1,
+        )
+
+        assert [r.tenant for r in records] == ["acme", "anonymous"]
+        assert [r.prompt_tokens for r in records] == [600, 200]
+        assert [r.completion_tokens for r in records] == [100, 100]
+        assert all(r.receipts == 2 and r.retries == 1 for r in records)
+
+
+class TestUsageStores:
+    """Test aggregation in both store formats"""
+
+    @pytest.mark.parametrize("filename", ["usage.db", "usage.jsonl"])
+    def test_aggregate_by_tenant_day_model(self, tmp_path, filename):
+        """Test sums per group and day filters"""
+        store = SQLiteUsageStore(str(tmp_path / filename)) if filename.endswith(".db") \
+            else JSONLUsageStore(str(tmp_path / filename))
+        store.append([_record("acme", DAY_1), _record("acme", DAY_1, prompt=3000), _record("beta", DAY_2)])
+
+        rows = store.aggregate(["tenant", "day", "model"])
+        assert [(r["tenant"], r["day"], r["requests"], r["prompt_tokens"]) for r in rows] == [
+            ("acme", "2024-03-01", 2, 4000),
+            ("beta", "2024-03-02", 1, 1000),
+        ]
+        assert rows[0]["avg_prompt_tokens"] == 2000.0
+        assert rows[0]["cost_usd"] == pytest.approx(2 * cost_usd("gpt-4o-mini", 2000, 0, 100))
+
+        assert [r["tenant"] for r in store.aggregate(["tenant"], since="2024-03-02")] == ["beta"]
+        assert store.aggregate([])[0]["requests"] == 3
+        with pytest.raises(ValueError):
+            store.aggregate(["merchant"])
+        store.close()
+
+    def test_jsonl_skips_torn_line(self, tmp_path):
+        """Test a partially written last line does not break reports"""
+        store = JSONLUsageStore(str(tmp_path / "usage.jsonl"))
+        store.append([_record("acme", DAY_1)])
+        with open(store.path, "a") as f:
+            f.write('{"ts": 1709')
+
+        assert store.aggregate(["tenant"])[0]["requests"] == 1
+
+
+class TestUsageLedger:
+    """Test the background writer"""
+
+    def test_records_written_in_background(self, tmp_path):
+        """Test recorded usage reaches the store after flush"""
+        ledger = UsageLedger(SQLiteUsageStore(str(tmp_path / "usage.db")), flush_interval=0.01)
+        ledger.record([_record("acme", DAY_1), _record("beta", DAY_1)])
+        ledger.flush()
+
+        assert [r["tenant"] for r in ledger.aggregate(["tenant"])] == ["acme", "beta"]
+        assert ledger.written == 2
+        ledger.close()
+
+    def test_record_never_blocks(self):
+        """Test a stuck store drops records instead of blocking the caller"""
+        store = SlowStore()
+        ledger = UsageLedger(store, batch_size=1, max_pending=2)
+
+        started = time.perf_counter()
+        ledger.record([_record("acme", DAY_1) for _ in range(10)])
+        assert time.perf_counter() - started < 0.1
+        assert ledger.dropped > 0
+
+        store.release.set()
+        ledger.close()
+        assert len(store.records) + ledger.dropped == 10
+
+    def test_close_writes_pending_records(self, tmp_path):
+        """Test shutdown writes records still waiting for their batch"""
+        path = str(tmp_path / "usage.jsonl")
+        ledger = UsageLedger(JSONLUsageStore(path), flush_interval=60)
+        ledger.record([_record("acme", DAY_1)])
+        ledger.close()
+
+        assert JSONLUsageStore(path).aggregate(["tenant"])[0]["requests"] == 1
+
+    def test_disabled_by_default(self, tmp_path):
+        """Test no ledger is created unless a path is configured"""
+        assert create_usage_ledger(Settings()) is None
+        ledger = create_usage_ledger(Settings(usage_ledger_path=str(tmp_path / "usage.jsonl")))
+        assert isinstance(ledger.store, JSONLUsageStore)
+        ledger.close()
+
+
+class TestUsageCapture:
+    """Test LLMAnalyzer records provider-reported usage"""
+
+    @pytest.mark.asyncio
+    async def test_usage_summed_over_retries(self, mock_llm_response):
+        """Test tokens of a retried call are summed and retries counted"""
+        client = MagicMock()
+        client.chat.completions.create.side_effect = [
+            _response("not json"),
+            _response(json.dumps(mock_llm_response)),
+        ]
+        ledger = MagicMock()
+        llm = LLMAnalyzer(client=client, rate_limiter=_limiter(), ledger=ledger)
+
+        token = current_tenant.set("acme")
+        try:
+            await llm.analyze_text("Test receipt text")
+        finally:
+            current_tenant.reset(token)
+
+        [record] = ledger.record.call_args.args[0]
+        assert (record.tenant, record.model, record.kind) == ("acme", "gpt-4o-mini", "single")
+        assert (record.prompt_tokens, record.cached_tokens, record.completion_tokens) == (1000, 200, 160)
+        assert record.retries == 1
+        assert record.cost_usd == cost_usd("gpt-4o-mini", 1000, 200, 160)
+
+    @pytest.mark.asyncio
+    async def test_usage_recorded_when_call_fails(self):
+        """Test tokens spent on a call that never produced valid JSON are still recorded"""
+        client = MagicMock()
+        client.chat.completions.create.return_value = _response("not json")
+        ledger = MagicMock()
+
+        with pytest.raises(ValueError):
+            await LLMAnalyzer(client=client, rate_limiter=_limiter(), ledger=ledger).analyze_text("Test")
+
+        [record] = ledger.record.call_args.args[0]
+        assert record.retries == LLMAnalyzer.MAX_RETRIES
+        assert record.tenant == "anonymous"
+
+    @pytest.mark.asyncio
+    async def test_failed_attempts_counted_as_retries(self, mock_llm_response):
+        """Test provider errors before a response count as retries"""
+        client = MagicMock()
+        client.chat.completions.create.side_effect = [
+            RuntimeError("429 Too Many Requests"),
+            RuntimeError("503 Service Unavailable"),
+            _response(json.dumps(mock_llm_response)),
+        ]
+        ledger = MagicMock()
+
+        await LLMAnalyzer(client=client, rate_limiter=_limiter(), ledger=ledger).analyze_text("Test")
+
+        [record] = ledger.record.call_args.args[0]
+        assert record.retries == 2
+        assert record.prompt_tokens == 500
+
+    @pytest.mark.asyncio
+    async def test_call_failing_every_attempt_recorded(self):
+        """Test a call that never got a response is still recorded with its retries"""
+        client = MagicMock()
+        client.chat.completions.create.side_effect = RuntimeError("503 Service Unavailable")
+        ledger = MagicMock()
+
+        with pytest.raises(RuntimeError):
+            await LLMAnalyzer(client=client, rate_limiter=_limiter(), ledger=ledger).analyze_text("Test")
+
+        [record] = ledger.record.call_args.args[0]
+        assert record.retries == LLMAnalyzer.MAX_RETRIES
+        assert (record.prompt_tokens, record.completion_tokens, record.cost_usd) == (0, 0, 0.0)
+
+    @pytest.mark.asyncio
+    async def test_abandoned_call_recorded_when_it_finishes(self, mock_llm_response):
+        """Test a request still running when its caller is cancelled is recorded once it completes"""
+        finished = threading.Event()
+
+        def create(**kwargs):
+            time.sleep(0.1)
+            finished.set()
+            return _response(json.dumps(mock_llm_response), prompt=700)
+
+        client = MagicMock()
+        client.chat.completions.create.side_effect = create
+        ledger = MagicMock()
+        llm = LLMAnalyzer(client=client, rate_limiter=_limiter(), ledger=ledger)
+
+        task = asyncio.ensure_future(llm.analyze_text("Test receipt text"))
+        await asyncio.sleep(0.02)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        ledger.record.assert_not_called()
+
+        assert finished.wait(1)
+        llm.executor.shutdown(wait=True)
+        [record] = ledger.record.call_args.args[0]
+        assert (record.prompt_tokens, record.retries) == (700, 0)
+
+    @pytest.mark.asyncio
+    async def test_batch_usage_per_tenant(self, mock_llm_response):
+        """Test a batched call is accounted to each receipt's tenant"""
+        client = MagicMock()
+        client.chat.completions.create.return_value = _response(
+            json.dumps({"receipts": [dict(mock_llm_response, index=0), dict(mock_llm_response, index=1)]}),
+            prompt=900, cached=0, completion=200,
+        )
+        ledger = MagicMock()
+        llm = LLMAnalyzer(client=client, rate_limiter=_limiter(), ledger=ledger)
+
+        await llm.analyze_batch(["Receipt A", "Receipt B"], tenants=["acme", "beta"])
+
+        records = ledger.record.call_args.args[0]
+        assert [(r.tenant, r.kind, r.receipts) for r in records] == [("acme", "batch", 2), ("beta", "batch", 2)]
+        assert sum(r.prompt_tokens for r in records) == 900
+
+
+class TestUsageReports:
+    """Test the /metrics/usage endpoint and the report CLI"""
+
+    @pytest.mark.asyncio
+    async def test_usage_endpoint(self, async_client, tmp_path):
+        """Test usage is aggregated over HTTP and bad groupings are rejected"""
+        ledger = UsageLedger(SQLiteUsageStore(str(tmp_path / "usage.db")))
+        ledger.record([_record("acme", DAY_1), _record("beta", DAY_2)])
+        ledger.flush()
+        app.dependency_overrides[get_usage_ledger] = lambda: ledger
+        try:
+            response = await async_client.get("/metrics/usage", params={"group_by": "tenant", "since": "2024-03-02"})
+            invalid = await async_client.get("/metrics/usage", params={"group_by": "merchant"})
+        finally:
+            app.dependency_overrides.pop(get_usage_ledger, None)
+            ledger.close()
+
+        assert response.status_code == 200
+        assert [(r["tenant"], r["requests"]) for r in response.json()] == [("beta", 1)]
+        assert invalid.status_code == 400
+
+    @pytest.mark.asyncio
+    async def test_usage_endpoint_disabled(self, async_client):
+        """Test the endpoint answers 404 when no ledger is configured"""
+        app.dependency_overrides[get_usage_ledger] = lambda: None
+        try:
+            response = await async_client.get("/metrics/usage")
+        finally:
+            app.dependency_overrides.pop(get_usage_ledger, None)
+
+        assert response.status_code == 404
+
+    def test_report_cli(self, tmp_path, capsys):
+        """Test the CLI prints a table and JSON rows"""
+        path = str(tmp_path / "usage.jsonl")
+        JSONLUsageStore(path).append([_record("acme", DAY_1), _record("acme", DAY_2)])
+
+        assert usage_report.main([path, "--group-by", "tenant"]) == 0
+        table = capsys.readouterr().out.splitlines()
+        assert table[0].split()[:3] == ["tenant", "requests", "prompt_tokens"]
+        assert table[2].split()[:3] == ["acme", "2", "2000"]
+
+        assert usage_report.main([path, "--group-by", "day", "--json"]) == 0
+        assert [r["day"] for r in json.loads(capsys.readouterr().out)] == ["2024-03-01", "2024-03-02"]
+
+        assert usage_report.main([path, "--group-by", "merchant"]) == 2